@@ -0,0 +1,89 @@
+"""
+Prueba de carga de /chat: throughput y latencias p50/p95/p99.
+
+Pensado para usarse con el servidor LLM falso (sin gastar cuota):
+    python -m uvicorn fake_llm_server:app --port 9000
+    LLM_BACKEND=openai LLM_BASE_URL=http://localhost:9000/v1 GROQ_RPM=100000 GROQ_TPM=100000000 \\
+        python -m uvicorn main:app --port 8000
+    python bench_chat.py --requests 200 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+QUERIES = [
+    "tienes sillas", "tienes sila", "tienes camas??", "dame unas sillas de comedor",
+    "algo para mi oficina", "muebles para el dormitorio", "sofá gris", "mesa de centro",
+    "lámpara de pie moderna", "tienes alguna solla??", "estantería de madera", "plantillas para sala",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))]
+
+
+async def run_benchmark(base_url: str, total: int, concurrency: int, endpoint: str = "/chat",
+                        timeout: float = 60.0, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    payloads = [
+        {"message": rng.choice(QUERIES), "session_id": f"bench-{uuid.uuid4().hex[:8]}"}
+        for _ in range(total)
+    ]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        async def one(payload: Dict):
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    response = await client.post(endpoint, json=payload)
+                    await response.aread()
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.monotonic() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(one(p) for p in payloads))
+        elapsed = time.monotonic() - started
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de /chat")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/chat", help="/chat o /chat/stream")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmark(args.url, args.requests, args.concurrency, args.endpoint, seed=args.seed))
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Medición del formato de historial: bytes por sesión y tiempos de escritura/lectura
+en SQLite, sin y con la política de historial (resumen + compresión).
+
+    python bench_history.py --sessions 200 --messages 60
+
+Cada configuración corre en un proceso aparte con sus variables de entorno.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+CONFIGS = {
+    "antes": {"HISTORY_MAX_MESSAGES": "0", "HISTORY_COMPRESSION": "none"},
+    "después": {"HISTORY_MAX_MESSAGES": "20", "HISTORY_COMPRESSION": "zlib"},
+}
+PRODUCT_TYPES = ["silla", "mesa", "sofá", "cama", "lámpara", "estantería", "escritorio"]
+STYLES = ["moderno", "nórdico", "industrial", "clásico", "minimalista"]
+
+
+def make_message(rng: random.Random, index: int) -> Dict:
+    """Mensaje con el tamaño y la forma de los que guarda el chat (respuesta del LLM incluida)"""
+    product_type = rng.choice(PRODUCT_TYPES)
+    ids = [str(rng.randint(1, 50_000)) for _ in range(3)]
+    lines = [
+        f"{n}. {product_type.capitalize()} {rng.choice(STYLES)} modelo {pid}: precio S/ {rng.randint(90, 2500)}, "
+        f"ideal para espacios {rng.choice(STYLES)}s, con acabados de calidad y entrega en 48 horas."
+        for n, pid in enumerate(ids, 1)
+    ]
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "user_message": rng.choice(["tienes ", "busco ", "quiero ver "]) + product_type + "s",
+        "query_type": "continuation" if index % 3 == 2 else "product",
+        "product_type": product_type,
+        "products_shown": ids,
+        "summary_id": f"{rng.getrandbits(64):016x}",
+        "response": "¡Claro! Estas son algunas opciones:\n" + "\n".join(lines)
+                    + "\n¿Quieres ver más opciones o filtrar por precio?",
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))]
+
+
+def measure(sessions: int, messages: int, seed: int) -> Dict:
+    """Corre en el proceso hijo: la configuración ya está en el entorno"""
+    from conversation_store import SqliteConversationStore
+
+    rng = random.Random(seed)
+    db_path = os.path.join(tempfile.mkdtemp(), "conversations.db")
+    store = SqliteConversationStore(db_path)
+    appends: List[float] = []
+    for s in range(sessions):
+        session = store.load(f"bench-{s}")
+        for m in range(messages):
+            message = make_message(rng, m)
+            started = time.perf_counter()
+            store.append_message(session, message)
+            appends.append(time.perf_counter() - started)
+
+    loads: List[float] = []
+    for s in range(sessions):
+        started = time.perf_counter()
+        store.load(f"bench-{s}")
+        loads.append(time.perf_counter() - started)
+
+    conn = store._connect()
+    payload = conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM messages").fetchone()[0]
+    payload += conn.execute("SELECT COALESCE(SUM(LENGTH(meta)), 0) FROM sessions").fetchone()[0]
+    payload += conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM session_fields").fetchone()[0]
+    payload += conn.execute("SELECT COALESCE(SUM(LENGTH(product_id)) + 16 * COUNT(*), 0) FROM shown_products").fetchone()[0]
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    return {
+        "bytes_per_session": round(payload / sessions),
+        "db_bytes_per_session": round(os.path.getsize(db_path) / sessions),
+        "append_p50_ms": round(percentile(appends, 0.50) * 1000, 3),
+        "append_p95_ms": round(percentile(appends, 0.95) * 1000, 3),
+        "load_p50_ms": round(percentile(loads, 0.50) * 1000, 3),
+        "load_p95_ms": round(percentile(loads, 0.95) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el formato de historial de conversaciones")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=60, help="Mensajes por sesión")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.sessions, args.messages, args.seed)))
+        return
+
+    print(f"{args.sessions} sesiones x {args.messages} mensajes")
+    for name, env in CONFIGS.items():
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", "--sessions", str(args.sessions),
+             "--messages", str(args.messages), "--seed", str(args.seed)],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{name} ({', '.join(f'{k}={v}' for k, v in env.items())})")
+        for key, value in result.items():
+            print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import asyncio
+import glob
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from deadline import use_deadline
+from rate_limiter import groq_rate_limiter
+
+logger = logging.getLogger('cache_warmup')
+
+# Precalentado de cachés con las consultas más frecuentes de los logs
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "30"))
+WARMUP_LOG_DAYS = int(os.getenv("WARMUP_LOG_DAYS", "7"))  # Archivos de log más recientes a minar
+WARMUP_LOG_PATTERN = os.getenv("WARMUP_LOG_PATTERN", "logs/product_search_*.log")
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "2"))
+# Solo se precalienta mientras el limitador de GROQ tenga al menos esta fracción libre
+WARMUP_MIN_HEADROOM = float(os.getenv("WARMUP_MIN_HEADROOM", "0.5"))
+WARMUP_MAX_PAUSE = 60.0  # Segundos máximos esperando margen antes de abandonar una consulta
+
+QUERY_LINE = re.compile(r"Normalizada: '([^']*)'(?: \| Continuaci\S*n: (True|False))?")
+
+
+def recent_log_files(pattern: str = WARMUP_LOG_PATTERN, days: int = WARMUP_LOG_DAYS) -> List[str]:
+    """Los `days` archivos de log más recientes (el nombre termina en AAAAMMDD)"""
+    return sorted(glob.glob(pattern), reverse=True)[:days]
+
+
+def read_log_lines(path: str) -> List[str]:
+    """Lee un log en UTF-8 o, si no lo es, en cp1252 (logs escritos en Windows)"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        text = raw.decode("cp1252", errors="replace")
+    return text.splitlines()
+
+
+def mine_top_queries(paths: Iterable[str], top_n: int = WARMUP_TOP_N,
+                     skip: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, int]]:
+    """Consultas normalizadas más frecuentes, sin continuaciones ni consultas vacías"""
+    counts: Counter = Counter()
+    for path in paths:
+        try:
+            lines = read_log_lines(path)
+        except OSError as e:
+            logger.warning(f"No se pudo leer el log {path}: {e}")
+            continue
+        for line in lines:
+            match = QUERY_LINE.search(line)
+            if not match:
+                continue
+            query, continuation = match.group(1).strip(), match.group(2)
+            if not query or continuation == "True" or (skip and skip(query)):
+                continue
+            counts[query] += 1
+    return counts.most_common(top_n)
+
+
+# Lista de consultas o función (bloqueante) que la produce; esta última se ejecuta en un hilo
+QuerySource = Union[List[str], Callable[[], List[str]]]
+
+
+class CacheWarmer:
+    """
+    Ejecuta en segundo plano `warm(query)` para las consultas más populares,
+    con concurrencia acotada y cediendo el paso al tráfico real.
+    """
+
+    def __init__(self, concurrency: int = WARMUP_CONCURRENCY, min_headroom: float = WARMUP_MIN_HEADROOM,
+                 headroom: Callable[[], float] = groq_rate_limiter.headroom):
+        self.concurrency = max(1, concurrency)
+        self.min_headroom = min_headroom
+        self._headroom = headroom
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Optional[Tuple[QuerySource, Callable[[str], Awaitable[None]], str]] = None
+        self._counters = {"runs": 0, "warmed": 0, "failed": 0, "skipped": 0, "superseded": 0}
+        self._last_run: Dict = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def schedule(self, queries: QuerySource, warm: Callable[[str], Awaitable[None]], reason: str) -> bool:
+        """
+        Lanza una ronda de precalentado. Si ya hay una en curso, la nueva queda pendiente
+        y se ejecuta al terminar aquella; de varias pendientes solo cuenta la más reciente.
+        """
+        if isinstance(queries, list) and not queries:
+            return False
+        if self.running:
+            if self._pending is not None:
+                self._counters["superseded"] += 1
+            self._pending = (queries, warm, reason)
+            return True
+        self._task = asyncio.create_task(self._run_rounds(queries, warm, reason))
+        return True
+
+    async def _run_rounds(self, queries: QuerySource, warm: Callable[[str], Awaitable[None]], reason: str):
+        next_round = (queries, warm, reason)
+        while next_round is not None:
+            await self.run(*next_round)
+            next_round, self._pending = self._pending, None
+
+    async def _wait_for_headroom(self) -> bool:
+        waited = 0.0
+        while self._headroom() < self.min_headroom:
+            if waited >= WARMUP_MAX_PAUSE:
+                return False
+            await asyncio.sleep(1.0)
+            waited += 1.0
+        return True
+
+    async def run(self, queries: QuerySource, warm: Callable[[str], Awaitable[None]], reason: str):
+        # La ronda no pertenece a ninguna petición: sin presupuesto de tiempo heredado
+        use_deadline(None)
+        if callable(queries):
+            # Leer y minar los logs bloquea: fuera del bucle de eventos
+            try:
+                queries = await asyncio.get_running_loop().run_in_executor(None, queries)
+            except Exception as e:
+                logger.warning(f"No se pudieron obtener las consultas a precalentar ({reason}): {e}")
+                return
+            if not queries:
+                return
+        self._counters["runs"] += 1
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {"warmed": 0, "failed": 0, "skipped": 0}
+
+        async def warm_one(query: str):
+            async with semaphore:
+                if not await self._wait_for_headroom():
+                    results["skipped"] += 1
+                    return
+                try:
+                    await warm(query)
+                    results["warmed"] += 1
+                except Exception as e:
+                    logger.warning(f"Error precalentando '{query}': {e}")
+                    results["failed"] += 1
+
+        await asyncio.gather(*(warm_one(q) for q in queries))
+        for key, value in results.items():
+            self._counters[key] += value
+        self._last_run = {
+            "reason": reason,
+            "queries": len(queries),
+            **results,
+            "duration_s": round(time.monotonic() - started, 2),
+        }
+        logger.info(f"Precalentado de cachés ({reason}): {self._last_run}")
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        return {**self._counters, "running": self.running, "pending": self._pending is not None,
+                "last_run": dict(self._last_run)}
+
+
+# Instancia compartida por el proceso
+cache_warmer = CacheWarmer()
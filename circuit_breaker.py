@@ -0,0 +1,147 @@
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Dict
+
+logger = logging.getLogger('circuit_breaker')
+
+# Configuración del circuit breaker del proveedor LLM
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # Últimas llamadas evaluadas
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "10"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = 1  # Llamadas de prueba simultáneas en semiabierto
+# Una prueba sin resultado tras este tiempo se da por perdida (más que el timeout de una llamada)
+BREAKER_PROBE_TIMEOUT = float(os.getenv("BREAKER_PROBE_TIMEOUT", "60"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de errores y de llamadas lentas en una ventana
+    deslizante. Abierto rechaza llamadas; tras BREAKER_OPEN_SECONDS deja pasar
+    una prueba (semiabierto) que decide si se cierra o vuelve a abrirse.
+    """
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 slow_rate: float = BREAKER_SLOW_RATE, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_probes: int = BREAKER_HALF_OPEN_PROBES, probe_timeout: float = BREAKER_PROBE_TIMEOUT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.probe_timeout = probe_timeout
+        self._clock = clock
+        self._outcomes = deque(maxlen=window)  # (fallo, lenta)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_started_at = 0.0
+        self._transitions: Dict[str, int] = {}
+        self._counters = {"allowed": 0, "rejected": 0, "successes": 0, "failures": 0, "slow_calls": 0,
+                          "released_probes": 0, "probe_timeouts": 0}
+
+    def _transition(self, new_state: str):
+        key = f"{self.state}->{new_state}"
+        self._transitions[key] = self._transitions.get(key, 0) + 1
+        logger.warning(f"Circuit breaker LLM: {key}")
+        self.state = new_state
+        if new_state == OPEN:
+            self._opened_at = self._clock()
+            self._probes_in_flight = 0
+        elif new_state == CLOSED:
+            self._outcomes.clear()
+            self._probes_in_flight = 0
+
+    def _expire_lost_probes(self):
+        """Libera las pruebas que nunca informaron su resultado, para no quedar semiabierto para siempre"""
+        if (self.state == HALF_OPEN and self._probes_in_flight
+                and self._clock() - self._probe_started_at >= self.probe_timeout):
+            logger.warning("Circuit breaker LLM: prueba sin resultado, se libera")
+            self._counters["probe_timeouts"] += 1
+            self._probes_in_flight = 0
+
+    def rejecting(self) -> bool:
+        """True si una llamada ahora sería rechazada (sin consumir una prueba)"""
+        if self.state == OPEN:
+            return self._clock() - self._opened_at < self.open_seconds
+        if self.state == HALF_OPEN:
+            self._expire_lost_probes()
+            return self._probes_in_flight >= self.half_open_probes
+        return False
+
+    def allow_request(self) -> bool:
+        """Decide si una llamada puede ir al proveedor"""
+        if self.state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        self._expire_lost_probes()
+        if self.state == OPEN or (self.state == HALF_OPEN and self._probes_in_flight >= self.half_open_probes):
+            self._counters["rejected"] += 1
+            return False
+        if self.state == HALF_OPEN:
+            self._probes_in_flight += 1
+            self._probe_started_at = self._clock()
+        self._counters["allowed"] += 1
+        return True
+
+    def release_probe(self):
+        """
+        Una llamada autorizada terminó sin resultado (cancelada por el presupuesto, por una
+        especulativa o porque el cliente se fue): no dice nada del proveedor, solo libera su prueba.
+        """
+        if self.state == HALF_OPEN and self._probes_in_flight:
+            self._probes_in_flight -= 1
+            self._counters["released_probes"] += 1
+
+    def record_success(self, latency: float):
+        slow = latency >= self.slow_call_seconds
+        self._counters["successes"] += 1
+        if slow:
+            self._counters["slow_calls"] += 1
+        self._record(failed=False, slow=slow)
+
+    def record_failure(self, latency: float = 0.0):
+        self._counters["failures"] += 1
+        self._record(failed=True, slow=latency >= self.slow_call_seconds)
+
+    def _record(self, failed: bool, slow: bool):
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._transition(OPEN if failed or slow else CLOSED)
+            return
+        if self.state == OPEN:
+            return  # Llamada iniciada antes de abrir: no cambia el estado
+
+        self._outcomes.append((failed, slow))
+        total = len(self._outcomes)
+        if total < self.min_calls:
+            return
+        failures = sum(1 for f, _ in self._outcomes if f)
+        slow_calls = sum(1 for _, s in self._outcomes if s)
+        if failures / total >= self.error_rate or slow_calls / total >= self.slow_rate:
+            self._transition(OPEN)
+
+    def stats(self) -> Dict:
+        """Estado y transiciones para el endpoint de métricas"""
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            **self._counters,
+            "transitions": dict(self._transitions),
+            "window_calls": total,
+            "window_error_rate": round(sum(1 for f, _ in self._outcomes if f) / total, 4) if total else 0.0,
+        }
+
+
+# Instancia compartida por el proceso
+llm_breaker = CircuitBreaker()
@@ -0,0 +1,868 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from history_policy import decode_payload, encode_payload, fold_history, history_offset
+from resp_client import RespClient
+
+logger = logging.getLogger('conversation_store')
+
+# Almacenamiento de conversaciones: "sqlite" (por defecto), "json" (un archivo por sesión)
+# o "redis" (compartido entre workers y hosts)
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "sqlite").lower()
+CONVERSATIONS_DIR = os.getenv("CONVERSATIONS_DIR", "logs/conversations")
+CONVERSATION_DB = os.getenv("CONVERSATION_DB", "logs/conversations.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "chat:")
+# En Redis las sesiones vencen solas tras SESSION_MAX_AGE segundos sin escrituras
+REDIS_SESSION_TTL = int(os.getenv("SESSION_MAX_AGE", str(2 * 60 * 60)))
+
+# Campos propios de la sesión; cada uno de los demás (`meta`) se guarda por separado
+SESSION_FIELDS = ("session_id", "created_at", "last_updated", "conversation")
+# IDs de productos ya mostrados en la sesión: {id: índice del mensaje que lo mostró}
+SHOWN_PRODUCTS_KEY = "shown_products"
+
+
+def new_session(session_id: str) -> Dict:
+    """Sesión vacía con la misma estructura que los archivos JSON históricos"""
+    now = datetime.now().isoformat()
+    return {
+        "session_id": session_id,
+        "created_at": now,
+        "last_updated": now,
+        "conversation": []
+    }
+
+
+def session_meta(session_data: Dict) -> Dict:
+    return {k: v for k, v in session_data.items() if k not in SESSION_FIELDS}
+
+
+def meta_fields(session_data: Dict) -> Dict[str, str]:
+    """
+    Campos de `meta` en JSON, uno por clave: así se reescriben solo los que cambian. Los
+    productos mostrados no están aquí; crecen con la sesión y se guardan uno por fila.
+    """
+    return {k: json.dumps(v, ensure_ascii=False) for k, v in session_meta(session_data).items()
+            if k != SHOWN_PRODUCTS_KEY}
+
+
+def shown_rows(session_data: Dict, start: int) -> List[Tuple[str, int, int]]:
+    """
+    (producto, número de orden del mensaje, posición en el mensaje) de los productos mostrados
+    desde el mensaje `start`. Recorre el conjunto desde el final: O(productos nuevos).
+    """
+    shown = shown_products(session_data)
+    rows = []
+    for pid in reversed(shown):
+        if shown[pid] < start:
+            break
+        rows.append((pid, shown[pid]))
+    rows.reverse()
+    positions: Dict[int, int] = {}
+    result = []
+    for pid, seq in rows:
+        positions[seq] = positions.get(seq, -1) + 1
+        result.append((pid, seq, positions[seq]))
+    return result
+
+
+def restore_shown(rows: Iterable[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Conjunto de productos mostrados a partir de sus filas (inverso de `shown_rows`)"""
+    shown: Dict[str, int] = {}
+    for pid, seq, _ in sorted(rows, key=lambda row: (row[1], row[2])):
+        shown.setdefault(pid, seq)
+    return shown
+
+
+def shown_products(session_data: Dict) -> Dict[str, int]:
+    """
+    IDs ya mostrados, en orden (con el número de orden del mensaje que los mostró).
+    Se mantiene al agregar cada mensaje y sobrevive al resumen del historial; las sesiones
+    guardadas antes de existir el campo lo reconstruyen una vez desde el historial.
+    """
+    shown = session_data.get(SHOWN_PRODUCTS_KEY)
+    if shown is None:
+        shown = {}
+        offset = history_offset(session_data)
+        for index, message in enumerate(session_data.get("conversation", [])):
+            for pid in message.get("products_shown", []):
+                shown.setdefault(str(pid), offset + index)
+        session_data[SHOWN_PRODUCTS_KEY] = shown
+    return shown
+
+
+def record_message(session_data: Dict, message: Dict) -> List[Dict]:
+    """
+    Agrega el mensaje y sus productos al conjunto de mostrados, en O(productos del mensaje),
+    y aplica la política de historial. Devuelve los mensajes antiguos que se resumieron.
+    """
+    shown = shown_products(session_data)
+    session_data["conversation"].append(message)
+    seq = history_offset(session_data) + len(session_data["conversation"]) - 1
+    for pid in message.get("products_shown", []):
+        shown.setdefault(str(pid), seq)
+    return fold_history(session_data)
+
+
+def parse_timestamp(iso_value: Optional[str], default: float) -> float:
+    """Fecha ISO de la sesión como timestamp (o `default` si falta o no es válida)"""
+    try:
+        return datetime.fromisoformat(iso_value).timestamp()
+    except (TypeError, ValueError):
+        return default
+
+
+class ConversationStore(ABC):
+    """
+    Interfaz de los almacenes de conversaciones. Los métodos son bloqueantes (la caché de
+    sesiones los llama desde su pool de hilos) y las escrituras devuelven si se completaron.
+    `shared` indica que otros workers u hosts escriben en el mismo almacén, así que la
+    caché no puede servir su copia de una sesión sin volver a leerla.
+    """
+
+    name = ""
+    shared = False
+
+    @abstractmethod
+    def load(self, session_id: str) -> Dict:
+        """Carga la conversación de una sesión (vacía si no existe)"""
+
+    @abstractmethod
+    def save(self, session_data: Dict, touch: bool = True) -> bool:
+        """Reescribe la sesión completa"""
+
+    def append_message(self, session_data: Dict, message: Dict):
+        """Agrega un mensaje y lo persiste"""
+        folded = record_message(session_data, message)
+        session_data["last_updated"] = datetime.now().isoformat()
+        end = history_offset(session_data) + len(session_data["conversation"])
+        self.write_changes(session_data, end - 1, removed=range(end - 1 - len(folded), end - 1))
+
+    @abstractmethod
+    def write_changes(self, session_data: Dict, start: int, updated: Iterable[int] = (),
+                      removed: Iterable[int] = (), fields: Optional[Iterable[str]] = None) -> bool:
+        """
+        Persiste la sesión, los mensajes desde el número de orden `start` (y los productos que
+        mostraron), los anteriores modificados (`updated`), borra los que pasaron al resumen del
+        historial (`removed`) y escribe los campos de `meta` indicados en `fields` (None: todos)
+        """
+
+    @abstractmethod
+    def set_response(self, session_id: str, summary_id: str, response: str) -> bool:
+        """Completa la respuesta del mensaje con ese summary_id"""
+
+    @abstractmethod
+    def cleanup(self, max_age: float, max_sessions: int, max_size_mb: float) -> int:
+        """Barrido completo: elimina sesiones por edad, cantidad o tamaño"""
+
+    @property
+    @abstractmethod
+    def cleanup_lock_path(self) -> str:
+        """Candado de archivo que elige al worker encargado de borrar (ver session_janitor.py)"""
+
+    @abstractmethod
+    def expiry_entries(self) -> List[Tuple[str, float]]:
+        """(session_id, última actualización) de las sesiones que hay que vencer"""
+
+    @abstractmethod
+    def delete_sessions(self, session_ids: Iterable[str], older_than: float) -> int:
+        """Elimina esas sesiones si siguen sin actualizarse desde `older_than`"""
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+
+
+class JsonConversationStore(ConversationStore):
+    """Un archivo JSON por sesión (almacenamiento original)"""
+
+    name = "json"
+
+    def __init__(self, directory: str = CONVERSATIONS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._counters = {"loads": 0, "writes": 0, "deleted": 0}
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def load(self, session_id: str) -> Dict:
+        """Carga la conversación de una sesión (vacía si no existe)"""
+        self._counters["loads"] += 1
+        try:
+            file_path = self._path(session_id)
+            if os.path.exists(file_path):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Error al cargar conversación {session_id}: {e}")
+        return new_session(session_id)
+
+    def save(self, session_data: Dict, touch: bool = True) -> bool:
+        """Reescribe el archivo completo de la sesión"""
+        try:
+            if touch:
+                session_data["last_updated"] = datetime.now().isoformat()
+            with open(self._path(session_data["session_id"]), 'w', encoding='utf-8') as f:
+                json.dump(session_data, f, ensure_ascii=False, indent=2)
+            self._counters["writes"] += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error al guardar conversación {session_data.get('session_id')}: {e}")
+            return False
+
+    def append_message(self, session_data: Dict, message: Dict):
+        """Agrega un mensaje (aquí implica reescribir todo el historial)"""
+        record_message(session_data, message)
+        self.save(session_data)
+
+    def write_changes(self, session_data: Dict, start: int, updated: Iterable[int] = (),
+                      removed: Iterable[int] = (), fields: Optional[Iterable[str]] = None) -> bool:
+        """Persiste los cambios de la sesión; con un archivo por sesión se reescribe entero"""
+        return self.save(session_data, touch=False)
+
+    def set_response(self, session_id: str, summary_id: str, response: str) -> bool:
+        """Completa la respuesta del mensaje con ese summary_id"""
+        session_data = self.load(session_id)
+        for message in reversed(session_data.get("conversation", [])):
+            if message.get("summary_id") == summary_id:
+                message["response"] = response
+                self.save(session_data)
+                return True
+        return False
+
+    @property
+    def cleanup_lock_path(self) -> str:
+        return os.path.join(self.directory, ".cleanup.lock")
+
+    def expiry_entries(self) -> List[Tuple[str, float]]:
+        """(session_id, última actualización) de todas las sesiones guardadas"""
+        entries = []
+        for file_path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                entries.append((os.path.splitext(os.path.basename(file_path))[0], os.path.getmtime(file_path)))
+            except OSError:
+                continue
+        return entries
+
+    def delete_sessions(self, session_ids: Iterable[str], older_than: float) -> int:
+        """Elimina esas sesiones si siguen sin actualizarse desde `older_than`"""
+        deleted = 0
+        for session_id in session_ids:
+            file_path = self._path(session_id)
+            try:
+                if os.path.getmtime(file_path) >= older_than:
+                    continue
+            except OSError:
+                continue
+            deleted += self._remove(file_path, "edad")
+        self._counters["deleted"] += deleted
+        return deleted
+
+    def _remove(self, file_path: str, reason: str) -> bool:
+        try:
+            os.remove(file_path)
+            logger.info(f"Conversación eliminada por {reason}: {os.path.basename(file_path)}")
+            return True
+        except Exception as e:
+            logger.error(f"Error eliminando archivo {file_path}: {e}")
+            return False
+
+    def cleanup(self, max_age: float, max_sessions: int, max_size_mb: float) -> int:
+        """Elimina sesiones por edad, por cantidad y por tamaño total de la carpeta"""
+        now = time.time()
+        files = []
+        for file_path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                files.append((file_path, os.path.getmtime(file_path), os.path.getsize(file_path)))
+            except OSError as e:
+                logger.error(f"Error procesando archivo {file_path}: {e}")
+
+        deleted = 0
+        alive = []
+        for file_path, mtime, size in files:
+            if now - mtime > max_age:
+                deleted += self._remove(file_path, "edad")
+            else:
+                alive.append((file_path, mtime, size))
+
+        # Más antiguos primero
+        alive.sort(key=lambda f: f[1])
+        if len(alive) > max_sessions:
+            excess, alive = alive[:len(alive) - max_sessions], alive[len(alive) - max_sessions:]
+            for file_path, _, _ in excess:
+                deleted += self._remove(file_path, "límite")
+
+        total_mb = sum(size for _, _, size in alive) / (1024 * 1024)
+        if total_mb > max_size_mb:
+            target_mb = max_size_mb * 0.7  # Reducir al 70%
+            for file_path, _, size in alive:
+                if total_mb <= target_mb:
+                    break
+                if self._remove(file_path, "tamaño"):
+                    total_mb -= size / (1024 * 1024)
+                    deleted += 1
+
+        self._counters["deleted"] += deleted
+        return deleted
+
+    def stats(self) -> Dict:
+        return {**self._counters, "backend": self.name, "directory": self.directory}
+
+
+class SqliteConversationStore(ConversationStore):
+    """
+    Conversaciones en SQLite (modo WAL): una fila por sesión, los mensajes y los productos
+    mostrados como filas de solo inserción y una fila por campo de `meta` que solo se
+    reescribe si cambió, así que guardar un mensaje no depende del tamaño de la sesión.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = CONVERSATION_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._counters = {"loads": 0, "appends": 0, "writes": 0, "deleted": 0}
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Abre la base en el primer uso (modo WAL para compartirla entre workers)"""
+        if self._conn is None:
+            try:
+                directory = os.path.dirname(self.db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA foreign_keys=ON")
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        session_id TEXT PRIMARY KEY,
+                        created_at TEXT NOT NULL,
+                        last_updated REAL NOT NULL,
+                        meta TEXT NOT NULL DEFAULT '{}'
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_sessions_last_updated ON sessions (last_updated);
+                    CREATE TABLE IF NOT EXISTS messages (
+                        session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+                        seq INTEGER NOT NULL,
+                        summary_id TEXT,
+                        data TEXT NOT NULL,
+                        PRIMARY KEY (session_id, seq)
+                    );
+                    CREATE TABLE IF NOT EXISTS session_fields (
+                        session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+                        name TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        PRIMARY KEY (session_id, name)
+                    );
+                    CREATE TABLE IF NOT EXISTS shown_products (
+                        session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+                        product_id TEXT NOT NULL,
+                        seq INTEGER NOT NULL,
+                        pos INTEGER NOT NULL,
+                        PRIMARY KEY (session_id, product_id)
+                    );
+                """)
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                logger.error(f"No se pudo abrir el almacén de conversaciones {self.db_path}: {e}")
+        return self._conn
+
+    @staticmethod
+    def _upsert_session(conn: sqlite3.Connection, session_data: Dict, updated_at: float):
+        # `meta` solo guarda datos de sesiones anteriores a las tablas por campo (ver `_migrate`)
+        conn.execute(
+            "INSERT INTO sessions (session_id, created_at, last_updated) VALUES (?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET last_updated = excluded.last_updated",
+            (session_data["session_id"], session_data.get("created_at") or datetime.now().isoformat(), updated_at)
+        )
+
+    @staticmethod
+    def _write_fields(conn: sqlite3.Connection, session_data: Dict, names: Optional[Iterable[str]]):
+        """Escribe los campos `names` de `meta` (None: todos) y borra los que ya no están"""
+        session_id = session_data["session_id"]
+        values = meta_fields(session_data)
+        if names is None:
+            conn.execute(
+                f"DELETE FROM session_fields WHERE session_id = ? AND name NOT IN ({','.join('?' * len(values))})",
+                (session_id, *values)
+            )
+            names = values
+        names = list(names)
+        # Un valor igual al guardado no reescribe la fila
+        conn.executemany(
+            "INSERT INTO session_fields (session_id, name, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (session_id, name) DO UPDATE SET value = excluded.value WHERE value IS NOT excluded.value",
+            [(session_id, name, values[name]) for name in names if name in values]
+        )
+        conn.executemany(
+            "DELETE FROM session_fields WHERE session_id = ? AND name = ?",
+            [(session_id, name) for name in names if name not in values]
+        )
+
+    @staticmethod
+    def _write_shown(conn: sqlite3.Connection, session_data: Dict, start: int):
+        conn.executemany(
+            "INSERT OR IGNORE INTO shown_products (session_id, product_id, seq, pos) VALUES (?, ?, ?, ?)",
+            [(session_data["session_id"], *row) for row in shown_rows(session_data, start)]
+        )
+
+    def _migrate(self, conn: sqlite3.Connection, session_data: Dict):
+        """Sesión guardada con todo en `meta`: pasa sus campos y productos mostrados a sus tablas"""
+        with conn:
+            self._write_fields(conn, session_data, None)
+            self._write_shown(conn, session_data, 0)
+            conn.execute("UPDATE sessions SET meta = '{}' WHERE session_id = ?", (session_data["session_id"],))
+
+    @staticmethod
+    def _message_row(session_id: str, seq: int, message: Dict):
+        return (session_id, seq, message.get("summary_id"), encode_payload(message))
+
+    def load(self, session_id: str) -> Dict:
+        """Carga la conversación de una sesión (vacía si no existe)"""
+        with self._lock:
+            self._counters["loads"] += 1
+            conn = self._connect()
+            if conn is None:
+                return new_session(session_id)
+            try:
+                row = conn.execute(
+                    "SELECT created_at, last_updated, meta FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                if row is None:
+                    return new_session(session_id)
+                created_at, last_updated, legacy = row
+                legacy = decode_payload(legacy)
+                meta = dict(legacy)
+                meta.update(
+                    (name, json.loads(value)) for name, value in conn.execute(
+                        "SELECT name, value FROM session_fields WHERE session_id = ?", (session_id,)
+                    )
+                )
+                messages = conn.execute(
+                    "SELECT data FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                    (session_id, history_offset(meta))
+                ).fetchall()
+                session_data = {
+                    **meta,
+                    "session_id": session_id,
+                    "created_at": created_at,
+                    "last_updated": datetime.fromtimestamp(last_updated).isoformat(),
+                    "conversation": [decode_payload(data) for (data,) in messages],
+                }
+                if legacy:
+                    shown_products(session_data)  # Las sesiones más antiguas no tenían el campo
+                    self._migrate(conn, session_data)
+                else:
+                    session_data[SHOWN_PRODUCTS_KEY] = restore_shown(conn.execute(
+                        "SELECT product_id, seq, pos FROM shown_products WHERE session_id = ?", (session_id,)
+                    ))
+                return session_data
+            except Exception as e:
+                logger.error(f"Error al cargar conversación {session_id}: {e}")
+                return new_session(session_id)
+
+    def save(self, session_data: Dict, touch: bool = True) -> bool:
+        """Reescribe la sesión completa (migraciones y reparaciones; el chat usa append_message)"""
+        session_id = session_data["session_id"]
+        if touch:
+            session_data["last_updated"] = datetime.now().isoformat()
+        updated_at = parse_timestamp(session_data.get("last_updated"), time.time())
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return False
+            try:
+                with conn:
+                    self._upsert_session(conn, session_data, updated_at)
+                    conn.execute("UPDATE sessions SET meta = '{}' WHERE session_id = ?", (session_id,))
+                    self._write_fields(conn, session_data, None)
+                    conn.execute("DELETE FROM shown_products WHERE session_id = ?", (session_id,))
+                    self._write_shown(conn, session_data, 0)
+                    conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    conn.executemany(
+                        "INSERT INTO messages (session_id, seq, summary_id, data) VALUES (?, ?, ?, ?)",
+                        [self._message_row(session_id, seq, m)
+                         for seq, m in enumerate(session_data.get("conversation", []), history_offset(session_data))]
+                    )
+                self._counters["writes"] += 1
+                return True
+            except Exception as e:
+                logger.error(f"Error al guardar conversación {session_id}: {e}")
+                return False
+
+    def write_changes(self, session_data: Dict, start: int, updated: Iterable[int] = (),
+                      removed: Iterable[int] = (), fields: Optional[Iterable[str]] = None) -> bool:
+        """
+        Persiste en una transacción la fila de la sesión, los mensajes desde `start` con sus
+        productos mostrados, los anteriores modificados (`updated`), los campos de `meta` en
+        `fields` (None: todos) y borra los mensajes que pasaron al resumen del historial
+        """
+        session_id = session_data["session_id"]
+        conversation = session_data["conversation"]
+        offset = history_offset(session_data)
+        end = offset + len(conversation)
+        updated_at = parse_timestamp(session_data.get("last_updated"), time.time())
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return False
+            try:
+                with conn:
+                    self._upsert_session(conn, session_data, updated_at)
+                    self._write_fields(conn, session_data, fields)
+                    self._write_shown(conn, session_data, start)
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO messages (session_id, seq, summary_id, data) VALUES (?, ?, ?, ?)",
+                        [self._message_row(session_id, seq, conversation[seq - offset])
+                         for seq in sorted(set(updated) | set(range(start, end))) if seq >= offset]
+                    )
+                    if offset:
+                        # Un rango sobre la clave primaria: cubre también pliegues de escrituras fallidas
+                        conn.execute("DELETE FROM messages WHERE session_id = ? AND seq < ?", (session_id, offset))
+                self._counters["appends"] += max(0, end - start)
+                self._counters["writes"] += 1
+                return True
+            except Exception as e:
+                logger.error(f"Error al guardar mensajes de la conversación {session_id}: {e}")
+                return False
+
+    def set_response(self, session_id: str, summary_id: str, response: str) -> bool:
+        """Completa la respuesta del mensaje con ese summary_id"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return False
+            try:
+                row = conn.execute(
+                    "SELECT seq, data FROM messages WHERE session_id = ? AND summary_id = ? "
+                    "ORDER BY seq DESC LIMIT 1",
+                    (session_id, summary_id)
+                ).fetchone()
+                if row is None:
+                    return False
+                message = decode_payload(row[1])
+                message["response"] = response
+                with conn:
+                    conn.execute(
+                        "UPDATE messages SET data = ? WHERE session_id = ? AND seq = ?",
+                        (encode_payload(message), session_id, row[0])
+                    )
+                self._counters["writes"] += 1
+                return True
+            except Exception as e:
+                logger.error(f"Error al completar el resumen {summary_id} de la sesión {session_id}: {e}")
+                return False
+
+    def cleanup(self, max_age: float, max_sessions: int, max_size_mb: Optional[float] = None) -> int:
+        """
+        Elimina sesiones por edad y por cantidad; los mensajes caen en cascada.
+        El tamaño lo acota la cantidad de sesiones, así que `max_size_mb` no aplica.
+        """
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            try:
+                with conn:
+                    # Un único DELETE sobre el índice de last_updated
+                    deleted = conn.execute(
+                        "DELETE FROM sessions WHERE last_updated < ?", (time.time() - max_age,)
+                    ).rowcount
+                    deleted += conn.execute(
+                        "DELETE FROM sessions WHERE session_id IN ("
+                        "SELECT session_id FROM sessions ORDER BY last_updated DESC LIMIT -1 OFFSET ?)",
+                        (max_sessions,)
+                    ).rowcount
+            except Exception as e:
+                logger.error(f"Error en limpieza de conversaciones: {e}")
+                return 0
+            self._counters["deleted"] += deleted
+            return deleted
+
+    @property
+    def cleanup_lock_path(self) -> str:
+        return self.db_path + ".cleanup.lock"
+
+    def expiry_entries(self) -> List[Tuple[str, float]]:
+        """(session_id, última actualización) de todas las sesiones guardadas"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            return conn.execute("SELECT session_id, last_updated FROM sessions").fetchall()
+
+    def delete_sessions(self, session_ids: Iterable[str], older_than: float) -> int:
+        """Elimina esas sesiones si siguen sin actualizarse desde `older_than` (mensajes en cascada)"""
+        session_ids = list(session_ids)
+        with self._lock:
+            conn = self._connect()
+            if conn is None or not session_ids:
+                return 0
+            try:
+                with conn:
+                    deleted = conn.executemany(
+                        "DELETE FROM sessions WHERE session_id = ? AND last_updated < ?",
+                        [(session_id, older_than) for session_id in session_ids]
+                    ).rowcount
+            except Exception as e:
+                logger.error(f"Error eliminando sesiones vencidas: {e}")
+                return 0
+            self._counters["deleted"] += deleted
+            return deleted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {}
+            conn = self._connect()
+            if conn is not None:
+                try:
+                    counts["sessions"] = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+                    counts["messages"] = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+                except Exception as e:
+                    logger.error(f"Error leyendo estadísticas de conversaciones: {e}")
+            return {**self._counters, **counts, "backend": self.name, "db_path": self.db_path}
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    Conversaciones en Redis (o un servidor compatible), compartidas entre workers y hosts.
+    Cada sesión son tres hashes: `<prefijo>session:{id}` con sus fechas y un campo `f:<clave>`
+    por cada campo de `meta`, `<prefijo>session:{id}:messages` con un mensaje por número de
+    orden y `<prefijo>session:{id}:shown` con los productos mostrados.
+    Cada lectura o escritura es un pipeline MULTI/EXEC (una ida y vuelta) y las claves
+    vencen por TTL, así que no hace falta barrido.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX, ttl: int = REDIS_SESSION_TTL,
+                 client: Optional[RespClient] = None):
+        self.client = client or RespClient(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self._counters = {"loads": 0, "appends": 0, "writes": 0, "errors": 0}
+
+    def _keys(self, session_id: str) -> Tuple[str, str, str]:
+        # La etiqueta {id} deja las claves de la sesión en el mismo slot de Redis Cluster
+        session_key = f"{self.prefix}session:{{{session_id}}}"
+        return session_key, session_key + ":messages", session_key + ":shown"
+
+    def _write_commands(self, session_data: Dict, seqs: Iterable[int], removed: Iterable[int] = (),
+                        fields: Optional[Iterable[str]] = None, shown_start: int = 0) -> List[Tuple]:
+        keys = self._keys(session_data["session_id"])
+        session_key, messages_key, shown_key = keys
+        conversation = session_data["conversation"]
+        offset = history_offset(session_data)
+        values = meta_fields(session_data)
+        names = list(values if fields is None else fields)
+        commands = [("HSET", session_key,
+                     "created_at", session_data.get("created_at") or datetime.now().isoformat(),
+                     "last_updated", parse_timestamp(session_data.get("last_updated"), time.time()),
+                     *[item for name in names if name in values for item in (f"f:{name}", values[name])])]
+        deleted = [f"f:{name}" for name in names if name not in values]
+        if deleted:
+            commands.append(("HDEL", session_key, *deleted))
+        # HSETNX: si otro worker ya lo registró, se conserva el primer mensaje que lo mostró
+        commands += [("HSETNX", shown_key, pid, f"{seq}:{pos}") for pid, seq, pos in shown_rows(session_data, shown_start)]
+        messages = []
+        for seq in seqs:
+            if seq >= offset:
+                messages += [seq, encode_payload(conversation[seq - offset])]
+        if messages:
+            commands.append(("HSET", messages_key, *messages))
+        removed = list(removed)
+        if removed:
+            commands.append(("HDEL", messages_key, *removed))
+        commands += [("EXPIRE", key, self.ttl) for key in keys]
+        return commands
+
+    @staticmethod
+    def _meta(fields: Dict[bytes, bytes]) -> Dict:
+        """Campos de `meta`; los de sesiones anteriores a los campos `f:` vienen en `meta`"""
+        meta = decode_payload(fields[b"meta"]) if b"meta" in fields else {}
+        for name, value in fields.items():
+            if name.startswith(b"f:"):
+                meta[name[2:].decode("utf-8")] = json.loads(value)
+        return meta
+
+    @staticmethod
+    def _pairs(reply: List) -> Dict[bytes, bytes]:
+        return dict(zip(reply[::2], reply[1::2]))
+
+    def _messages(self, reply: List, offset: int) -> List[Tuple[int, Dict]]:
+        """(número de orden, mensaje) en orden; ignora los que ya pasaron al resumen"""
+        rows = sorted((int(seq), data) for seq, data in self._pairs(reply).items())
+        return [(seq, decode_payload(data)) for seq, data in rows if seq >= offset]
+
+    def load(self, session_id: str) -> Dict:
+        """Carga la conversación de una sesión (vacía si no existe)"""
+        self._counters["loads"] += 1
+        try:
+            fields, messages, shown = self.client.transaction([("HGETALL", key) for key in self._keys(session_id)])
+            if not fields:
+                return new_session(session_id)
+            fields = self._pairs(fields)
+            meta = self._meta(fields)
+            session_data = {
+                **meta,
+                "session_id": session_id,
+                "created_at": fields[b"created_at"].decode("utf-8"),
+                "last_updated": datetime.fromtimestamp(float(fields[b"last_updated"])).isoformat(),
+                "conversation": [message for _, message in self._messages(messages, history_offset(meta))],
+            }
+            if b"meta" in fields:
+                # Sesión anterior a los campos separados: se convierte una vez
+                shown_products(session_data)
+                self.client.transaction([
+                    *self._write_commands(session_data, ()),
+                    ("HDEL", self._keys(session_id)[0], "meta"),
+                ])
+            else:
+                session_data[SHOWN_PRODUCTS_KEY] = restore_shown(
+                    (pid.decode("utf-8"), *map(int, position.split(b":")))
+                    for pid, position in self._pairs(shown).items()
+                )
+            return session_data
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Error al cargar conversación {session_id}: {e}")
+            return new_session(session_id)
+
+    def save(self, session_data: Dict, touch: bool = True) -> bool:
+        """Reescribe la sesión completa (migraciones y reparaciones; el chat usa append_message)"""
+        if touch:
+            session_data["last_updated"] = datetime.now().isoformat()
+        offset = history_offset(session_data)
+        try:
+            self.client.transaction([
+                ("DEL", *self._keys(session_data["session_id"])),
+                *self._write_commands(session_data, range(offset, offset + len(session_data.get("conversation", [])))),
+            ])
+            self._counters["writes"] += 1
+            return True
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Error al guardar conversación {session_data.get('session_id')}: {e}")
+            return False
+
+    def write_changes(self, session_data: Dict, start: int, updated: Iterable[int] = (),
+                      removed: Iterable[int] = (), fields: Optional[Iterable[str]] = None) -> bool:
+        """
+        Escribe la sesión, los campos de `meta` en `fields` (None: todos), los mensajes desde
+        `start` con sus productos mostrados y los modificados, borra los resumidos y renueva el TTL
+        """
+        end = history_offset(session_data) + len(session_data["conversation"])
+        try:
+            self.client.transaction(self._write_commands(
+                session_data, sorted(set(updated) | set(range(start, end))), removed, fields, start
+            ))
+            self._counters["appends"] += max(0, end - start)
+            self._counters["writes"] += 1
+            return True
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Error al guardar mensajes de la conversación {session_data['session_id']}: {e}")
+            return False
+
+    def set_response(self, session_id: str, summary_id: str, response: str) -> bool:
+        """Completa la respuesta del mensaje con ese summary_id (el historial guardado está acotado)"""
+        keys = self._keys(session_id)
+        session_key, messages_key, _ = keys
+        try:
+            fields, messages = self.client.transaction([("HGETALL", session_key), ("HGETALL", messages_key)])
+            if not fields:
+                return False
+            for seq, message in reversed(self._messages(messages, history_offset(self._meta(self._pairs(fields))))):
+                if message.get("summary_id") == summary_id:
+                    message["response"] = response
+                    self.client.transaction([
+                        ("HSET", messages_key, seq, encode_payload(message)),
+                        *[("EXPIRE", key, self.ttl) for key in keys],
+                    ])
+                    self._counters["writes"] += 1
+                    return True
+            return False
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Error al completar el resumen {summary_id} de la sesión {session_id}: {e}")
+            return False
+
+    def cleanup(self, max_age: float, max_sessions: int, max_size_mb: Optional[float] = None) -> int:
+        """
+        Redis vence las sesiones por TTL: no hay nada que barrer. La cantidad y el tamaño
+        los acota la `maxmemory-policy` del servidor (por ejemplo volatile-lru).
+        """
+        return 0
+
+    @property
+    def cleanup_lock_path(self) -> str:
+        # Solo coordina a los workers de este host; con TTL el líder no tiene nada que borrar
+        return os.path.join(os.path.dirname(CONVERSATION_DB) or ".", "redis_sessions.cleanup.lock")
+
+    def expiry_entries(self) -> List[Tuple[str, float]]:
+        return []
+
+    def delete_sessions(self, session_ids: Iterable[str], older_than: float) -> int:
+        return 0
+
+    def stats(self) -> Dict:
+        return {**self._counters, "backend": self.name, "redis": self.client.address, "ttl": self.ttl}
+
+
+def create_conversation_store(kind: str = CONVERSATION_BACKEND):
+    """Crea el almacenamiento configurado"""
+    if kind == "sqlite":
+        return SqliteConversationStore(CONVERSATION_DB)
+    if kind == "json":
+        return JsonConversationStore(CONVERSATIONS_DIR)
+    if kind == "redis":
+        return RedisConversationStore(REDIS_URL)
+    raise ValueError(f"CONVERSATION_BACKEND desconocido: {kind}")
+
+
+# Instancia compartida por el proceso
+conversation_store = create_conversation_store()
+
+
+def migrate_json_conversations(directory: str, store) -> Dict:
+    """Importa los archivos JSON de sesión al almacén indicado, conservando sus fechas"""
+    result = {"migrated": 0, "failed": 0}
+    for file_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                session_data = json.load(f)
+            session_data.setdefault("session_id", os.path.splitext(os.path.basename(file_path))[0])
+            session_data.setdefault("conversation", [])
+            if not session_data.get("last_updated"):
+                session_data["last_updated"] = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
+            store.save(session_data, touch=False)
+            result["migrated"] += 1
+        except Exception as e:
+            logger.error(f"No se pudo migrar {file_path}: {e}")
+            result["failed"] += 1
+    return result
+
+
+if __name__ == "__main__":
+    # Uso: python conversation_store.py --dir logs/conversations --db logs/conversations.db
+    parser = argparse.ArgumentParser(description="Migra las conversaciones JSON a SQLite")
+    parser.add_argument("--dir", default=CONVERSATIONS_DIR)
+    parser.add_argument("--db", default=CONVERSATION_DB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(migrate_json_conversations(args.dir, SqliteConversationStore(args.db)))
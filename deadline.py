@@ -0,0 +1,72 @@
+import contextvars
+import logging
+import os
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger('deadline')
+
+# Presupuesto total de una petición a /chat (búsqueda + LLM)
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "20"))
+MIN_LLM_TIMEOUT = 1.0  # Por debajo de esto no vale la pena llamar al LLM
+
+
+class Deadline:
+    """Presupuesto de tiempo de una petición compartido por todas sus etapas"""
+
+    def __init__(self, budget_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.budget = budget_seconds
+        self._clock = clock
+        self._expires_at = clock() + budget_seconds
+        self.exhausted_stages: List[str] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    @property
+    def exhausted(self) -> bool:
+        """True si alguna etapa se omitió o recortó por falta de tiempo"""
+        return bool(self.exhausted_stages)
+
+    def timeout(self, default: float) -> float:
+        """Timeout de una etapa recortado al tiempo restante"""
+        return min(default, self.remaining())
+
+    def mark_exhausted(self, stage: str):
+        if stage not in self.exhausted_stages:
+            self.exhausted_stages.append(stage)
+            logger.warning(f"Presupuesto de tiempo agotado en la etapa: {stage}")
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+def start_deadline(budget_seconds: Optional[float] = None) -> Deadline:
+    """Crea el presupuesto de la petición actual y lo deja visible para todas las etapas"""
+    deadline = Deadline(budget_seconds if budget_seconds is not None else CHAT_DEADLINE_SECONDS)
+    _current_deadline.set(deadline)
+    return deadline
+
+
+def use_deadline(deadline: Optional[Deadline]):
+    """Asocia un presupuesto existente (o ninguno) al contexto actual"""
+    _current_deadline.set(deadline)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def request_budget(data: dict) -> float:
+    """Presupuesto pedido por el cliente (deadline_ms), nunca mayor que el del servidor"""
+    try:
+        requested = float(data.get("deadline_ms")) / 1000.0
+    except (TypeError, ValueError):
+        return CHAT_DEADLINE_SECONDS
+    return max(0.0, min(requested, CHAT_DEADLINE_SECONDS))
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger('enrichment_store')
+
+# Datos derivados del catálogo generados fuera de línea (textos, etiquetas, ...)
+ENRICHMENT_DB = os.getenv("ENRICHMENT_DB", "logs/enrichments.db")
+ENRICHMENT_CONCURRENCY = int(os.getenv("ENRICHMENT_CONCURRENCY", "4"))  # Llamadas simultáneas del job
+ENRICHMENT_MAX_ATTEMPTS = 2
+
+
+def input_hash(inputs: Dict) -> str:
+    """Huella de los campos de entrada: si cambia, el dato derivado está obsoleto"""
+    payload = json.dumps(inputs, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class EnrichmentStore:
+    """
+    Almacén SQLite de enriquecimientos por (tipo, producto), válidos mientras
+    el hash de sus entradas coincida con el del producto actual.
+    """
+
+    def __init__(self, db_path: str = ENRICHMENT_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "writes": 0}
+        self._snapshots = weakref.WeakSet()  # Copias en memoria que leen de este almacén
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Abre la base en el primer uso (modo WAL para compartirla entre workers)"""
+        if self._conn is None:
+            try:
+                directory = os.path.dirname(self.db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS enrichments (
+                        kind TEXT NOT NULL,
+                        product_id TEXT NOT NULL,
+                        input_hash TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (kind, product_id)
+                    )
+                """)
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                logger.error(f"No se pudo abrir el almacén de enriquecimientos {self.db_path}: {e}")
+        return self._conn
+
+    def get(self, kind: str, product_id, expected_hash: Optional[str] = None) -> Optional[str]:
+        """Valor guardado; None si no existe o si sus entradas cambiaron"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT value, input_hash FROM enrichments WHERE kind = ? AND product_id = ?",
+                    (kind, str(product_id))
+                ).fetchone()
+            except Exception as e:
+                logger.error(f"Error leyendo enriquecimiento {kind}/{product_id}: {e}")
+                row = None
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            if expected_hash is not None and row[1] != expected_hash:
+                self._counters["stale"] += 1
+                return None
+            self._counters["hits"] += 1
+            return row[0]
+
+    def hashes(self, kind: str) -> Dict[str, str]:
+        """Hash de entradas guardado por producto, para saber qué regenerar"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            rows = conn.execute(
+                "SELECT product_id, input_hash FROM enrichments WHERE kind = ?", (kind,)
+            ).fetchall()
+            return {product_id: h for product_id, h in rows}
+
+    def entries(self, kind: str) -> Dict[str, Tuple[str, str]]:
+        """Todos los valores de un tipo: {product_id: (hash de entradas, valor)}"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            rows = conn.execute(
+                "SELECT product_id, input_hash, value FROM enrichments WHERE kind = ?", (kind,)
+            ).fetchall()
+            return {product_id: (h, value) for product_id, h, value in rows}
+
+    def put(self, kind: str, product_id, hash_value: str, value: str):
+        """Guarda (o reemplaza) el valor de un producto"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO enrichments (kind, product_id, input_hash, value, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (kind, str(product_id), hash_value, value, time.time())
+            )
+            conn.commit()
+            self._counters["writes"] += 1
+
+    def delete_missing(self, kind: str, product_ids: Iterable) -> int:
+        """Elimina valores de productos que ya no están en el catálogo"""
+        keep = {str(pid) for pid in product_ids}
+        stale = [pid for pid in self.hashes(kind) if pid not in keep]
+        with self._lock:
+            conn = self._connect()
+            if conn is None or not stale:
+                return 0
+            conn.executemany(
+                "DELETE FROM enrichments WHERE kind = ? AND product_id = ?",
+                [(kind, pid) for pid in stale]
+            )
+            conn.commit()
+        return len(stale)
+
+    def watch(self, snapshot: "EnrichmentSnapshot"):
+        """Registra una copia en memoria para invalidarla cuando cambien sus valores"""
+        self._snapshots.add(snapshot)
+
+    def notify(self, kind: str):
+        """Los valores de `kind` cambiaron: sus copias en memoria se recargan en la próxima consulta"""
+        for snapshot in list(self._snapshots):
+            if snapshot.kind == kind:
+                snapshot.invalidate()
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        with self._lock:
+            return {**self._counters, "db_path": self.db_path}
+
+
+# Instancia compartida por el proceso
+enrichment_store = EnrichmentStore()
+
+
+class EnrichmentSnapshot:
+    """
+    Copia en memoria de los valores de un tipo de enriquecimiento: {product_id: (hash, valor)}.
+    Las consultas solo leen memoria; cuando la copia vence (`refresh_seconds`) se recarga en
+    un hilo y, mientras tanto, se sigue respondiendo con la anterior.
+    """
+
+    kind = ""
+
+    def __init__(self, store: EnrichmentStore, refresh_seconds: float):
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[str, Tuple[str, object]] = {}
+        self._loaded_at: Optional[float] = None
+        self._generation = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._counters = {"loads": 0}
+        store.watch(self)
+
+    def parse(self, value: str):
+        """Valor guardado -> valor en memoria (ValueError descarta la fila)"""
+        return value
+
+    def invalidate(self):
+        self._generation += 1
+        self._loaded_at = None
+
+    def load(self):
+        """Lee la copia del almacén (bloqueante: en un hilo, o en jobs y scripts sin event loop)"""
+        generation = self._generation
+        entries = {}
+        for product_id, (h, value) in self.store.entries(self.kind).items():
+            try:
+                entries[product_id] = (h, self.parse(value))
+            except ValueError:
+                continue
+        self._entries = entries
+        self._counters["loads"] += 1
+        # Si se invalidó durante la lectura, la copia puede no tener lo último
+        self._loaded_at = time.monotonic() if generation == self._generation else None
+
+    async def refresh(self):
+        """Recarga la copia fuera del event loop"""
+        await asyncio.get_running_loop().run_in_executor(None, self.load)
+
+    def _entries_now(self) -> Dict[str, Tuple[str, object]]:
+        """La copia actual; si venció, programa su recarga sin esperarla"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.load()  # Sin event loop (scripts y pruebas) no hay nada que bloquear
+                return self._entries
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = loop.create_task(self.refresh())
+        return self._entries
+
+
+async def run_enrichment(kind: str, products: List[Dict], inputs_for: Callable[[Dict], Dict],
+                         generate: Callable[[Dict], Awaitable[Optional[str]]],
+                         store: EnrichmentStore = enrichment_store,
+                         concurrency: int = ENRICHMENT_CONCURRENCY) -> Dict:
+    """
+    Genera el enriquecimiento `kind` para los productos cuyas entradas cambiaron.
+    Cada resultado se guarda al terminar, así que relanzar el job tras un fallo
+    continúa donde quedó. `generate` retorna None (o lanza) si no pudo generar.
+    """
+    loop = asyncio.get_running_loop()
+    # SQLite es bloqueante: las lecturas y escrituras del job van a un hilo
+    stored = await loop.run_in_executor(None, store.hashes, kind)
+    pending = []
+    for product in products:
+        h = input_hash(inputs_for(product))
+        if stored.get(str(product.get('id'))) != h:
+            pending.append((product, h))
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def enrich(product: Dict, h: str) -> bool:
+        async with semaphore:
+            for attempt in range(ENRICHMENT_MAX_ATTEMPTS):
+                try:
+                    value = await generate(product)
+                except Exception as e:
+                    logger.warning(f"Error generando {kind} para {product.get('id')} (intento {attempt + 1}): {e}")
+                    continue
+                if value:
+                    await loop.run_in_executor(None, store.put, kind, product.get('id'), h, value)
+                    return True
+            return False
+
+    results = await asyncio.gather(*(enrich(product, h) for product, h in pending))
+    removed = await loop.run_in_executor(None, store.delete_missing, kind, [p.get('id') for p in products])
+    store.notify(kind)
+    summary = {
+        "total": len(products),
+        "up_to_date": len(products) - len(pending),
+        "generated": sum(1 for ok in results if ok),
+        "failed": sum(1 for ok in results if not ok),
+        "removed": removed,
+    }
+    logger.info(f"Enriquecimiento '{kind}' completado: {summary}")
+    return summary
@@ -0,0 +1,137 @@
+import json
+import math
+import os
+import random
+import re
+import time
+from typing import Dict, List, Optional
+
+# Comportamiento del proveedor LLM falso (ver fake_llm_server.py)
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "lognormal:0.4,0.5")  # Segundos hasta la respuesta
+FAKE_LLM_TOKEN_DELAY = float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.02"))  # Entre fragmentos del stream
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))  # Fracción de respuestas 500
+FAKE_LLM_429_RATE = float(os.getenv("FAKE_LLM_429_RATE", "0"))  # Fracción de respuestas 429
+FAKE_LLM_RETRY_AFTER = float(os.getenv("FAKE_LLM_RETRY_AFTER", "1"))
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT", "")  # JSON: [{"match": "texto", "response": "..."}]
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED", "")
+DEFAULT_RESPONSE = "[]"
+
+
+class LatencyDistribution:
+    """
+    Distribución de latencias a partir de una especificación:
+    "fixed:0.2", "uniform:0.1,0.5", "exp:0.3" (media) o "lognormal:mediana,sigma".
+    """
+
+    def __init__(self, spec: str, rng: random.Random):
+        self.spec = spec
+        self._rng = rng
+        kind, _, args = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.args = [float(a) for a in args.split(",") if a.strip()]
+        expected = {"fixed": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+        if self.kind not in expected or len(self.args) != expected[self.kind]:
+            raise ValueError(f"Distribución de latencia no válida: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return self._rng.uniform(*self.args)
+        if self.kind == "exp":
+            return self._rng.expovariate(1.0 / self.args[0]) if self.args[0] > 0 else 0.0
+        median, sigma = self.args
+        return self._rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+def load_script(path: str) -> List[Dict]:
+    """Respuestas guionizadas: la primera regla cuyo `match` aparece en el prompt gana"""
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeLLM:
+    """Lógica del proveedor falso: latencia, fallos inyectados y respuestas guionizadas"""
+
+    def __init__(self, latency: str = FAKE_LLM_LATENCY, error_rate: float = FAKE_LLM_ERROR_RATE,
+                 rate_limit_rate: float = FAKE_LLM_429_RATE, retry_after: float = FAKE_LLM_RETRY_AFTER,
+                 token_delay: float = FAKE_LLM_TOKEN_DELAY, script: Optional[List[Dict]] = None,
+                 seed: Optional[int] = None):
+        self._rng = random.Random(seed)
+        self.configure(latency=latency, error_rate=error_rate, rate_limit_rate=rate_limit_rate,
+                       retry_after=retry_after, token_delay=token_delay, script=script or [])
+        self._counters = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "scripted": 0}
+
+    def configure(self, **settings):
+        """Cambia el comportamiento en caliente (también vía POST /admin/config)"""
+        if "latency" in settings:
+            self.latency = LatencyDistribution(settings["latency"], self._rng)
+        for key in ("error_rate", "rate_limit_rate", "retry_after", "token_delay", "script"):
+            if key in settings:
+                setattr(self, key, settings[key])
+
+    def decide(self) -> Dict:
+        """Resultado de una petición: {"status": 200|429|500, "delay": segundos, ...}"""
+        self._counters["requests"] += 1
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            self._counters["rate_limited"] += 1
+            return {"status": 429, "delay": 0.0, "retry_after": self.retry_after}
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._counters["errors"] += 1
+            return {"status": 500, "delay": self.latency.sample()}
+        self._counters["ok"] += 1
+        return {"status": 200, "delay": self.latency.sample()}
+
+    def respond(self, prompt: str) -> str:
+        for rule in self.script:
+            if rule.get("match", "") in prompt:
+                self._counters["scripted"] += 1
+                return rule.get("response", DEFAULT_RESPONSE)
+        return DEFAULT_RESPONSE
+
+    @staticmethod
+    def chunks(text: str) -> List[str]:
+        """Fragmentos del stream (palabra a palabra, conservando los espacios)"""
+        return re.findall(r'\S+\s*|\s+', text) or [text]
+
+    def completion(self, content: str, model: str, prompt: str) -> Dict:
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        return {
+            "id": f"fake-{self._counters['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @staticmethod
+    def stream_chunk(delta: str, model: str) -> str:
+        chunk = {
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    def stats(self) -> Dict:
+        return {
+            **self._counters,
+            "latency": self.latency.spec,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+            "script_rules": len(self.script),
+        }
+
+
+def create_fake_llm() -> FakeLLM:
+    """FakeLLM configurado con las variables de entorno FAKE_LLM_*"""
+    return FakeLLM(script=load_script(FAKE_LLM_SCRIPT), seed=int(FAKE_LLM_SEED) if FAKE_LLM_SEED else None)
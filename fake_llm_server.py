@@ -0,0 +1,69 @@
+"""
+Servidor LLM falso compatible con la API de OpenAI/GROQ para pruebas de carga sin gastar cuota.
+
+Uso:
+    FAKE_LLM_LATENCY=lognormal:0.4,0.5 FAKE_LLM_429_RATE=0.05 python -m uvicorn fake_llm_server:app --port 9000
+    LLM_BACKEND=openai LLM_BASE_URL=http://localhost:9000/v1 python -m uvicorn main:app
+"""
+
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from fake_llm import create_fake_llm, load_script
+
+app = FastAPI(title="Fake LLM")
+fake_llm = create_fake_llm()
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Chat completions con latencia, fallos y respuestas según la configuración"""
+    body = await request.json()
+    model = body.get("model", "fake")
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+    outcome = fake_llm.decide()
+
+    if outcome["status"] == 429:
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_exceeded"}},
+            headers={"retry-after": str(outcome["retry_after"])}
+        )
+
+    await asyncio.sleep(outcome["delay"])
+    if outcome["status"] == 500:
+        return JSONResponse(status_code=500, content={"error": {"message": "Internal error (fake)"}})
+
+    content = fake_llm.respond(prompt)
+    if not body.get("stream"):
+        return fake_llm.completion(content, model, prompt)
+
+    async def event_stream():
+        for delta in fake_llm.chunks(content):
+            yield fake_llm.stream_chunk(delta, model)
+            await asyncio.sleep(fake_llm.token_delay)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.post("/admin/config")
+async def configure(request: Request):
+    """Cambia latencia, tasas de error/429 o el guion sin reiniciar el servidor"""
+    settings = await request.json()
+    if "script_path" in settings:
+        settings["script"] = load_script(settings.pop("script_path"))
+    try:
+        fake_llm.configure(**settings)
+    except (TypeError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return fake_llm.stats()
+
+
+@app.get("/admin/stats")
+async def stats():
+    """Contadores de peticiones atendidas"""
+    return fake_llm.stats()
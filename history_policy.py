@@ -0,0 +1,65 @@
+import json
+import os
+import zlib
+from typing import Any, Dict, List, Union
+
+# Política de historial: solo los últimos HISTORY_MAX_MESSAGES mensajes se guardan completos;
+# los anteriores se resumen en `history_summary` (los IDs mostrados siguen en `shown_products`).
+HISTORY_KEY = "history_summary"
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))  # 0 = sin límite
+# Compresión de los mensajes en SQLite y Redis: "zlib" o "none". Los campos de la sesión
+# (cursor, resumen del historial, ...) se dejan en JSON plano.
+HISTORY_COMPRESSION = os.getenv("HISTORY_COMPRESSION", "zlib").lower()
+HISTORY_COMPRESS_MIN_BYTES = int(os.getenv("HISTORY_COMPRESS_MIN_BYTES", "256"))
+# Ventana de 4 KB y poca memoria: los mensajes son pequeños y así comprimir cuesta ~4 veces menos
+_ZLIB_LEVEL, _ZLIB_WBITS, _ZLIB_MEMLEVEL = 1, 12, 5
+
+
+def history_offset(session_data: Dict) -> int:
+    """Mensajes ya resumidos: el número de orden del primer mensaje de `conversation`"""
+    return session_data.get(HISTORY_KEY, {}).get("messages", 0)
+
+
+def fold_history(session_data: Dict, max_messages: int = HISTORY_MAX_MESSAGES) -> List[Dict]:
+    """
+    Resume los mensajes que exceden el límite (los más antiguos) y los quita de la
+    conversación. Devuelve los mensajes quitados.
+    """
+    conversation = session_data["conversation"]
+    excess = len(conversation) - max_messages
+    if max_messages <= 0 or excess <= 0:
+        return []
+    folded = conversation[:excess]
+    previous = session_data.get(HISTORY_KEY, {})
+    # Resumen nuevo en cada pliegue: las copias que se están escribiendo no cambian
+    summary = {
+        "messages": previous.get("messages", 0) + excess,
+        "first_at": previous.get("first_at") or folded[0].get("timestamp"),
+        "product_types": dict(previous.get("product_types", {})),
+        "last_product_type": previous.get("last_product_type"),
+    }
+    for message in folded:
+        product_type = message.get("product_type")
+        if product_type:
+            summary["product_types"][product_type] = summary["product_types"].get(product_type, 0) + 1
+            if message.get("query_type") != "continuation":
+                summary["last_product_type"] = product_type
+    session_data[HISTORY_KEY] = summary
+    del conversation[:excess]
+    return folded
+
+
+def encode_payload(value: Any, compression: str = HISTORY_COMPRESSION) -> Union[str, bytes]:
+    """JSON del valor; comprimido con zlib (bytes) si está activado y vale la pena"""
+    text = json.dumps(value, ensure_ascii=False)
+    if compression != "zlib" or len(text) < HISTORY_COMPRESS_MIN_BYTES:
+        return text
+    compressor = zlib.compressobj(_ZLIB_LEVEL, zlib.DEFLATED, _ZLIB_WBITS, _ZLIB_MEMLEVEL)
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def decode_payload(data: Union[str, bytes]) -> Any:
+    """Inverso de `encode_payload`; acepta también el JSON sin comprimir de versiones anteriores"""
+    if isinstance(data, bytes) and data[:1] not in (b"{", b"["):
+        data = zlib.decompress(data)
+    return json.loads(data)
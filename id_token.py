@@ -0,0 +1,68 @@
+import base64
+from typing import Iterable, List, Optional
+
+# Representación compacta del historial de productos mostrados (`last_products`):
+# IDs numéricos ordenados, codificados como diferencias en varint y en base64 url-safe.
+ID_TOKEN_VERSION = "1"
+MAX_TOKEN_IDS = 100_000
+
+
+def _write_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_id_token(product_ids: Iterable) -> Optional[str]:
+    """
+    Token con el conjunto de IDs (sin orden ni repetidos). None si algún ID no es
+    un entero no negativo: en ese caso se sigue usando la lista.
+    """
+    numbers = set()
+    for pid in product_ids:
+        text = str(pid)
+        # Solo enteros en forma canónica: al decodificar deben volver como el mismo texto
+        if not (text.isascii() and text.isdigit()) or str(int(text)) != text:
+            return None
+        numbers.add(int(text))
+    out = bytearray()
+    previous = 0
+    for number in sorted(numbers):
+        _write_varint(number - previous, out)
+        previous = number
+    return ID_TOKEN_VERSION + "." + base64.urlsafe_b64encode(bytes(out)).decode("ascii").rstrip("=")
+
+
+def decode_id_token(token: str) -> List[str]:
+    """IDs (como texto, igual que en `last_products`) de un token; ValueError si no es válido"""
+    if not isinstance(token, str):
+        raise ValueError("El token debe ser texto")
+    version, _, payload = token.partition(".")
+    if version != ID_TOKEN_VERSION:
+        raise ValueError(f"Versión de token desconocida: {version}")
+    try:
+        data = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Token mal formado: {e}")
+
+    ids: List[str] = []
+    current = 0
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            if shift > 63:
+                raise ValueError("Token mal formado: varint demasiado largo")
+            continue
+        current += value
+        ids.append(str(current))
+        if len(ids) > MAX_TOKEN_IDS:
+            raise ValueError("Token con demasiados IDs")
+        value = 0
+        shift = 0
+    if shift:
+        raise ValueError("Token truncado")
+    return ids
@@ -1,50 +1,288 @@
 import httpx
-import os 
 import asyncio
 import json
-import unicodedata
+import time
 from llama_sanitizer import sanitize_llama_response
 import logging
-from text_utils import normalize_text, contains_word, normalize_color, improve_product_search
+from text_utils import normalize_text, normalize_color, improve_product_search
 logging.basicConfig(level=logging.INFO)
 from dotenv import load_dotenv
 load_dotenv() 
 import re
-from typing import Tuple
-
-async def ask_llama(prompt: str, max_retries: int = 3) -> str:
-    api_key = os.getenv("GROQ_API_KEY")
-    logging.info(f"API Key cargada: {'Sí' if api_key else 'No'}")
+from typing import AsyncIterator, Optional, Tuple
+from llm_cache import llm_cache, make_cache_key
+from singleflight import SingleFlight
+from rate_limiter import groq_rate_limiter, RateLimitExceeded, backoff_delay, estimate_tokens
+from prompt_builder import compact_json, encode_candidates, lexical_score, resolve_aliases, shorten
+from retrieval import retrieve_candidates, search_products_locally
+from deadline import current_deadline, use_deadline, MIN_LLM_TIMEOUT
+from circuit_breaker import llm_breaker
+from llm_backend import STREAM_DONE, llm_backend
+from llm_accounting import llm_accounting
+from product_copy import get_product_blurb
+from style_tags import AMBIENTE_KEYWORDS, ESTILO_KEYWORDS, style_index
+
+# Configuración del modelo (el proveedor se elige con LLM_BACKEND, ver llm_backend.py)
+LLM_TEMPERATURE = 0.7
+LLM_COMPLETION_TOKENS_ESTIMATE = 300  # Tokens de respuesta reservados por llamada
+LLM_TIMEOUT = 30.0  # Segundos por intento
+
+llm_singleflight = SingleFlight()
+
+async def ask_llama(prompt: str, max_retries: int = 3, use_cache: bool = True, call_site: str = "other") -> str:
+    started = time.monotonic()
+    cache_key = make_cache_key(llm_backend.model, LLM_TEMPERATURE, prompt)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            llm_accounting.record(call_site, time.monotonic() - started, "cache_hit", cache_hit=True)
+            return cached
+
+    # Sin presupuesto suficiente para la petición, se usa el respaldo
+    deadline = current_deadline()
+    if deadline and deadline.remaining() < MIN_LLM_TIMEOUT:
+        deadline.mark_exhausted("llm")
+        llm_accounting.record(call_site, time.monotonic() - started, "deadline")
+        return "[]"
+
+    # Lo completa la llamada que realmente va al proveedor; las coalescidas lo dejan vacío
+    info = {}
+
+    async def fetch() -> Optional[str]:
+        # La llamada compartida no pertenece a ninguna petición: sin el presupuesto de la primera.
+        # El de cada una lo aplica su propio wait_for más abajo.
+        use_deadline(None)
+        content = await _request_llama(prompt, max_retries, info)
+        if content is not None and use_cache:
+            llm_cache.set(cache_key, content)
+        return content
+
+    # Prompts idénticos en curso comparten una sola llamada a GROQ
+    flight = llm_singleflight.do(cache_key, fetch)
+    if deadline:
+        try:
+            content = await asyncio.wait_for(flight, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            deadline.mark_exhausted("llm")
+            content = None
+            info["outcome"] = "deadline"
+    else:
+        content = await flight
+
+    llm_accounting.record(
+        call_site, time.monotonic() - started,
+        info.get("outcome", "coalesced"),
+        prompt_tokens=info.get("prompt_tokens", 0),
+        completion_tokens=info.get("completion_tokens", 0),
+        retries=max(0, info.get("attempts", 1) - 1),
+    )
+    if content is None:
+        return "[]"
+    return content
+
+async def _request_llama(prompt: str, max_retries: int, info: Optional[dict] = None) -> Optional[str]:
+    """
+    Llama al proveedor LLM configurado. Retorna None si no se obtuvo respuesta.
+    En `info` deja intentos, resultado y tokens usados para la contabilidad.
+    """
+    info = info if info is not None else {}
+    info["attempts"] = 0
+    logging.info(f"API Key cargada: {'Sí' if llm_backend.has_api_key() else 'No'}")
+    estimated_tokens = estimate_tokens(prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
+    deadline = current_deadline()
     
     async with httpx.AsyncClient() as client:
         for attempt in range(max_retries):
+            # Cada intento se ajusta al tiempo que le queda a la petición
+            timeout = LLM_TIMEOUT
+            if deadline:
+                if deadline.remaining() < MIN_LLM_TIMEOUT:
+                    deadline.mark_exhausted("llm")
+                    info["outcome"] = "deadline"
+                    return None
+                timeout = deadline.timeout(LLM_TIMEOUT)
+
+            if llm_breaker.rejecting():
+                logging.warning("Circuit breaker del LLM abierto, usando respaldo sin LLM")
+                info["outcome"] = "breaker_open"
+                return None
+
+            try:
+                await groq_rate_limiter.acquire(estimated_tokens, max_wait=deadline.remaining() if deadline else None)
+            except RateLimitExceeded as e:
+                logging.warning(f"Límite de GROQ alcanzado ({e}), usando respaldo sin LLM")
+                info["outcome"] = "rate_limited"
+                return None
+
+            if not llm_breaker.allow_request():
+                info["outcome"] = "breaker_open"
+                return None
+            info["attempts"] += 1
+            started = time.monotonic()
             try:
                 response = await client.post(
-                    "https://api.groq.com/openai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "llama3-70b-8192",
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": 0.7,
-                    },
-                    timeout=30.0
+                    llm_backend.chat_url,
+                    headers=llm_backend.headers(),
+                    json=llm_backend.payload(prompt, LLM_TEMPERATURE),
+                    timeout=timeout
                 )
+                if response.status_code == 429:
+                    llm_breaker.record_failure(time.monotonic() - started)
+                    delay = groq_rate_limiter.penalize(response.headers, attempt)
+                    logging.warning(f"GROQ respondió 429, reintento en {delay:.1f}s")
+                    info["outcome"] = "http_429"
+                    continue
+                groq_rate_limiter.update_from_headers(response.headers)
                 response.raise_for_status()
-                return response.json()["choices"][0]["message"]["content"]
+                content, usage = llm_backend.parse_completion(response.json())
+                llm_breaker.record_success(time.monotonic() - started)
+                groq_rate_limiter.record_usage(estimated_tokens, usage.get("total_tokens"))
+                info["outcome"] = "ok"
+                info["prompt_tokens"] = usage.get("prompt_tokens", 0)
+                info["completion_tokens"] = usage.get("completion_tokens", 0)
+                return content
             except httpx.HTTPStatusError as e:
                 logging.error(f"Error en LLM: {e.response.text}")
-                if attempt == max_retries - 1:
-                    return "[]"
-                await asyncio.sleep(1)
+                info["outcome"] = f"http_{e.response.status_code}"
+                # Los errores 4xx no se arreglan reintentando (y no indican caída del proveedor)
+                if e.response.status_code < 500:
+                    llm_breaker.record_success(time.monotonic() - started)
+                    return None
+                llm_breaker.record_failure(time.monotonic() - started)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                llm_breaker.record_failure(time.monotonic() - started)
+                logging.error(f"Error de conexión con LLM: {str(e)}")
+                info["outcome"] = "timeout" if isinstance(e, httpx.TimeoutException) else "transport_error"
+            except asyncio.CancelledError:
+                # CancelledError no es Exception: sin esto la prueba de semiabierto quedaría tomada
+                llm_breaker.release_probe()
+                raise
             except Exception as e:
+                llm_breaker.record_failure(time.monotonic() - started)
                 logging.error(f"Error inesperado: {str(e)}")
-                return "[]"
-    return "[]"
+                info["outcome"] = "error"
+                return None
+
+            if attempt < max_retries - 1:
+                delay = backoff_delay(attempt)
+                if deadline and delay >= deadline.remaining():
+                    deadline.mark_exhausted("llm")
+                    return None
+                await asyncio.sleep(delay)
+    return None
+
+async def stream_llama(prompt: str, use_cache: bool = True, call_site: str = "other") -> AsyncIterator[str]:
+    """
+    Versión en streaming de ask_llama: emite fragmentos del texto a medida que
+    GROQ los genera. No reintenta, porque el cliente ya pudo recibir parte del texto.
+    """
+    started = time.monotonic()
+    info = {"outcome": "error"}
+    try:
+        async for chunk in _stream_llama(prompt, use_cache, info):
+            yield chunk
+    finally:
+        # Los tokens del stream son estimados: GROQ no envía el bloque `usage` por fragmento
+        llm_accounting.record(
+            call_site, time.monotonic() - started, info["outcome"],
+            prompt_tokens=info.get("prompt_tokens", 0),
+            completion_tokens=info.get("completion_tokens", 0),
+            cache_hit=info["outcome"] == "cache_hit",
+        )
 
-async def ask_llama_for_products(products: list[dict], user_message: str) -> list[str]:
+async def _stream_llama(prompt: str, use_cache: bool, info: dict) -> AsyncIterator[str]:
+    cache_key = make_cache_key(llm_backend.model, LLM_TEMPERATURE, prompt)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            info["outcome"] = "cache_hit"
+            yield cached
+            return
+
+    deadline = current_deadline()
+    timeout = LLM_TIMEOUT
+    if deadline:
+        if deadline.remaining() < MIN_LLM_TIMEOUT:
+            deadline.mark_exhausted("llm")
+            info["outcome"] = "deadline"
+            return
+        timeout = deadline.timeout(LLM_TIMEOUT)
+
+    if llm_breaker.rejecting():
+        logging.warning("Circuit breaker del LLM abierto, usando respaldo sin LLM")
+        info["outcome"] = "breaker_open"
+        return
+
+    estimated_tokens = estimate_tokens(prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
+    try:
+        await groq_rate_limiter.acquire(estimated_tokens, max_wait=deadline.remaining() if deadline else None)
+    except RateLimitExceeded as e:
+        logging.warning(f"Límite de GROQ alcanzado ({e}), usando respaldo sin LLM")
+        info["outcome"] = "rate_limited"
+        return
+
+    if not llm_breaker.allow_request():
+        info["outcome"] = "breaker_open"
+        return
+    info["prompt_tokens"] = estimate_tokens(prompt)
+    parts = []
+    completed = False
+    recorded = False
+    started = time.monotonic()
+    try:
+        async with httpx.AsyncClient() as client:
+            async with client.stream(
+                "POST",
+                llm_backend.chat_url,
+                headers=llm_backend.headers(),
+                json=llm_backend.payload(prompt, LLM_TEMPERATURE, stream=True),
+                timeout=timeout
+            ) as response:
+                # En streaming la latencia que cuenta para el breaker es la de las cabeceras
+                recorded = True
+                if response.status_code == 429 or response.status_code >= 500:
+                    llm_breaker.record_failure(time.monotonic() - started)
+                else:
+                    llm_breaker.record_success(time.monotonic() - started)
+
+                if response.status_code == 429:
+                    groq_rate_limiter.penalize(response.headers, 0)
+                    logging.warning("GROQ respondió 429 en streaming")
+                    info["outcome"] = "http_429"
+                    return
+                groq_rate_limiter.update_from_headers(response.headers)
+                if response.status_code >= 400:
+                    info["outcome"] = f"http_{response.status_code}"
+                    await response.aread()
+                    logging.error(f"Error en LLM (streaming): {response.text}")
+                    return
+
+                async for line in response.aiter_lines():
+                    delta = llm_backend.parse_stream_line(line)
+                    if delta is STREAM_DONE:
+                        completed = True
+                        info["outcome"] = "ok"
+                        break
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+    except Exception as e:
+        if not recorded:
+            recorded = True
+            llm_breaker.record_failure(time.monotonic() - started)
+        logging.error(f"Error inesperado en streaming: {str(e)}")
+        info["outcome"] = "timeout" if isinstance(e, httpx.TimeoutException) else "error"
+    finally:
+        # Cancelada antes de las cabeceras (presupuesto o cliente desconectado): se libera la prueba
+        if not recorded:
+            llm_breaker.release_probe()
+        info["completion_tokens"] = estimate_tokens("".join(parts))
+
+    if completed and parts and use_cache:
+        llm_cache.set(cache_key, "".join(parts))
+
+async def ask_llama_for_products(products: list[dict], user_message: str,
+                                 catalog_version: Optional[str] = None) -> list[str]:
     """Versión mejorada que maneja la nueva estructura de productos con corrección de errores"""
     try:
         # Obtener nombres de productos
@@ -79,14 +317,25 @@ async def ask_llama_for_products(products: list[dict], user_message: str) -> lis
         if direct_matches:
             return direct_matches
 
-        # Preparar datos para LLM
-        products_str = "\n".join(
-            f"- {p['original_name']} (SKU: {p['product_data'].get('sku', '')}, Tipo: {p['product_data'].get('type', '')})"
-            for p in product_list
-        )
+        # Con el proveedor caído la recuperación local responde sin esperar al LLM
+        if llm_breaker.rejecting():
+            return [p.get('product_name', '') for p in search_products_locally(products, user_message, catalog_version=catalog_version)]
+
+        # Recuperación local: solo los K más prometedores llegan al LLM (n: nombre, s: SKU, t: tipo)
+        retrieved, scores = retrieve_candidates(products, user_message, catalog_version=catalog_version)
+        candidates = [
+            {
+                "id": p.get('product_name', ''),
+                "n": p.get('product_name', ''),
+                "s": p.get("sku", ""),
+                "t": p.get("type", "")
+            }
+            for p in retrieved
+        ]
+        products_str, aliases = encode_candidates(candidates, scores=scores)
 
         prompt = f"""
-Productos disponibles:
+Productos disponibles (k: clave, n: nombre, s: SKU, t: tipo):
 {products_str}
 
 El usuario busca: "{user_message}"
@@ -95,26 +344,24 @@ Identifica los productos más relevantes considerando:
 1. Coincidencias exactas o similares
 2. Sin diferenciar tildes
 3. SKU y tipo como contexto adicional
-4. Devuelve SOLO un JSON con los nombres exactos
+4. Devuelve SOLO un JSON con las claves (k) de los productos
 
-Ejemplo: ["Sillón Elegante", "Silla Moderna"]
+Ejemplo: ["p3", "p1"]
 """
-        response = await ask_llama(prompt)
-        return sanitize_llama_response(response, expected_type="list_str")
+        response = await ask_llama(prompt, call_site="products")
+        return resolve_aliases(sanitize_llama_response(response, expected_type="list_str"), aliases)
 
     except Exception as e:
         logging.error(f"Error en ask_llama_for_products: {e}")
         return []
 
-async def ask_llama_summary_for_products(products: list[dict]) -> str:
-    """Genera resumen profesional con todos los campos disponibles"""
-    try:
-        if not products:
-            return "No encontré productos que coincidan exactamente con tu búsqueda."
-            
-        if len(products) == 1:
-            product = products[0]
-            prompt = f"""
+NO_PRODUCTS_MESSAGE = "No encontré productos que coincidan exactamente con tu búsqueda."
+
+def build_summary_prompt(products: list[dict]) -> str:
+    """Construye el prompt del resumen para uno o varios productos"""
+    if len(products) == 1:
+        product = products[0]
+        prompt = f"""
 Eres un experto en ventas de muebles. Crea una descripción precisa y atractiva en español para:
 
 Nombre: {product.get('product_name', 'Producto')}
@@ -134,26 +381,26 @@ REGLAS:
 7. Usa un tono amigable y profesional
 8. NO traduzcas el nombre del producto
 """
-        
-        else:
-            # Agrupar productos por tipo
-            productos_por_tipo = {}
-            for p in products:
-                tipo = p.get('type', 'Otros')
-                if tipo not in productos_por_tipo:
-                    productos_por_tipo[tipo] = []
-                productos_por_tipo[tipo].append(p)
-
-            # Crear resumen por tipo
-            productos_info = []
-            for tipo, productos in productos_por_tipo.items():
-                productos_info.append(f"\n**{tipo.upper()}**\n")
-                for p in productos:
-                    productos_info.append(
-                        f"* {p.get('product_name', 'Producto')}: ${p.get('base_price', '')}"
-                    )
+    
+    else:
+        # Agrupar productos por tipo
+        productos_por_tipo = {}
+        for p in products:
+            tipo = p.get('type', 'Otros')
+            if tipo not in productos_por_tipo:
+                productos_por_tipo[tipo] = []
+            productos_por_tipo[tipo].append(p)
+
+        # Crear resumen por tipo
+        productos_info = []
+        for tipo, productos in productos_por_tipo.items():
+            productos_info.append(f"\n**{tipo.upper()}**\n")
+            for p in productos:
+                productos_info.append(
+                    f"* {p.get('product_name', 'Producto')}: ${p.get('base_price', '')}"
+                )
 
-            prompt = f"""
+        prompt = f"""
 Resume estos productos agrupados por tipo, destacando sus características y usos. Responde SIEMPRE en español:
 
 {''.join(productos_info)}
@@ -172,49 +419,82 @@ REGLAS:
 11. Asegúrate de que cada producto sea relevante para el ambiente solicitado
 """
 
-        response = await ask_llama(prompt)
-        return response if response.strip() else f"Encontré {len(products)} opciones relevantes."
+    return prompt
+
+def build_local_summary(products: list[dict]) -> str:
+    """Resumen con plantilla fija, usado cuando el LLM no está disponible"""
+    if not products:
+        return NO_PRODUCTS_MESSAGE
+
+    if len(products) == 1:
+        product = products[0]
+        stock = "Disponible" if not product.get('stock_alert') else "Últimas unidades"
+        tipo = f" ({product.get('type')})" if product.get('type') else ""
+        return (
+            f"{product.get('product_name', 'Producto')}{tipo} a ${product.get('base_price', '')}. "
+            f"{stock}."
+        )
+
+    productos_por_tipo = {}
+    for p in products:
+        productos_por_tipo.setdefault(p.get('type') or 'Otros', []).append(p)
+
+    lines = [f"Encontré {len(products)} opciones relevantes:"]
+    for tipo, productos in productos_por_tipo.items():
+        lines.append(f"\n**{tipo.upper()}**")
+        for p in productos:
+            lines.append(f"* {p.get('product_name', 'Producto')}: ${p.get('base_price', '')}")
+    return "\n".join(lines)
+
+async def ask_llama_summary_for_products(products: list[dict]) -> str:
+    """Genera resumen profesional con todos los campos disponibles"""
+    try:
+        if not products:
+            return NO_PRODUCTS_MESSAGE
+
+        # Un solo producto: el texto generado fuera de línea evita la llamada al LLM
+        if len(products) == 1:
+            blurb = get_product_blurb(products[0])
+            if blurb:
+                return blurb
+
+        response = await ask_llama(build_summary_prompt(products), call_site="summary")
+        # "[]" es el respaldo de ask_llama cuando no hubo respuesta (error o sin tiempo)
+        if not response.strip() or response.strip() == "[]":
+            return build_local_summary(products)
+        return response
         
     except Exception as e:
         logging.error(f"Error al generar resumen: {str(e)}")
-        return f"Encontré {len(products)} opciones relevantes."
+        return build_local_summary(products)
 
-async def ask_llama_for_style_recommendations(products: list[dict], user_message: str) -> list[str]:
-    """Recomienda productos basados en ambientes interiores"""
+async def stream_summary_for_products(products: list[dict]) -> AsyncIterator[str]:
+    """Versión en streaming del resumen: emite el texto a medida que llega de GROQ"""
+    if not products:
+        yield NO_PRODUCTS_MESSAGE
+        return
+
+    if len(products) == 1:
+        blurb = get_product_blurb(products[0])
+        if blurb:
+            yield blurb
+            return
+
+    emitted = False
     try:
-        AMBIENTE_KEYWORDS = {
-            "dormitorio": {
-                "keywords": ["dormitorio", "cuarto", "habitación", "recámara", "noche", "descanso", "velador", "cama", "mesita"],
-                "description": "un espacio para descansar y relajarse",
-                "productos_tipicos": ["cama", "velador", "armario", "mesita de noche", "lámpara de noche"],
-                "productos_no_relevantes": ["sofá", "mesa de comedor", "taburete", "cortina de baño", "escritorio", "archivador"]
-            },
-            "oficina": {
-                "keywords": ["oficina", "escritorio", "trabajo", "estudio", "ergonómica", "archivador"],
-                "description": "un espacio para trabajar y concentrarse",
-                "productos_tipicos": ["escritorio", "silla ergonómica", "archivador", "lámpara de escritorio", "estantería"],
-                "productos_no_relevantes": ["sofá", "cama", "velador", "cortina de baño", "mesa de comedor", "biombo", "fundas"]
-            },
-            "sala": {
-                "keywords": ["sala", "estar", "living", "sofá", "centro", "decorativa", "recibidor"],
-                "description": "un espacio para socializar y recibir visitas",
-                "productos_tipicos": ["sofá", "mesa de centro", "sillón", "lámpara de pie", "estantería decorativa"],
-                "productos_no_relevantes": ["escritorio", "archivador", "velador", "cortina de baño", "silla ergonómica"]
-            },
-            "comedor": {
-                "keywords": ["comedor", "dining", "mesa", "silla", "banqueta"],
-                "description": "un espacio para compartir comidas",
-                "productos_tipicos": ["mesa de comedor", "sillas de comedor", "banqueta", "lámpara colgante"],
-                "productos_no_relevantes": ["escritorio", "archivador", "sofá", "cortina de baño", "silla ergonómica"]
-            },
-            "cocina": {
-                "keywords": ["cocina", "taburete", "isla", "banqueta", "desayunador"],
-                "description": "un espacio para preparar y disfrutar comidas",
-                "productos_tipicos": ["taburete", "banqueta", "mesa de desayunador", "estantería de cocina"],
-                "productos_no_relevantes": ["sofá", "escritorio", "cama", "cortina de baño", "silla ergonómica"]
-            }
-        }
+        async for chunk in stream_llama(build_summary_prompt(products), call_site="summary_stream"):
+            emitted = True
+            yield chunk
+    except Exception as e:
+        logging.error(f"Error al generar resumen en streaming: {str(e)}")
+
+    if not emitted:
+        yield build_local_summary(products)
 
+async def ask_llama_for_style_recommendations(products: list[dict], user_message: str,
+                                              catalog_version: Optional[str] = None) -> list[str]:
+    """Recomienda productos basados en ambientes interiores"""
+    try:
         normalized_query = normalize_text(user_message)
         
         # Detectar ambiente
@@ -224,10 +504,51 @@ async def ask_llama_for_style_recommendations(products: list[dict], user_message
                 ambiente = amb
                 break
 
+        # Estilo opcional (moderno, clásico, ...)
+        estilo = next(
+            (st for st, keywords in ESTILO_KEYWORDS.items()
+             if any(normalize_text(kw) in normalized_query for kw in [st] + keywords)),
+            None
+        )
+
+        # Con el catálogo etiquetado fuera de línea la consulta es una búsqueda en el índice
+        if (ambiente or estilo) and style_index.available:
+            tagged = style_index.lookup(products, ambiente=ambiente, estilo=estilo)
+            logging.info(f"Recomendaciones por índice de estilos ({ambiente}, {estilo}): {len(tagged)} productos")
+            return [p['product_name'] for p in tagged]
+
         if not ambiente:
             return []
 
         ambiente_data = AMBIENTE_KEYWORDS[ambiente]
+        boost_terms = ambiente_data['keywords'] + ambiente_data['productos_tipicos']
+
+        if llm_breaker.rejecting():
+            local_names = [
+                p['product_name'] for p in search_products_locally(
+                    products, user_message, boost_terms=boost_terms, catalog_version=catalog_version
+                )
+            ]
+            return [
+                name for name in local_names
+                if not any(no_relevante in normalize_text(name) for no_relevante in ambiente_data['productos_no_relevantes'])
+            ]
+
+        # Recuperación local por afinidad al ambiente (n: nombre, s: SKU, p: precio, d: descripción)
+        retrieved, scores = retrieve_candidates(
+            products, user_message, boost_terms=boost_terms, catalog_version=catalog_version
+        )
+        candidates = [
+            {
+                "id": p['product_name'],
+                "n": p['product_name'],
+                "s": p.get('sku', ''),
+                "p": p.get('base_price', ''),
+                "d": shorten(p.get('description', ''))
+            }
+            for p in retrieved
+        ]
+        products_str, aliases = encode_candidates(candidates, scores=scores)
         
         # Preparar prompt más detallado
         prompt = f"""
@@ -251,11 +572,8 @@ ANÁLISIS REQUERIDO:
    - Productos que mencionan {ambiente} en su descripción
    - Productos que tienen una función clara en {ambiente}
 
-Productos a analizar:
-{'\n'.join(
-    f"- {p['product_name']} (SKU: {p.get('sku', '')}, Precio: ${p.get('base_price', '')}, Descripción: {p.get('description', '')})"
-    for p in products[:30]
-)}
+Productos a analizar (k: clave, n: nombre, s: SKU, p: precio, d: descripción):
+{products_str}
 
 INSTRUCCIONES:
 1. Analiza CADA producto individualmente
@@ -263,26 +581,26 @@ INSTRUCCIONES:
 3. Selecciona SOLO los productos que son CLARAMENTE relevantes para {ambiente}
 4. NO incluyas productos que generen dudas
 5. Devuelve un JSON con:
-   - Lista de productos seleccionados
+   - Lista de claves (k) de los productos seleccionados
    - Explicación de por qué cada producto es relevante
-   - Lista de productos descartados y por qué
+   - Lista de claves (k) de productos descartados y por qué
 
 Ejemplo de respuesta:
 {{
-    "productos_seleccionados": ["Silla Ergonómica X", "Escritorio Moderno Y"],
+    "productos_seleccionados": ["p2", "p5"],
     "explicacion": "Estos productos son ideales para tu oficina porque...",
     "productos_descartados": [
         {{
-            "nombre": "Cortina de Baño",
+            "clave": "p7",
             "razon": "Este producto está diseñado específicamente para baños y no tiene función en una oficina"
         }}
     ]
 }}
 """
-        response = await ask_llama(prompt)
+        response = await ask_llama(prompt, call_site="style")
         try:
             result = json.loads(response)
-            productos_seleccionados = result.get("productos_seleccionados", [])
+            productos_seleccionados = resolve_aliases(result.get("productos_seleccionados", []), aliases)
             
             # Verificación final de relevancia
             productos_finales = []
@@ -293,13 +611,14 @@ Ejemplo de respuesta:
             
             return productos_finales
         except:
-            return sanitize_llama_response(response, expected_type="list_str")
+            return resolve_aliases(sanitize_llama_response(response, expected_type="list_str"), aliases)
 
     except Exception as e:
         logging.error(f"Error en recomendaciones por ambiente: {e}")
         return []
 
-async def ask_llama_for_attributes_query(products: list[dict], user_query: str) -> list[dict]:
+async def ask_llama_for_attributes_query(products: list[dict], user_query: str,
+                                         catalog_version: Optional[str] = None) -> list[dict]:
     """Busca productos basados en atributos con soporte para VARIABLE"""
     try:
         normalized_query = normalize_text(user_query)
@@ -366,9 +685,13 @@ async def ask_llama_for_attributes_query(products: list[dict], user_query: str)
             )
             return matched_products[:12]
         
-        # Respaldo con LLM
+        if llm_breaker.rejecting():
+            return search_products_locally(products, user_query, k=12, catalog_version=catalog_version)
+
+        # Respaldo con LLM sobre los candidatos recuperados (n: nombre, s: SKU, t: tipo, a: atributos)
+        retrieved, scores = retrieve_candidates(products, user_query, catalog_version=catalog_version)
         products_data = []
-        for p in products[:50]:  # Limitar para el prompt
+        for p in retrieved:
             attrs = p.get('attributes_normalized', {})
             if isinstance(attrs, str):
                 try:
@@ -378,29 +701,33 @@ async def ask_llama_for_attributes_query(products: list[dict], user_query: str)
             
             products_data.append({
                 "id": p.get("id"),
-                "name": p.get("product_name", ""),
-                "sku": p.get("sku", ""),
-                "type": p.get("type", ""),
-                "attributes": attrs
+                "n": p.get("product_name", ""),
+                "s": p.get("sku", ""),
+                "t": p.get("type", ""),
+                "a": attrs
             })
 
+        products_str, aliases = encode_candidates(products_data, scores=scores)
+
         prompt = f"""
 Consulta: "{user_query}"
 
-Productos:
-{json.dumps(products_data, indent=2)}
+Productos (k: clave, n: nombre, s: SKU, t: tipo, a: atributos):
+{products_str}
 
 INSTRUCCIONES:
 1. Busca coincidencias con:
    - Color: {colors_in_query or 'No especificado'}
    - Tipo: {product_type_in_query or 'No especificado'}
 2. Considera variantes para productos VARIABLE
-3. Devuelve SOLO un JSON con los IDs
+3. Devuelve SOLO un JSON con las claves (k) de los productos
 """
-        response = await ask_llama(prompt)
-        product_ids = sanitize_llama_response(response, expected_type="list_int")
+        response = await ask_llama(prompt, call_site="attributes")
+        product_ids = {
+            str(pid) for pid in resolve_aliases(sanitize_llama_response(response, expected_type="list_str"), aliases)
+        }
         
-        return [p for p in products if str(p.get("id")) in map(str, product_ids)]
+        return [p for p in products if str(p.get("id")) in product_ids]
     
     except Exception as e:
         logging.error(f"Error en ask_llama_for_attributes_query: {e}")
@@ -488,37 +815,45 @@ async def ask_llama_for_template_recommendations(templates: list[dict], template
         # Si no hay resultados después del filtrado básico, usar LLM
         if not filtered_templates:
             logging.info("Usando LLM para búsqueda de plantillas")
+            products_by_template = {}
+            for tp in template_products:
+                products_by_template.setdefault(str(tp.get('template_id')), []).append(tp)
+
+            # Plantillas compactas (n: nombre, d: descripción, e: estilo, h: habitación,
+            # $: precio total, %: descuento, v: ventas, pr: productos [id, cantidad, opcional])
             templates_data = []
             for t in templates:
-                products = [
-                    tp for tp in template_products 
-                    if str(tp.get('template_id')) == str(t.get('id'))
-                ]
+                products = products_by_template.get(str(t.get('id')), [])
                 templates_data.append({
                     "id": t.get("id"),
-                    "name": t.get("name", ""),
-                    "description": t.get("description", ""),
-                    "style": t.get("style", ""),
-                    "room_type": t.get("room_type", ""),
-                    "total_price": t.get("total_price", 0),
-                    "discount": t.get("discount", 0),
-                    "sales_count": t.get("sales_count", 0),
-                    "products": [
-                        {
-                            "id": p.get("product_id"),
-                            "quantity": p.get("quantity", 1),
-                            "optional": p.get("is_optional", False),
-                            "notes": p.get("notes", "")
-                        }
+                    "n": t.get("name", ""),
+                    "d": shorten(t.get("description", "")),
+                    "e": t.get("style", ""),
+                    "h": t.get("room_type", ""),
+                    "$": t.get("total_price", 0),
+                    "%": t.get("discount", 0),
+                    "v": t.get("sales_count", 0),
+                    "pr": [
+                        [p.get("product_id"), p.get("quantity", 1), 1 if p.get("is_optional") else 0]
                         for p in products
                     ]
                 })
 
+            scores = [
+                lexical_score(f"{user_message} {room_type} {style or ''}", f"{d['n']} {d['d']} {d['e']} {d['h']}")
+                for d in templates_data
+            ]
+
+            if llm_breaker.rejecting():
+                ranked = sorted(zip(scores, templates), key=lambda pair: pair[0], reverse=True)
+                return [t for score, t in ranked if score > 0]
+            templates_str, aliases = encode_candidates(templates_data, scores=scores, prefix="t")
+
             prompt = f"""
 Consulta: "{user_message}"
 
-Plantillas disponibles:
-{json.dumps(templates_data, indent=2)}
+Plantillas disponibles (k: clave, n: nombre, d: descripción, e: estilo, h: habitación, $: precio total, %: descuento, v: ventas, pr: productos [id, cantidad, opcional]):
+{templates_str}
 
 INSTRUCCIONES:
 1. Busca coincidencias con:
@@ -529,13 +864,15 @@ INSTRUCCIONES:
    - Descuentos disponibles
    - Popularidad (ventas)
    - Productos incluidos
-3. Devuelve SOLO un JSON con los IDs de las plantillas más relevantes
+3. Devuelve SOLO un JSON con las claves (k) de las plantillas más relevantes
 """
-            response = await ask_llama(prompt)
-            template_ids = sanitize_llama_response(response, expected_type="list_int")
+            response = await ask_llama(prompt, call_site="templates")
+            template_ids = {
+                str(tid) for tid in resolve_aliases(sanitize_llama_response(response, expected_type="list_str"), aliases)
+            }
             logging.info(f"IDs de plantillas encontrados por LLM: {template_ids}")
             
-            return [t for t in templates if str(t.get("id")) in map(str, template_ids)]
+            return [t for t in templates if str(t.get("id")) in template_ids]
         
         # Ordenar por popularidad y precio
         sorted_templates = sorted(
@@ -571,12 +908,12 @@ Descuento: {template.get('discount', 0)}%
 Ventas: {template.get('sales_count', 0)} unidades vendidas
 
 Productos incluidos:
-{json.dumps([{
+{compact_json([{
     'id': p.get('product_id'),
-    'quantity': p.get('quantity', 1),
-    'optional': p.get('is_optional', False),
-    'notes': p.get('notes', '')
-} for p in products], indent=2)}
+    'cantidad': p.get('quantity', 1),
+    'opcional': p.get('is_optional', False),
+    'notas': shorten(p.get('notes', ''))
+} for p in products])}
 
 REGLAS:
 1. Responde SIEMPRE en español
@@ -588,8 +925,10 @@ REGLAS:
 7. Usa un tono amigable y profesional
 8. NO traduzcas los nombres de los productos
 """
-        response = await ask_llama(prompt)
-        return response if response.strip() else "No se pudo generar una descripción para esta plantilla."
+        response = await ask_llama(prompt, call_site="template_summary")
+        if not response.strip() or response.strip() == "[]":
+            return "No se pudo generar una descripción para esta plantilla."
+        return response
         
     except Exception as e:
         logging.error(f"Error al generar resumen de plantilla: {str(e)}")
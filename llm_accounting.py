@@ -0,0 +1,221 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('llm_accounting')
+
+# Registro opcional de cada llamada (JSONL, una línea por llamada); vacío = desactivado
+LLM_CALL_LOG = os.getenv("LLM_CALL_LOG", "")
+# Las líneas se acumulan en memoria y un hilo las escribe cada LLM_CALL_LOG_FLUSH segundos
+LLM_CALL_LOG_FLUSH = float(os.getenv("LLM_CALL_LOG_FLUSH", "1.0"))
+LLM_CALL_LOG_BUFFER = 1000  # Líneas pendientes que adelantan la escritura
+# Precios en USD por millón de tokens (llama3-70b-8192 en GROQ)
+LLM_PRICE_INPUT_PER_MTOK = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.59"))
+LLM_PRICE_OUTPUT_PER_MTOK = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "0.79"))
+
+LATENCY_BUCKETS_MS = [10, 50, 100, 250, 500, 1000, 2000, 5000, 10000, 30000]
+TOKEN_BUCKETS = [100, 250, 500, 1000, 2000, 4000, 8000]
+
+
+class Histogram:
+    """Histograma de límites fijos (el último cubo es +Inf)"""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Cota superior del cubo donde cae el cuantil q (None si cae en el último cubo)"""
+        if not self.total:
+            return 0.0
+        target = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def snapshot(self) -> Dict:
+        labels = [f"le_{b:g}" for b in self.bounds] + ["le_inf"]
+        return {
+            "count": self.total,
+            "sum": round(self.sum, 2),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+def call_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    """Costo estimado en USD de una llamada"""
+    return (prompt_tokens * LLM_PRICE_INPUT_PER_MTOK + completion_tokens * LLM_PRICE_OUTPUT_PER_MTOK) / 1_000_000
+
+
+class LLMAccounting:
+    """Contabilidad de llamadas al LLM por punto de llamada (call site)"""
+
+    def __init__(self, log_path: Optional[str] = LLM_CALL_LOG, flush_interval: float = LLM_CALL_LOG_FLUSH):
+        self.log_path = log_path or None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._sites: Dict[str, Dict] = {}
+        self._pending: List[str] = []
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _site(self, call_site: str) -> Dict:
+        if call_site not in self._sites:
+            self._sites[call_site] = {
+                "calls": 0,
+                "cache_hits": 0,
+                "retries": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost_usd": 0.0,
+                "outcomes": {},
+                "latency_ms": Histogram(LATENCY_BUCKETS_MS),
+                "total_tokens": Histogram(TOKEN_BUCKETS),
+            }
+        return self._sites[call_site]
+
+    def record(self, call_site: str, latency: float, outcome: str, prompt_tokens: int = 0,
+               completion_tokens: int = 0, retries: int = 0, cache_hit: bool = False):
+        """Registra una llamada (también los aciertos de caché, con 0 tokens)"""
+        latency_ms = latency * 1000
+        cost = call_cost(prompt_tokens, completion_tokens)
+        with self._lock:
+            site = self._site(call_site)
+            site["calls"] += 1
+            site["cache_hits"] += 1 if cache_hit else 0
+            site["retries"] += retries
+            site["prompt_tokens"] += prompt_tokens
+            site["completion_tokens"] += completion_tokens
+            site["cost_usd"] += cost
+            site["outcomes"][outcome] = site["outcomes"].get(outcome, 0) + 1
+            site["latency_ms"].observe(latency_ms)
+            if not cache_hit:
+                site["total_tokens"].observe(prompt_tokens + completion_tokens)
+
+        if self.log_path:
+            # Claves cortas: el registro crece con cada llamada
+            self._append({
+                "t": round(time.time(), 3),
+                "s": call_site,
+                "o": outcome,
+                "ms": round(latency_ms, 1),
+                "pt": prompt_tokens,
+                "ct": completion_tokens,
+                "r": retries,
+                "c": 1 if cache_hit else 0,
+            })
+
+    def _append(self, entry: Dict):
+        """Encola la línea; se llama desde el bucle de eventos, así que no toca el disco"""
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False)
+        with self._lock:
+            self._pending.append(line)
+            full = len(self._pending) >= LLM_CALL_LOG_BUFFER
+            if self._writer is None and not self._closed:
+                self._writer = threading.Thread(target=self._write_loop, name="llm-call-log", daemon=True)
+                self._writer.start()
+        if self._closed:
+            self.flush()  # Ya sin hilo de escritura (tras `close`)
+        elif full:
+            self._wake.set()
+
+    def _write_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Escribe las líneas pendientes en el registro; devuelve cuántas se escribieron"""
+        with self._write_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+            if not lines or not self.log_path:
+                return 0
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            except Exception as e:
+                logger.error(f"Error escribiendo registro de llamadas LLM {self.log_path}: {e}")
+                return 0
+            return len(lines)
+
+    def close(self):
+        """Detiene el hilo de escritura y escribe lo pendiente (al apagar el servidor)"""
+        self._closed = True
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5.0)
+        self.flush()
+
+    def stats(self) -> Dict:
+        """Contadores e histogramas por punto de llamada para el endpoint de métricas"""
+        with self._lock:
+            sites = {}
+            for name, site in self._sites.items():
+                sites[name] = {
+                    **{k: v for k, v in site.items() if k not in ("latency_ms", "total_tokens", "outcomes", "cost_usd")},
+                    "cost_usd": round(site["cost_usd"], 6),
+                    "outcomes": dict(site["outcomes"]),
+                    "latency_ms": site["latency_ms"].snapshot(),
+                    "total_tokens": site["total_tokens"].snapshot(),
+                }
+            return {
+                "call_sites": sites,
+                "total_cost_usd": round(sum(s["cost_usd"] for s in self._sites.values()), 6),
+                "log_path": self.log_path,
+                "log_pending": len(self._pending),
+            }
+
+    @classmethod
+    def from_log(cls, path: str) -> "LLMAccounting":
+        """Reconstruye las métricas a partir de un registro JSONL (análisis fuera de línea)"""
+        accounting = cls(log_path=None)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                accounting.record(
+                    entry["s"], entry["ms"] / 1000, entry["o"],
+                    prompt_tokens=entry.get("pt", 0), completion_tokens=entry.get("ct", 0),
+                    retries=entry.get("r", 0), cache_hit=bool(entry.get("c"))
+                )
+        return accounting
+
+
+# Instancia compartida por el proceso
+llm_accounting = LLMAccounting()
+
+
+if __name__ == "__main__":
+    # Uso: python llm_accounting.py llm_calls.jsonl
+    import sys
+
+    report = LLMAccounting.from_log(sys.argv[1] if len(sys.argv) > 1 else LLM_CALL_LOG).stats()
+    for name, site in sorted(report["call_sites"].items(), key=lambda item: -item[1]["cost_usd"]):
+        print(
+            f"{name}: {site['calls']} llamadas, {site['cache_hits']} aciertos de caché, "
+            f"p50 {site['latency_ms']['p50']}ms, p95 {site['latency_ms']['p95']}ms, "
+            f"{site['prompt_tokens'] + site['completion_tokens']} tokens, ${site['cost_usd']:.4f}"
+        )
+    print(f"Total: ${report['total_cost_usd']:.4f}")
@@ -0,0 +1,92 @@
+import json
+import os
+from typing import Dict, Tuple
+
+# Proveedor LLM: "groq" (por defecto) u "openai" para cualquier API compatible,
+# p. ej. el servidor falso local: LLM_BACKEND=openai LLM_BASE_URL=http://localhost:9000/v1
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+STREAM_DONE = object()  # Marca de fin del stream ("data: [DONE]")
+
+
+class OpenAICompatibleBackend:
+    """Proveedor con la API de chat completions de OpenAI (GROQ, servidor falso, ...)"""
+
+    name = "openai"
+
+    def __init__(self, base_url: str, model: str = LLM_MODEL, api_key_env: str = "LLM_API_KEY"):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key_env = api_key_env
+
+    @property
+    def chat_url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    def headers(self) -> Dict[str, str]:
+        # La clave se lee en cada llamada para respetar cambios del entorno (.env)
+        return {
+            "Authorization": f"Bearer {os.getenv(self.api_key_env)}",
+            "Content-Type": "application/json"
+        }
+
+    def has_api_key(self) -> bool:
+        return bool(os.getenv(self.api_key_env))
+
+    def payload(self, prompt: str, temperature: float, stream: bool = False) -> Dict:
+        body = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+        }
+        if stream:
+            body["stream"] = True
+        return body
+
+    @staticmethod
+    def parse_completion(data: Dict) -> Tuple[str, Dict]:
+        """(texto, bloque `usage` con prompt/completion/total_tokens) de una respuesta completa"""
+        return data["choices"][0]["message"]["content"], data.get("usage") or {}
+
+    @staticmethod
+    def parse_stream_line(line: str):
+        """Fragmento de texto de una línea SSE, STREAM_DONE al terminar o None si no aporta texto"""
+        if not line.startswith("data:"):
+            return None
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return STREAM_DONE
+        chunk = json.loads(payload)
+        if not chunk.get("choices"):
+            return None
+        return chunk["choices"][0].get("delta", {}).get("content") or None
+
+    def describe(self) -> Dict:
+        return {"backend": self.name, "base_url": self.base_url, "model": self.model}
+
+
+class GroqBackend(OpenAICompatibleBackend):
+    """API de GROQ (compatible con OpenAI)"""
+
+    name = "groq"
+
+    def __init__(self, base_url: str = GROQ_BASE_URL, model: str = LLM_MODEL):
+        super().__init__(base_url, model, api_key_env="GROQ_API_KEY")
+
+
+def create_backend(kind: str = LLM_BACKEND, base_url: str = LLM_BASE_URL, model: str = LLM_MODEL) -> OpenAICompatibleBackend:
+    """Crea el proveedor configurado"""
+    if kind == "groq":
+        return GroqBackend(base_url or GROQ_BASE_URL, model)
+    if kind == "openai":
+        if not base_url:
+            raise ValueError("LLM_BACKEND=openai requiere LLM_BASE_URL")
+        return OpenAICompatibleBackend(base_url, model)
+    raise ValueError(f"LLM_BACKEND desconocido: {kind}")
+
+
+# Instancia compartida por el proceso
+llm_backend = create_backend()
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('llm_cache')
+
+# Configuración de la caché de respuestas del LLM
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(60 * 60)))  # 1 hora
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")  # Vacío = solo memoria
+LLM_CACHE_PRUNE_EVERY = 200  # Escrituras entre purgas de expirados en disco
+
+# Versión del catálogo: forma parte de la clave para invalidar respuestas con datos viejos
+_catalog_version = "0"
+# Campos que llegan a los prompts y a la búsqueda. Las ventas y las alertas de stock cambian
+# con cada venta y no deben invalidar cachés, etiquetas ni índices.
+CATALOG_VERSION_FIELDS = ("id", "product_name", "type", "description", "base_price", "sku", "attributes")
+_last_rows: List[Tuple] = []
+_last_version = ""
+
+
+def compute_catalog_version(products: List[Dict]) -> str:
+    """
+    Calcula una huella corta del catálogo a partir de los productos activos. Si los campos
+    relevantes no cambiaron desde la última llamada se reutiliza la huella sin recalcularla.
+    """
+    global _last_rows, _last_version
+    rows = [tuple(p.get(field) for field in CATALOG_VERSION_FIELDS) for p in products if isinstance(p, dict)]
+    if rows == _last_rows and _last_version:
+        return _last_version
+    ordered = sorted(rows, key=lambda row: str(row[0]))
+    payload = json.dumps(ordered, sort_keys=True, default=str, ensure_ascii=False)
+    version = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+    _last_rows, _last_version = rows, version
+    return version
+
+
+def set_catalog_version(version: str) -> bool:
+    """Actualiza la versión del catálogo. Retorna True si cambió"""
+    global _catalog_version
+    if version == _catalog_version:
+        return False
+    logger.info(f"Versión de catálogo actualizada: {_catalog_version} -> {version}")
+    _catalog_version = version
+    return True
+
+
+def get_catalog_version() -> str:
+    return _catalog_version
+
+
+def make_cache_key(model: str, temperature: float, prompt: str, catalog_version: Optional[str] = None) -> str:
+    """Genera la clave de caché a partir de (modelo, temperatura, prompt, versión de catálogo)"""
+    version = catalog_version if catalog_version is not None else _catalog_version
+    raw = json.dumps([model, temperature, version, prompt], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Caché LRU con TTL en memoria y nivel opcional en SQLite compartido entre workers"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: float = LLM_CACHE_TTL,
+                 db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path or None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+        self._conn = None
+        if self.db_path:
+            self._init_disk()
+
+    def _init_disk(self):
+        """Abre la base SQLite en modo WAL para compartirla entre procesos"""
+        try:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache (expires_at)")
+            self._conn.commit()
+            logger.info(f"Caché LLM en disco habilitada: {self.db_path}")
+        except Exception as e:
+            logger.error(f"No se pudo abrir la caché LLM en disco {self.db_path}: {e}")
+            self._conn = None
+
+    def get(self, key: str) -> Optional[str]:
+        """Busca una respuesta en memoria y luego en disco"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                except Exception as e:
+                    logger.error(f"Error leyendo caché LLM en disco: {e}")
+                    row = None
+                if row and row[1] > now:
+                    self._store_memory(key, row[0], row[1])
+                    self._counters["hits"] += 1
+                    self._counters["disk_hits"] += 1
+                    return row[0]
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Guarda una respuesta en memoria y, si está habilitado, en disco"""
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, expires_at)
+                    )
+                    self._writes_since_prune += 1
+                    if self._writes_since_prune >= LLM_CACHE_PRUNE_EVERY:
+                        self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                        self._writes_since_prune = 0
+                    self._conn.commit()
+                except Exception as e:
+                    logger.error(f"Error escribiendo caché LLM en disco: {e}")
+
+    def _store_memory(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def clear(self):
+        """Vacía la caché en memoria y en disco"""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM llm_cache")
+                    self._conn.commit()
+                except Exception as e:
+                    logger.error(f"Error vaciando caché LLM en disco: {e}")
+
+    def stats(self) -> Dict:
+        """Contadores de aciertos/fallos para el endpoint de métricas"""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk_enabled": self._conn is not None,
+                "catalog_version": _catalog_version,
+            }
+
+
+# Instancia compartida por el proceso
+llm_cache = LLMCache(db_path=LLM_CACHE_DB)
@@ -1,31 +1,46 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from db import get_all_products, get_all_templates, get_all_template_products, init_db, close_db
 from llama_utils import (
     ask_llama_for_products, 
     ask_llama_summary_for_products,
+    stream_summary_for_products,
     ask_llama_for_attributes_query,
     ask_llama_for_style_recommendations,
     ask_llama_for_template_recommendations,
-    ask_llama_template_summary,
-    ask_llama
+    llm_singleflight
 )
 from product_analyzer import ProductAnalyzer
-from design_template_analyzer import DesignTemplateAnalyzer, generate_template_summary
+from llm_cache import llm_cache, compute_catalog_version, set_catalog_version
+from rate_limiter import groq_rate_limiter
+from circuit_breaker import llm_breaker
+from search_strategies import search_runner
+from enrichment_store import enrichment_store
+from product_copy import product_copy_index
+from style_tags import schedule_retagging, style_index
+from llm_backend import llm_backend
+from llm_accounting import llm_accounting
+from summary_jobs import summary_jobs
+from conversation_store import conversation_store, shown_products
+from history_policy import HISTORY_KEY
+from session_cache import session_cache
+from session_janitor import session_janitor
+from result_cursors import result_cursors
+from page_prefetch import PREFETCH_ENABLED, page_prefetcher
+from id_token import decode_id_token, encode_id_token
+from cache_warmup import WARMUP_ENABLED, cache_warmer, mine_top_queries, recent_log_files
+from deadline import start_deadline, use_deadline, request_budget
+from design_template_analyzer import generate_template_summary
 import logging
 from typing import Dict, List, Optional, Tuple
-from text_utils import normalize_text, detect_query_type, normalize_color, improve_product_search, smart_product_search
+from text_utils import normalize_text, detect_query_type, smart_product_search
 import re
 import json
 import sys
-from datetime import datetime, timedelta
-import os
-import time
-from llama_sanitizer import sanitize_llama_response
+from datetime import datetime
 import asyncio
 import uuid
-import glob
-import threading
 
 
 # Configuración de la aplicación
@@ -84,19 +99,9 @@ PRODUCT_TYPES = [
     "armario", "armarios"
 ]
 
-# Directorio para conversaciones
-CONVERSATIONS_DIR = "logs/conversations"
-os.makedirs(CONVERSATIONS_DIR, exist_ok=True)
-
 # Inicializar analizadores
 product_analyzer = ProductAnalyzer()
 
-# Configuración del sistema de conversaciones
-CLEANUP_INTERVAL = 30 * 60  # 30 minutos
-SESSION_MAX_AGE = 2 * 60 * 60  # 2 horas
-MAX_SESSIONS = 1000
-MAX_CONVERSATIONS_SIZE_MB = 50
-
 class ProductSearchError(Exception):
     """Error personalizado para búsqueda de productos"""
     pass
@@ -221,281 +226,464 @@ def extract_quantity_from_query(query: str) -> Tuple[int, str]:
 async def startup_event():
     """Inicializa la base de datos al arrancar la aplicación"""
     await init_db()
-    # Iniciar el programador de limpieza automática
-    start_cleanup_scheduler()
+    # Iniciar la limpieza automática de conversaciones (tarea asyncio; un solo líder por almacén)
+    session_janitor.start()
+    # Cargar en un hilo los enriquecimientos guardados; después se recargan en segundo plano
+    try:
+        await asyncio.gather(style_index.refresh(), product_copy_index.refresh())
+    except Exception as e:
+        logger.error(f"No se pudieron cargar los enriquecimientos: {str(e)}")
+    # Precalentar las cachés con las consultas más frecuentes
+    try:
+        catalog = await load_catalog()
+        set_catalog_version(catalog["catalog_version"])
+        schedule_cache_warmup(catalog, "startup")
+    except Exception as e:
+        logger.error(f"No se pudo iniciar el precalentado de cachés: {str(e)}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cierra la conexión a la base de datos al detener la aplicación"""
+    await session_janitor.stop()
+    await session_cache.flush_all()
+    await asyncio.get_running_loop().run_in_executor(None, llm_accounting.close)
     await close_db()
 
-@app.post("/chat")
-async def chat(request: Request):
-    try:
-        # 1. Obtener y validar datos de entrada
-        data = await request.json()
-        raw_query = data.get("message", "").strip()
-        session_id = data.get("session_id", "")  # ID de sesión para el historial
-        # last_products = data.get("last_products", [])  # Productos mostrados anteriormente
-
-        if not raw_query:
-            logger.warning("Intento de búsqueda con mensaje vacío")
-            raise HTTPException(status_code=400, detail="El mensaje no puede estar vacío")
-
-        # 2. Cargar o crear conversación de sesión
-        if not session_id:
-            session_id = str(uuid.uuid4())
-        
-        session_data = load_conversation(session_id)
-
-        # Obtener productos ya mostrados: si el frontend los manda, úsalos; si no, reconstruye desde el historial
-        if "last_products" in data:
-            last_products = data.get("last_products", [])
+def serialize_product(p: dict) -> Dict:
+    """Campos de producto que se devuelven al frontend"""
+    return {
+        "id": str(p.get("id")),
+        "sku": p.get("sku"),
+        "slug": p.get("slug"),
+        "name": p.get("product_name"),
+        "description": p.get("description")
+    }
+
+def build_quantity_message(available_quantity: int, requested_quantity: int) -> str:
+    """Mensaje cuando se encontraron menos productos de los solicitados"""
+    if available_quantity >= requested_quantity:
+        return ""
+    if available_quantity == 0:
+        return "\n\nLo siento, no encontré más productos que coincidan con tu búsqueda."
+    if available_quantity == 1:
+        return f"\n\nSolo encontré 1 producto más que coincide con tu búsqueda."
+    return f"\n\nSolo encontré {available_quantity} productos más que coinciden con tu búsqueda de {requested_quantity} solicitados."
+
+def format_sse(event: str, data: Dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def prepare_chat(data: Dict) -> Dict:
+    """Pasos 1 a 5: valida la entrada, carga la sesión, interpreta la consulta y obtiene los datos"""
+    # 1. Obtener y validar datos de entrada
+    raw_query = data.get("message", "").strip()
+    session_id = data.get("session_id", "")  # ID de sesión para el historial
+
+    if not raw_query:
+        logger.warning("Intento de búsqueda con mensaje vacío")
+        raise HTTPException(status_code=400, detail="El mensaje no puede estar vacío")
+
+    # 2. Cargar o crear conversación de sesión
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    
+    session_data = await load_conversation(session_id)
+
+    # Obtener productos ya mostrados: si el frontend los manda (token o lista), úsalos; si no, los de la sesión
+    if data.get("last_products_token"):
+        try:
+            shown_ids = dict.fromkeys(decode_id_token(data["last_products_token"]))
+        except ValueError as e:
+            logger.warning(f"last_products_token no válido: {e}")
+            raise HTTPException(status_code=400, detail="last_products_token no válido")
+    elif "last_products" in data:
+        shown_ids = dict.fromkeys(str(pid) for pid in data.get("last_products") or [])
+    else:
+        shown_ids = shown_products(session_data)
+    # Clientes que piden el historial compacto en lugar de la lista
+    compact_history = bool(data.get("compact_last_products") or data.get("last_products_token"))
+    
+    # 3. Normalizar consulta y extraer cantidad
+    requested_quantity, clean_query = extract_quantity_from_query(raw_query)
+    user_query = normalize_text(clean_query)
+    
+    # 4. Detectar si es una consulta de continuación
+    is_continuation = detect_continuation_query(user_query)
+    if is_continuation:
+        # Obtener el tipo de producto de la consulta anterior
+        last_product_type = get_last_product_type(session_data)
+        if last_product_type:
+            # Modificar la consulta para buscar el mismo tipo de producto
+            user_query = last_product_type
+            logger.info(f"Consulta de continuación detectada. Buscando más: {last_product_type}")
+    else:
+        # Consulta nueva: el cursor de resultados de la anterior ya no aplica
+        result_cursors.clear(session_data)
+    
+    query_type = detect_query_type(user_query)
+    
+    # Determinar el tipo de producto de manera más inteligente
+    product_type = None
+    if is_continuation:
+        # Si es continuación, usar el tipo de la consulta anterior
+        product_type = get_last_product_type(session_data)
+    else:
+        # Si no es continuación, buscar en la consulta actual
+        product_type = next((pt for pt in PRODUCT_TYPES if pt in user_query), None)
+    
+    logger.info(f"Búsqueda iniciada - Tipo: {query_type} | Original: '{raw_query}' | Normalizada: '{user_query}' | Continuación: {is_continuation} | Product Type: {product_type}")
+
+    # 5. Obtener datos
+    catalog = await load_catalog()
+    all_products = catalog["all_products"]
+    all_templates = catalog["all_templates"]
+    all_template_products = catalog["all_template_products"]
+    if set_catalog_version(catalog["catalog_version"]):
+        # Catálogo nuevo: las entradas de caché anteriores ya no sirven
+        schedule_retagging(all_products)
+        schedule_cache_warmup(catalog, "catalog_version")
+    
+    logger.info(f"Total productos obtenidos: {len(all_products)}")
+    logger.info(f"Total plantillas obtenidas: {len(all_templates)}")
+
+    return {
+        "raw_query": raw_query,
+        "session_id": session_id,
+        "session_data": session_data,
+        "shown_ids": shown_ids,
+        "compact_history": compact_history,
+        "requested_quantity": requested_quantity,
+        "user_query": user_query,
+        "is_continuation": is_continuation,
+        "query_type": query_type,
+        "product_type": product_type,
+        "all_products": all_products,
+        "all_templates": all_templates,
+        "all_template_products": all_template_products,
+        "catalog_version": catalog["catalog_version"],
+    }
+
+async def load_catalog() -> Dict:
+    """Productos, plantillas y productos de plantillas activos, con la versión de los productos"""
+    all_products = await get_all_products()
+    return {
+        "all_products": all_products,
+        "all_templates": await get_all_templates(),
+        "all_template_products": await get_all_template_products(),
+        # Se calcula una vez por carga y viaja con los productos a la búsqueda y al precalentado
+        "catalog_version": compute_catalog_version(all_products),
+    }
+
+async def warm_query(query: str, catalog: Dict):
+    """Ejecuta la búsqueda y el resumen de una consulta frecuente solo para poblar las cachés"""
+    requested_quantity, clean_query = extract_quantity_from_query(query)
+    user_query = normalize_text(clean_query)
+    ctx = {
+        "raw_query": query,
+        "shown_ids": {},
+        "requested_quantity": requested_quantity,
+        "user_query": user_query,
+        "is_continuation": False,
+        "query_type": detect_query_type(user_query),
+        "product_type": next((pt for pt in PRODUCT_TYPES if pt in user_query), None),
+        **catalog,
+    }
+    if is_template_query(ctx):
+        await ask_llama_for_template_recommendations(
+            catalog["all_templates"], catalog["all_template_products"], user_query
+        )
+        return
+    if product_analyzer.detect_ambiente(user_query):
+        return  # Se responde localmente, sin LLM
+    products = await find_products(ctx)
+    await ask_llama_summary_for_products(products)
+
+def schedule_cache_warmup(catalog: Dict, reason: str) -> bool:
+    """Lanza en segundo plano el precalentado con las consultas más frecuentes de los logs"""
+    if not WARMUP_ENABLED:
+        return False
+
+    def top_queries() -> List[str]:
+        # Se ejecuta en un hilo dentro de la ronda, no en la petición que la dispara
+        return [query for query, _ in mine_top_queries(recent_log_files(), skip=detect_continuation_query)]
+
+    return cache_warmer.schedule(top_queries, lambda query: warm_query(query, catalog), reason)
+
+def is_template_query(ctx: Dict) -> bool:
+    """6. Detectar si la consulta es sobre plantillas"""
+    template_keywords = ["plantilla", "diseño", "decoración", "estilo", "conjunto", "pack"]
+    return any(kw in ctx["user_query"] for kw in template_keywords)
+
+async def respond_with_templates(ctx: Dict) -> Dict:
+    """Respuesta completa para consultas de plantillas"""
+    requested_quantity = ctx["requested_quantity"]
+    all_template_products = ctx["all_template_products"]
+
+    # Buscar plantillas relevantes
+    matched_templates = await ask_llama_for_template_recommendations(
+        ctx["all_templates"],
+        all_template_products,
+        ctx["user_query"]
+    )
+    
+    # Limitar cantidad
+    available_quantity = min(requested_quantity, len(matched_templates))
+    templates_to_show = matched_templates[:available_quantity]
+
+    # Generar resumen usando all_products
+    response_text = ""
+    for template in templates_to_show:
+        template_summary = generate_template_summary(template, all_template_products, ctx["all_products"])
+        response_text += f"\n{template_summary}\n"
+
+    # Preparar mensaje de cantidad
+    quantity_message = ""
+    if available_quantity < requested_quantity:
+        if available_quantity == 0:
+            quantity_message = "\n\nLo siento, no encontré plantillas que coincidan con tu búsqueda."
+        elif available_quantity == 1:
+            quantity_message = f"\n\nSolo encontré 1 plantilla que coincide con tu búsqueda."
         else:
-            last_products = get_all_shown_products(session_data)
-        
-        # 3. Normalizar consulta y extraer cantidad
-        requested_quantity, clean_query = extract_quantity_from_query(raw_query)
-        user_query = normalize_text(clean_query)
-        
-        # 4. Detectar si es una consulta de continuación
-        is_continuation = detect_continuation_query(user_query)
-        if is_continuation:
-            # Obtener el tipo de producto de la consulta anterior
-            last_product_type = get_last_product_type(session_data)
-            if last_product_type:
-                # Modificar la consulta para buscar el mismo tipo de producto
-                user_query = last_product_type
-                logger.info(f"Consulta de continuación detectada. Buscando más: {last_product_type}")
-        
-        query_type = detect_query_type(user_query)
-        
-        # Determinar el tipo de producto de manera más inteligente
-        product_type = None
-        if is_continuation:
-            # Si es continuación, usar el tipo de la consulta anterior
-            product_type = get_last_product_type(session_data)
+            quantity_message = f"\n\nSolo encontré {available_quantity} plantillas que coinciden con tu búsqueda de {requested_quantity} solicitadas."
+
+    response_text += quantity_message
+
+    # Guardar en conversación
+    add_message_to_conversation(
+        ctx["session_data"], ctx["raw_query"], "template", 
+        product_type=ctx["product_type"],
+        response=response_text
+    )
+
+    return {
+        "response": response_text,
+        "templates": [{
+            "id": str(t.get("id")),
+            "name": t.get("name"),
+            "description": t.get("description"),
+            "room_type": t.get("room_type"),
+            "style": t.get("style"),
+            "total_price": t.get("total_price"),
+            "discount": t.get("discount")
+        } for t in templates_to_show],
+        "query_type": "template",
+        "requested_quantity": requested_quantity,
+        "available_quantity": available_quantity,
+        "session_id": ctx["session_id"]
+    }
+
+def respond_with_ambiente(ctx: Dict, ambiente: str) -> Dict:
+    """7. Respuesta completa cuando se detecta un ambiente"""
+    shown_ids = ctx["shown_ids"]
+    requested_quantity = ctx["requested_quantity"]
+
+    productos_agrupados = product_analyzer.analizar_productos(ctx["all_products"], ambiente)
+    response_text = product_analyzer.generar_resumen(productos_agrupados, ambiente)
+    
+    # Preparar lista plana de productos para la respuesta
+    productos_planos = []
+    for categoria, productos in productos_agrupados.items():
+        productos_planos.extend(productos)
+    
+    # Filtrar productos ya mostrados
+    productos_planos = [p for p in productos_planos if str(p.get("id")) not in shown_ids]
+    
+    # Limitar a la cantidad solicitada
+    productos_planos = productos_planos[:requested_quantity]
+    
+    response_text += build_quantity_message(len(productos_planos), requested_quantity)
+    
+    return finish_product_response(ctx, productos_planos, response_text)
+
+async def find_products(ctx: Dict) -> List[dict]:
+    """8. Búsqueda normal de productos; retorna los productos a mostrar"""
+    all_products = ctx["all_products"]
+    user_query = ctx["user_query"]
+    query_type = ctx["query_type"]
+    product_type = ctx["product_type"]
+    session_data = ctx.get("session_data")
+    catalog_version = ctx["catalog_version"]
+
+    # "tienes más ejemplos?": siguiente página de la búsqueda anterior, sin volver a buscar
+    if ctx["is_continuation"] and session_data is not None:
+        page = result_cursors.next_page(session_data, catalog_version, ctx["shown_ids"], ctx["requested_quantity"])
+        if page is not None:
+            logger.info(f"Continuación servida desde el cursor de resultados: {len(page)} productos")
+            return result_cursors.products_for(page, all_products, catalog_version)
+
+    matched_products = []
+    try:
+        if query_type == "attributes":
+            logger.info("Iniciando búsqueda por atributos")
+            matched_products = await ask_llama_for_attributes_query(all_products, user_query, catalog_version)
+            logger.info(f"Búsqueda por atributos completada: {len(matched_products)} productos encontrados")
         else:
-            # Si no es continuación, buscar en la consulta actual
-            product_type = next((pt for pt in PRODUCT_TYPES if pt in user_query), None)
-        
-        logger.info(f"Búsqueda iniciada - Tipo: {query_type} | Original: '{raw_query}' | Normalizada: '{user_query}' | Continuación: {is_continuation} | Product Type: {product_type}")
-
-        # 5. Obtener datos
-        all_products = await get_all_products()
-        all_templates = await get_all_templates()
-        all_template_products = await get_all_template_products()
-        
-        logger.info(f"Total productos obtenidos: {len(all_products)}")
-        logger.info(f"Total plantillas obtenidas: {len(all_templates)}")
-
-        # 6. Detectar si la consulta es sobre plantillas
-        template_keywords = ["plantilla", "diseño", "decoración", "estilo", "conjunto", "pack"]
-        is_template_query = any(kw in user_query for kw in template_keywords)
-
-        if is_template_query:
-            # Buscar plantillas relevantes
-            matched_templates = await ask_llama_for_template_recommendations(
-                all_templates,
-                all_template_products,
-                user_query
-            )
-            
-            # Limitar cantidad
-            available_quantity = min(requested_quantity, len(matched_templates))
-            templates_to_show = matched_templates[:available_quantity]
-
-            # Generar resumen usando all_products
-            response_text = ""
-            for template in templates_to_show:
-                template_summary = generate_template_summary(template, all_template_products, all_products)
-                response_text += f"\n{template_summary}\n"
-
-            # Preparar mensaje de cantidad
-            quantity_message = ""
-            if available_quantity < requested_quantity:
-                if available_quantity == 0:
-                    quantity_message = "\n\nLo siento, no encontré plantillas que coincidan con tu búsqueda."
-                elif available_quantity == 1:
-                    quantity_message = f"\n\nSolo encontré 1 plantilla que coincide con tu búsqueda."
-                else:
-                    quantity_message = f"\n\nSolo encontré {available_quantity} plantillas que coinciden con tu búsqueda de {requested_quantity} solicitadas."
-
-            response_text += quantity_message
-
-            # Guardar en conversación
-            add_message_to_conversation(
-                session_data, raw_query, "template", 
-                product_type=product_type,
-                response=response_text
-            )
-
-            return {
-                "response": response_text,
-                "templates": [{
-                    "id": str(t.get("id")),
-                    "name": t.get("name"),
-                    "description": t.get("description"),
-                    "room_type": t.get("room_type"),
-                    "style": t.get("style"),
-                    "total_price": t.get("total_price"),
-                    "discount": t.get("discount")
-                } for t in templates_to_show],
-                "query_type": "template",
-                "requested_quantity": requested_quantity,
-                "available_quantity": available_quantity,
-                "session_id": session_id
-            }
-
-        # 7. Si no es consulta de plantillas, continuar con búsqueda normal de productos
-        # Detectar ambiente y analizar productos
-        ambiente = product_analyzer.detect_ambiente(user_query)
-        if ambiente:
-            productos_agrupados = product_analyzer.analizar_productos(all_products, ambiente)
-            response_text = product_analyzer.generar_resumen(productos_agrupados, ambiente)
-            
-            # Preparar lista plana de productos para la respuesta
-            productos_planos = []
-            for categoria, productos in productos_agrupados.items():
-                productos_planos.extend(productos)
-            
-            # Filtrar productos ya mostrados
-            productos_planos = [p for p in productos_planos if str(p.get("id")) not in last_products]
-            
-            # Limitar a la cantidad solicitada
-            productos_planos = productos_planos[:requested_quantity]
-            
-            # Preparar mensaje de cantidad
-            quantity_message = ""
-            if len(productos_planos) < requested_quantity:
-                if len(productos_planos) == 0:
-                    quantity_message = "\n\nLo siento, no encontré más productos que coincidan con tu búsqueda."
-                elif len(productos_planos) == 1:
-                    quantity_message = f"\n\nSolo encontré 1 producto más que coincide con tu búsqueda."
-                else:
-                    quantity_message = f"\n\nSolo encontré {len(productos_planos)} productos más que coinciden con tu búsqueda de {requested_quantity} solicitados."
-            
-            response_text += quantity_message
-            
-            # Actualizar lista de productos mostrados
-            productos_mostrados = last_products + [str(p.get("id")) for p in productos_planos]
-            
-            # Guardar en conversación
-            add_message_to_conversation(
-                session_data, raw_query, query_type, 
-                product_type=product_type,
-                products_shown=[str(p.get("id")) for p in productos_planos],
-                response=response_text
-            )
-            
-            return {
-                "response": response_text,
-                "products": [{
-                    "id": str(p.get("id")),
-                    "sku": p.get("sku"),
-                    "slug": p.get("slug"),
-                    "name": p.get("product_name"),
-                    "description": p.get("description")
-                } for p in productos_planos],
-                "query_type": query_type,
-                "mentioned_product_type": product_type,
-                "requested_quantity": requested_quantity,
-                "available_quantity": len(productos_planos),
-                "session_id": session_id,
-                "last_products": productos_mostrados
-            }
-
-        # 8. Si no se detectó ambiente, usar búsqueda normal
-        matched_products = []
-        try:
-            if query_type == "attributes":
-                logger.info("Iniciando búsqueda por atributos")
-                matched_products = await ask_llama_for_attributes_query(all_products, user_query)
-                logger.info(f"Búsqueda por atributos completada: {len(matched_products)} productos encontrados")
-            else:
-                # Si es una consulta de continuación y el query está vacío, buscar por tipo de producto
-                if is_continuation and (not user_query.strip() or user_query.strip().isdigit()):
-                    logger.info("Consulta de continuación con query vacío, buscando por tipo de producto")
-                    if product_type:
-                        matched_products = await search_products_by_type(all_products, product_type)
-                        logger.info(f"Búsqueda por tipo '{product_type}' completada: {len(matched_products)} productos encontrados")
-                else:
-                    # Búsqueda por texto
-                    logger.info("Iniciando búsqueda por texto")
-                    matched_products = await search_products_by_query(all_products, user_query)
-                    
-                    # Si no hay resultados, intentar búsqueda semántica
-                    if not matched_products:
-                        logger.info("Iniciando búsqueda semántica")
-                        product_names = await ask_llama_for_products(all_products, user_query)
-                        matched_products = [
-                            p for p in all_products 
-                            if normalize_text(p.get('product_name', '')) in 
-                            [normalize_text(n) for n in product_names]
-                        ]
-                        logger.info(f"Búsqueda semántica completada: {len(matched_products)} productos encontrados")
-                    
-                    # Si aún no hay resultados, buscar por estilo
-                    if not matched_products:
-                        logger.info("Iniciando búsqueda por estilo")
-                        style_products = await ask_llama_for_style_recommendations(all_products, user_query)
-                        matched_products = [
-                            p for p in all_products 
-                            if p['product_name'] in style_products
-                        ]
-                        logger.info(f"Búsqueda por estilo completada: {len(matched_products)} productos encontrados")
-        except Exception as e:
-            logger.error(f"Error en búsqueda principal: {str(e)}")
-            raise ProductSearchError("Error al buscar productos")
-
-        # Filtrar productos ya mostrados
-        matched_products = [p for p in matched_products if str(p.get("id")) not in last_products]
-
-        # 9. Limitar y responder
-        available_quantity = min(requested_quantity, len(matched_products))
-        products_to_show = matched_products[:available_quantity]
-
-        # Preparar mensaje de cantidad
-        quantity_message = ""
-        if available_quantity < requested_quantity:
-            if available_quantity == 0:
-                quantity_message = "\n\nLo siento, no encontré más productos que coincidan con tu búsqueda."
-            elif available_quantity == 1:
-                quantity_message = f"\n\nSolo encontré 1 producto más que coincide con tu búsqueda."
+            # Si es una consulta de continuación y el query está vacío, buscar por tipo de producto
+            if ctx["is_continuation"] and (not user_query.strip() or user_query.strip().isdigit()):
+                logger.info("Consulta de continuación con query vacío, buscando por tipo de producto")
+                if product_type:
+                    matched_products = await search_products_by_type(all_products, product_type)
+                    logger.info(f"Búsqueda por tipo '{product_type}' completada: {len(matched_products)} productos encontrados")
             else:
-                quantity_message = f"\n\nSolo encontré {available_quantity} productos más que coinciden con tu búsqueda de {requested_quantity} solicitados."
-
-        response_text = await ask_llama_summary_for_products(products_to_show) + quantity_message
-        logger.info(f"Búsqueda exitosa - {len(products_to_show)} productos mostrados de {requested_quantity} solicitados")
-
-        # Actualizar lista de productos mostrados
-        productos_mostrados = last_products + [str(p.get("id")) for p in products_to_show]
-        
-        # Guardar en conversación
-        add_message_to_conversation(
-            session_data, raw_query, query_type, 
-            product_type=product_type,
-            products_shown=[str(p.get("id")) for p in products_to_show],
-            response=response_text
-        )
+                async def text_search():
+                    return await search_products_by_query(all_products, user_query)
+
+                async def semantic_search():
+                    product_names = {normalize_text(n) for n in await ask_llama_for_products(all_products, user_query, catalog_version)}
+                    return [
+                        p for p in all_products
+                        if normalize_text(p.get('product_name', '')) in product_names
+                    ]
+
+                async def style_search():
+                    style_products = await ask_llama_for_style_recommendations(all_products, user_query, catalog_version)
+                    return [
+                        p for p in all_products
+                        if p['product_name'] in style_products
+                    ]
+
+                # Texto, semántica y estilo en orden de prioridad (secuencial o especulativo)
+                strategy, matched_products = await search_runner.run([
+                    ("texto", text_search),
+                    ("semantica", semantic_search),
+                    ("estilo", style_search),
+                ])
+                logger.info(f"Estrategia de búsqueda ganadora: {strategy or 'ninguna'}")
+    except Exception as e:
+        logger.error(f"Error en búsqueda principal: {str(e)}")
+        raise ProductSearchError("Error al buscar productos")
+
+    # Filtrar productos ya mostrados
+    shown_ids = ctx["shown_ids"]
+    matched_products = [p for p in matched_products if str(p.get("id")) not in shown_ids]
+
+    # 9. Limitar
+    products_to_show = matched_products[:ctx["requested_quantity"]]
+    if session_data is not None:
+        # El resto de la lista queda para las continuaciones
+        result_cursors.store(session_data, user_query, catalog_version,
+                             (p.get("id") for p in matched_products), len(products_to_show))
+    return products_to_show
+
+def finish_product_response(ctx: Dict, products_to_show: List[dict], response_text: Optional[str],
+                            summary_id: Optional[str] = None) -> Dict:
+    """Guarda el mensaje en la conversación y arma la respuesta de productos"""
+    # Actualizar lista de productos mostrados
+    productos_mostrados = list(ctx["shown_ids"]) + [str(p.get("id")) for p in products_to_show]
+    
+    # Guardar en conversación
+    add_message_to_conversation(
+        ctx["session_data"], ctx["raw_query"], ctx["query_type"], 
+        product_type=ctx["product_type"],
+        products_shown=[str(p.get("id")) for p in products_to_show],
+        response=response_text,
+        summary_id=summary_id
+    )
+
+    result = {
+        "response": response_text,
+        "products": [serialize_product(p) for p in products_to_show],
+        "query_type": ctx["query_type"],
+        "mentioned_product_type": ctx["product_type"],
+        "requested_quantity": ctx["requested_quantity"],
+        "available_quantity": len(products_to_show),
+        "session_id": ctx["session_id"],
+        "last_products": productos_mostrados
+    }
+    if ctx.get("compact_history"):
+        # Token en lugar de la lista (si algún ID no es numérico, se mantiene la lista)
+        token = encode_id_token(productos_mostrados)
+        if token is not None:
+            del result["last_products"]
+            result["last_products_token"] = token
+    return result
+
+async def prefetched_summary(ctx: Dict, products_to_show: List[dict]) -> Optional[str]:
+    """Resumen precalculado de esta página si la consulta es una continuación; None si no lo hay"""
+    if not ctx["is_continuation"]:
+        return None
+    return await page_prefetcher.take(
+        ctx["session_id"], [str(p.get("id")) for p in products_to_show], ctx["catalog_version"]
+    )
 
-        return {
-            "response": response_text,
-            "products": [{
-                "id": str(p.get("id")),
-                "sku": p.get("sku"),
-                "slug": p.get("slug"),
-                "name": p.get("product_name"),
-                "description": p.get("description")
-            } for p in products_to_show],
-            "query_type": query_type,
-            "mentioned_product_type": product_type,
-            "requested_quantity": requested_quantity,
-            "available_quantity": available_quantity,
-            "session_id": session_id,
-            "last_products": productos_mostrados
-        }
+def schedule_page_prefetch(ctx: Dict):
+    """Precalcula en segundo plano la siguiente página y su resumen (para la próxima continuación)"""
+    if not PREFETCH_ENABLED:
+        return
+    catalog_version = ctx["catalog_version"]
+    next_ids = result_cursors.peek(ctx["session_data"], catalog_version, ctx["shown_ids"], ctx["requested_quantity"])
+    if not next_ids:
+        return
+    next_products = result_cursors.products_for(next_ids, ctx["all_products"], catalog_version)
+    page_prefetcher.schedule(
+        ctx["session_id"], next_ids, catalog_version,
+        lambda: ask_llama_summary_for_products(next_products)
+    )
 
+async def run_chat(data: Dict, ctx: Dict) -> Dict:
+    """Resuelve una consulta ya preparada y arma la respuesta de /chat"""
+    if is_template_query(ctx):
+        return await respond_with_templates(ctx)
+
+    # 7. Si no es consulta de plantillas, continuar con búsqueda normal de productos
+    # Detectar ambiente y analizar productos
+    ambiente = product_analyzer.detect_ambiente(ctx["user_query"])
+    if ambiente:
+        return respond_with_ambiente(ctx, ambiente)
+
+    # 8. Si no se detectó ambiente, usar búsqueda normal
+    products_to_show = await find_products(ctx)
+    quantity_message = build_quantity_message(len(products_to_show), ctx["requested_quantity"])
+
+    if data.get("summary_mode") == "async":
+        # Respuesta en dos fases: productos ya, resumen en /chat/summary/{summary_id}
+        summary_id = uuid.uuid4().hex
+        session_id = ctx["session_id"]
+
+        async def generate_summary() -> str:
+            # El resumen diferido no está atado al presupuesto de la petición original
+            use_deadline(None)
+            summary = await prefetched_summary(ctx, products_to_show)
+            if summary is None:
+                summary = await ask_llama_summary_for_products(products_to_show)
+            text = summary + quantity_message
+            await attach_summary_to_conversation(session_id, summary_id, text)
+            return text
+
+        result = finish_product_response(ctx, products_to_show, None, summary_id=summary_id)
+        summary_jobs.submit(summary_id, generate_summary)
+        schedule_page_prefetch(ctx)
+        logger.info(f"Búsqueda exitosa - {len(products_to_show)} productos mostrados de {ctx['requested_quantity']} solicitados (resumen diferido)")
+        return {**result, "summary_id": summary_id, "summary_status": "pending"}
+
+    summary = await prefetched_summary(ctx, products_to_show)
+    if summary is None:
+        summary = await ask_llama_summary_for_products(products_to_show)
+    response_text = summary + quantity_message
+    logger.info(f"Búsqueda exitosa - {len(products_to_show)} productos mostrados de {ctx['requested_quantity']} solicitados")
+
+    result = finish_product_response(ctx, products_to_show, response_text)
+    schedule_page_prefetch(ctx)
+    return result
+
+@app.post("/chat")
+async def chat(request: Request):
+    try:
+        data = await request.json()
+        # Presupuesto de tiempo compartido por la búsqueda y todas las llamadas al LLM
+        deadline = start_deadline(request_budget(data))
+        ctx = await prepare_chat(data)
+
+        result = await run_chat(data, ctx)
+        await session_cache.commit(ctx["session_id"])
+        # partial=True: alguna etapa se omitió por falta de tiempo y se devuelve lo mejor disponible
+        result["partial"] = deadline.exhausted
+        if deadline.exhausted:
+            logger.warning(f"Respuesta parcial por presupuesto agotado: {deadline.exhausted_stages}")
+        return result
+
+    except HTTPException:
+        raise
     except ProductSearchError as e:
         logger.error(f"Error en búsqueda de productos: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -503,6 +691,84 @@ async def chat(request: Request):
         logger.error(f"Error inesperado en /chat: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error al procesar tu solicitud")
 
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """
+    Igual que /chat pero en Server-Sent Events: primero los productos, luego
+    el resumen token a token y al final un evento con la sesión actualizada.
+    """
+    data = await request.json()
+    deadline = start_deadline(request_budget(data))
+    ctx = await prepare_chat(data)
+
+    async def event_stream():
+        use_deadline(deadline)
+        try:
+            ambiente = product_analyzer.detect_ambiente(ctx["user_query"])
+            if is_template_query(ctx) or ambiente:
+                # Estas rutas no usan el resumen del LLM: se envían completas
+                if is_template_query(ctx):
+                    result = await respond_with_templates(ctx)
+                else:
+                    result = respond_with_ambiente(ctx, ambiente)
+                items_key = "templates" if "templates" in result else "products"
+                await session_cache.commit(ctx["session_id"])
+                yield format_sse("products", {items_key: result[items_key], "query_type": result["query_type"]})
+                yield format_sse("token", {"text": result["response"]})
+                yield format_sse("done", {
+                    **{k: v for k, v in result.items() if k not in ("response", items_key)},
+                    "partial": deadline.exhausted
+                })
+                return
+
+            products_to_show = await find_products(ctx)
+            yield format_sse("products", {
+                "products": [serialize_product(p) for p in products_to_show],
+                "query_type": ctx["query_type"]
+            })
+
+            parts = []
+            prefetched = await prefetched_summary(ctx, products_to_show)
+            if prefetched is not None:
+                parts.append(prefetched)
+                yield format_sse("token", {"text": prefetched})
+            else:
+                async for chunk in stream_summary_for_products(products_to_show):
+                    parts.append(chunk)
+                    yield format_sse("token", {"text": chunk})
+
+            quantity_message = build_quantity_message(len(products_to_show), ctx["requested_quantity"])
+            if quantity_message:
+                parts.append(quantity_message)
+                yield format_sse("token", {"text": quantity_message})
+
+            # La conversación se guarda solo cuando el resumen terminó
+            result = finish_product_response(ctx, products_to_show, "".join(parts))
+            schedule_page_prefetch(ctx)
+            await session_cache.commit(ctx["session_id"])
+            logger.info(f"Búsqueda exitosa (stream) - {len(products_to_show)} productos mostrados de {ctx['requested_quantity']} solicitados")
+            yield format_sse("done", {
+                **{k: v for k, v in result.items() if k not in ("response", "products")},
+                "partial": deadline.exhausted
+            })
+        except Exception as e:
+            logger.error(f"Error inesperado en /chat/stream: {str(e)}", exc_info=True)
+            yield format_sse("error", {"detail": "Error al procesar tu solicitud"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/chat/summary/{summary_id}")
+async def chat_summary(summary_id: str, wait: float = 0):
+    """Resumen de una respuesta en dos fases; `wait` espera hasta N segundos a que esté listo"""
+    summary = await summary_jobs.get(summary_id, wait=wait)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Resumen no encontrado o expirado")
+    return summary
+
 @app.get("/health")
 async def health_check():
     """Endpoint de health check para verificar que la API está funcionando"""
@@ -512,6 +778,29 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas internas de la API"""
+    return {
+        "llm_cache": llm_cache.stats(),
+        "llm_singleflight": llm_singleflight.stats(),
+        "groq_rate_limiter": groq_rate_limiter.stats(),
+        "summary_jobs": summary_jobs.stats(),
+        "llm_circuit_breaker": llm_breaker.stats(),
+        "search_strategies": search_runner.stats(),
+        "enrichment_store": enrichment_store.stats(),
+        "style_index": style_index.stats(),
+        "product_copy": product_copy_index.stats(),
+        "llm_backend": llm_backend.describe(),
+        "llm_calls": llm_accounting.stats(),
+        "cache_warmup": cache_warmer.stats(),
+        "conversation_store": conversation_store.stats(),
+        "session_cache": session_cache.stats(),
+        "session_janitor": session_janitor.stats(),
+        "result_cursors": result_cursors.stats(),
+        "page_prefetch": page_prefetcher.stats()
+    }
+
 @app.get("/")
 async def root():
     """Endpoint raíz con información de la API"""
@@ -520,42 +809,21 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "chat": "/chat - POST - Búsqueda de productos y plantillas",
-            "health": "/health - GET - Estado de la API"
+            "chat_stream": "/chat/stream - POST - Búsqueda con resumen en streaming (SSE)",
+            "chat_summary": "/chat/summary/{summary_id} - GET - Resumen diferido (summary_mode=async)",
+            "health": "/health - GET - Estado de la API",
+            "metrics": "/metrics - GET - Métricas internas"
         },
         "documentation": "/docs - Documentación automática de la API"
     }
 
-def load_conversation(session_id: str) -> Dict:
-    """Carga la conversación de una sesión desde archivo"""
-    try:
-        file_path = os.path.join(CONVERSATIONS_DIR, f"{session_id}.json")
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"Error al cargar conversación {session_id}: {e}")
-    return {
-        "session_id": session_id,
-        "created_at": datetime.now().isoformat(),
-        "last_updated": datetime.now().isoformat(),
-        "conversation": []
-    }
-
-def save_conversation(session_data: Dict):
-    """Guarda la conversación de una sesión en archivo"""
-    try:
-        session_id = session_data["session_id"]
-        session_data["last_updated"] = datetime.now().isoformat()
-        file_path = os.path.join(CONVERSATIONS_DIR, f"{session_id}.json")
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Error al guardar conversación {session_data.get('session_id')}: {e}")
+async def load_conversation(session_id: str) -> Dict:
+    """Carga la conversación de una sesión (de memoria o, si no está, fuera del event loop)"""
+    return await session_cache.load(session_id)
 
 def add_message_to_conversation(session_data: Dict, user_message: str, query_type: str, 
                                product_type: str = None, products_shown: List[str] = None, 
-                               response: str = None):
+                               response: str = None, summary_id: str = None):
     """Agrega un mensaje a la conversación"""
     # Determinar si es una consulta de continuación
     is_continuation = detect_continuation_query(user_message)
@@ -568,8 +836,19 @@ def add_message_to_conversation(session_data: Dict, user_message: str, query_typ
         "products_shown": products_shown or [],
         "response": response
     }
-    session_data["conversation"].append(message)
-    save_conversation(session_data)
+    if summary_id:
+        message["summary_id"] = summary_id
+    # Se escribe en segundo plano (write-behind); con un almacén compartido la respuesta
+    # espera a que esté escrita (ver SessionCache.commit)
+    session_cache.append_message(session_data, message)
+
+async def attach_summary_to_conversation(session_id: str, summary_id: str, response: str):
+    """Completa la respuesta de un mensaje cuyo resumen se generó en segundo plano"""
+    if not await session_cache.set_response(session_id, summary_id, response):
+        logger.warning(f"Mensaje con resumen {summary_id} no encontrado en la sesión {session_id}")
+        return
+    # El resumen se publica en /chat/summary cuando ya está en el almacén
+    await session_cache.commit(session_id)
 
 def detect_continuation_query(user_query: str) -> bool:
     """Detecta si la consulta es una continuación de la conversación anterior"""
@@ -625,113 +904,12 @@ def get_last_product_type(session_data: Dict) -> Optional[str]:
         if message.get("product_type"):
             return message["product_type"]
     
-    return None
-
-def cleanup_old_conversations():
-    """Limpia conversaciones antiguas y excesivas"""
-    try:
-        current_time = datetime.now()
-        deleted_count = 0
-        total_size = 0
-        
-        # Obtener todos los archivos de conversación
-        conversation_files = glob.glob(os.path.join(CONVERSATIONS_DIR, "*.json"))
-        
-        for file_path in conversation_files:
-            try:
-                # Verificar edad del archivo
-                file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                age_seconds = (current_time - file_time).total_seconds()
-                
-                # Borrar si es muy antiguo
-                if age_seconds > SESSION_MAX_AGE:
-                    os.remove(file_path)
-                    deleted_count += 1
-                    logger.info(f"Conversación eliminada por edad: {os.path.basename(file_path)}")
-                    continue
-                
-                # Calcular tamaño total
-                total_size += os.path.getsize(file_path)
-                
-            except Exception as e:
-                logger.error(f"Error procesando archivo {file_path}: {e}")
-        
-        # Si hay demasiados archivos, borrar los más antiguos
-        if len(conversation_files) > MAX_SESSIONS:
-            files_with_time = []
-            for file_path in conversation_files:
-                try:
-                    file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    files_with_time.append((file_path, file_time))
-                except:
-                    continue
-            
-            # Ordenar por tiempo y borrar los más antiguos
-            files_with_time.sort(key=lambda x: x[1])
-            files_to_delete = files_with_time[:len(files_with_time) - MAX_SESSIONS]
-            
-            for file_path, _ in files_to_delete:
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                    logger.info(f"Conversación eliminada por límite: {os.path.basename(file_path)}")
-                except Exception as e:
-                    logger.error(f"Error eliminando archivo {file_path}: {e}")
-        
-        # Si el tamaño total es muy grande, borrar archivos antiguos
-        total_size_mb = total_size / (1024 * 1024)
-        if total_size_mb > MAX_CONVERSATIONS_SIZE_MB:
-            files_with_time = []
-            for file_path in conversation_files:
-                try:
-                    file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    files_with_time.append((file_path, file_time))
-                except:
-                    continue
-            
-            files_with_time.sort(key=lambda x: x[1])
-            target_size = MAX_CONVERSATIONS_SIZE_MB * 0.7  # Reducir al 70%
-            
-            for file_path, _ in files_with_time:
-                if total_size_mb <= target_size:
-                    break
-                try:
-                    file_size = os.path.getsize(file_path)
-                    os.remove(file_path)
-                    total_size_mb -= file_size / (1024 * 1024)
-                    deleted_count += 1
-                    logger.info(f"Conversación eliminada por tamaño: {os.path.basename(file_path)}")
-                except Exception as e:
-                    logger.error(f"Error eliminando archivo {file_path}: {e}")
-        
-        if deleted_count > 0:
-            logger.info(f"Limpieza completada: {deleted_count} conversaciones eliminadas")
-            
-    except Exception as e:
-        logger.error(f"Error en limpieza de conversaciones: {e}")
-
-def start_cleanup_scheduler():
-    """Inicia el programador de limpieza automática"""
-    def cleanup_loop():
-        while True:
-            try:
-                cleanup_old_conversations()
-                time.sleep(CLEANUP_INTERVAL)
-            except Exception as e:
-                logger.error(f"Error en loop de limpieza: {e}")
-                time.sleep(60)  # Esperar 1 minuto antes de reintentar
-    
-    cleanup_thread = threading.Thread(target=cleanup_loop, daemon=True)
-    cleanup_thread.start()
-    logger.info("Programador de limpieza automática iniciado")
+    # Mensajes antiguos ya resumidos por la política de historial
+    return session_data.get(HISTORY_KEY, {}).get("last_product_type")
 
 def get_all_shown_products(session_data: dict) -> list:
     """Devuelve una lista de todos los IDs de productos ya mostrados en la conversación."""
-    shown = []
-    for message in session_data.get("conversation", []):
-        shown.extend([str(pid) for pid in message.get("products_shown", [])])
-    # Elimina duplicados manteniendo el orden
-    return list(dict.fromkeys(shown))
+    return list(shown_products(session_data))
 
 if __name__ == "__main__":
     asyncio.run(main())
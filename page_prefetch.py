@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from deadline import use_deadline
+from rate_limiter import groq_rate_limiter
+
+logger = logging.getLogger('page_prefetch')
+
+# Precálculo de la siguiente página (y su resumen) para las continuaciones
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))  # Precálculos simultáneos por worker
+PREFETCH_MAX_ENTRIES = int(os.getenv("PREFETCH_MAX_ENTRIES", "200"))  # Páginas guardadas por worker
+PREFETCH_TTL = int(os.getenv("PREFETCH_TTL", str(10 * 60)))  # Segundos
+# Solo se precalcula mientras el limitador de GROQ tenga al menos esta fracción libre
+PREFETCH_MIN_HEADROOM = float(os.getenv("PREFETCH_MIN_HEADROOM", "0.5"))
+
+
+class PrefetchedPage:
+    """Página precalculada para la próxima continuación de una sesión"""
+
+    def __init__(self, product_ids: List[str], catalog_version: str):
+        self.product_ids = product_ids
+        self.catalog_version = catalog_version
+        self.created_at = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self.duration = 0.0
+
+
+class PagePrefetcher:
+    """
+    Calcula en segundo plano el resumen de la siguiente página de cada sesión.
+    Cuenta como desperdicio todo precálculo que se descarta sin usarse.
+    """
+
+    def __init__(self, concurrency: int = PREFETCH_CONCURRENCY, max_entries: int = PREFETCH_MAX_ENTRIES,
+                 ttl: float = PREFETCH_TTL, min_headroom: float = PREFETCH_MIN_HEADROOM,
+                 headroom: Callable[[], float] = groq_rate_limiter.headroom):
+        self.concurrency = max(1, concurrency)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_headroom = min_headroom
+        self._headroom = headroom
+        self._pages: "OrderedDict[str, PrefetchedPage]" = OrderedDict()
+        self._active = 0
+        self._counters = {"scheduled": 0, "hits": 0, "inflight_hits": 0, "misses": 0, "wasted": 0,
+                          "failed": 0, "skipped_budget": 0, "skipped_headroom": 0}
+        self._wasted_seconds = 0.0
+
+    def schedule(self, session_id: str, product_ids: List[str], catalog_version: str,
+                 compute: Callable[[], Awaitable[str]]) -> bool:
+        """Lanza el precálculo si hay presupuesto; reemplaza el anterior de la sesión"""
+        if not product_ids:
+            return False
+        if self._active >= self.concurrency:
+            self._counters["skipped_budget"] += 1
+            return False
+        if self._headroom() < self.min_headroom:
+            self._counters["skipped_headroom"] += 1
+            return False
+
+        self._discard(session_id)
+        page = PrefetchedPage(list(product_ids), catalog_version)
+        self._active += 1
+        page.task = asyncio.create_task(self._run(page, compute))
+        page.task.add_done_callback(self._release)
+        self._pages[session_id] = page
+        self._counters["scheduled"] += 1
+        while len(self._pages) > self.max_entries:
+            self._discard(next(iter(self._pages)))
+        return True
+
+    async def _run(self, page: PrefetchedPage, compute: Callable[[], Awaitable[str]]) -> Optional[str]:
+        # El precálculo no pertenece a ninguna petición: sin presupuesto de tiempo heredado
+        use_deadline(None)
+        started = time.monotonic()
+        try:
+            return await compute()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Error precalculando la siguiente página: {e}")
+            self._counters["failed"] += 1
+            return None
+        finally:
+            page.duration = time.monotonic() - started
+
+    def _release(self, task: asyncio.Task):
+        self._active -= 1
+
+    def _discard(self, session_id: str):
+        page = self._pages.pop(session_id, None)
+        if page is None:
+            return
+        self._counters["wasted"] += 1
+        if page.task is not None and not page.task.done():
+            page.task.cancel()
+            page.duration = time.monotonic() - page.created_at
+        self._wasted_seconds += page.duration
+
+    async def take(self, session_id: str, product_ids: List[str], catalog_version: str) -> Optional[str]:
+        """Resumen precalculado de esta página; None si no hay uno válido para ella"""
+        page = self._pages.get(session_id)
+        if (page is None or page.product_ids != list(product_ids) or page.catalog_version != catalog_version
+                or time.monotonic() - page.created_at > self.ttl):
+            self._counters["misses"] += 1
+            self._discard(session_id)
+            return None
+        del self._pages[session_id]
+        if not page.task.done():
+            self._counters["inflight_hits"] += 1
+        try:
+            result = await asyncio.shield(page.task)
+        except asyncio.CancelledError:
+            if not page.task.cancelled():
+                raise
+            result = None
+        if result is None:
+            self._counters["misses"] += 1
+            return None
+        self._counters["hits"] += 1
+        return result
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            "wasted_seconds": round(self._wasted_seconds, 2),
+            "active": self._active,
+            "stored": len(self._pages),
+        }
+
+
+# Instancia compartida por el proceso
+page_prefetcher = PagePrefetcher()
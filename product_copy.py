@@ -0,0 +1,98 @@
+"""
+Textos de venta de un producto generados fuera de línea.
+
+Uso: python product_copy.py  (regenera solo los productos cuyos datos cambiaron)
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+from enrichment_store import (ENRICHMENT_CONCURRENCY, EnrichmentSnapshot, EnrichmentStore, enrichment_store,
+                              input_hash, run_enrichment)
+
+logger = logging.getLogger('product_copy')
+
+PRODUCT_COPY_KIND = "product_copy"
+PRODUCT_COPY_REFRESH = float(os.getenv("PRODUCT_COPY_REFRESH", "60"))  # Segundos entre recargas de los textos
+
+
+def copy_inputs(product: Dict) -> Dict:
+    """Campos del producto que determinan su texto de venta"""
+    return {
+        "name": product.get('product_name', ''),
+        "type": product.get('type', ''),
+        "description": product.get('description', ''),
+        "price": product.get('base_price', ''),
+        "stock_alert": bool(product.get('stock_alert')),
+        "sales_count": product.get('sales_count', 0),
+    }
+
+
+class ProductCopyIndex(EnrichmentSnapshot):
+    """
+    Textos de venta del almacén de enriquecimientos cargados en memoria, para no
+    consultar SQLite por cada producto desde el bucle de eventos.
+    """
+
+    kind = PRODUCT_COPY_KIND
+
+    def __init__(self, store: EnrichmentStore = enrichment_store, refresh_seconds: float = PRODUCT_COPY_REFRESH):
+        super().__init__(store, refresh_seconds)
+        self._counters.update({"hits": 0, "misses": 0, "stale": 0})
+
+    def get(self, product: Dict) -> Optional[str]:
+        """Texto guardado del producto; None si no existe o si sus datos cambiaron"""
+        entry = self._entries_now().get(str(product.get('id')))
+        if entry is None:
+            self._counters["misses"] += 1
+            return None
+        if entry[0] != input_hash(copy_inputs(product)):
+            self._counters["stale"] += 1
+            return None
+        self._counters["hits"] += 1
+        return entry[1]
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        return {**self._counters, "products": len(self._entries)}
+
+
+# Instancia compartida por el proceso
+product_copy_index = ProductCopyIndex()
+
+
+def get_product_blurb(product: Dict, index: ProductCopyIndex = product_copy_index) -> Optional[str]:
+    """Texto guardado del producto; None si no existe o si sus datos cambiaron"""
+    return index.get(product)
+
+
+async def generate_blurb(product: Dict) -> Optional[str]:
+    """Genera el texto de un producto con el mismo prompt del resumen en línea"""
+    from llama_utils import ask_llama, build_summary_prompt
+
+    response = (await ask_llama(build_summary_prompt([product]), use_cache=False, call_site="product_copy")).strip()
+    # "[]" es el respaldo de ask_llama cuando no hubo respuesta
+    return response if response and response != "[]" else None
+
+
+async def generate_catalog_copy(products, store: EnrichmentStore = enrichment_store, generate=generate_blurb,
+                                concurrency: int = ENRICHMENT_CONCURRENCY) -> Dict:
+    """Job por lotes: genera los textos faltantes u obsoletos del catálogo"""
+    # run_enrichment invalida los índices que leen de `store`
+    return await run_enrichment(PRODUCT_COPY_KIND, products, copy_inputs, generate,
+                                store=store, concurrency=concurrency)
+
+
+async def main():
+    from db import get_all_products
+
+    products = await get_all_products()
+    summary = await generate_catalog_copy(products)
+    print(f"Textos de producto: {summary}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from rate_limiter import estimate_tokens
+from text_utils import normalize_text
+
+logger = logging.getLogger('prompt_builder')
+
+# Tokens máximos dedicados a la lista de candidatos de cada prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+MAX_FIELD_CHARS = 120  # Recorte de textos largos (descripciones, notas)
+
+
+def compact_json(data: Any) -> str:
+    """JSON sin espacios ni escapes ASCII para ahorrar tokens"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def shorten(text: Any, max_chars: int = MAX_FIELD_CHARS) -> str:
+    """Recorta un texto a `max_chars` caracteres"""
+    text = ' '.join(str(text or '').split())
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '…'
+
+
+def lexical_score(query: str, text: str) -> float:
+    """Relevancia simple: palabras de la consulta presentes en el texto"""
+    normalized_text = normalize_text(text)
+    score = 0.0
+    for word in normalize_text(query).split():
+        if len(word) <= 2:
+            continue
+        if word in normalized_text:
+            score += 1.0
+        elif word.endswith('s') and word[:-1] in normalized_text:
+            score += 0.5
+    return score
+
+
+def encode_candidates(candidates: List[Dict], id_key: str = "id", token_budget: int = PROMPT_TOKEN_BUDGET,
+                      scores: Optional[List[float]] = None, prefix: str = "p") -> Tuple[str, Dict[str, Any]]:
+    """
+    Codifica candidatos en líneas JSON compactas con alias cortos (p1, p2, ...)
+    y los ajusta al presupuesto de tokens priorizando los más relevantes.
+
+    Retorna el bloque de texto y el mapa alias -> id original.
+    """
+    order = list(range(len(candidates)))
+    if scores is not None:
+        # sorted es estable: a igual puntuación se respeta el orden original
+        order.sort(key=lambda i: scores[i], reverse=True)
+
+    lines = []
+    aliases: Dict[str, Any] = {}
+    used_tokens = 0
+    for i in order:
+        candidate = candidates[i]
+        alias = f"{prefix}{len(aliases) + 1}"
+        row = {"k": alias}
+        row.update({k: v for k, v in candidate.items() if k != id_key and v not in (None, "", [], {})})
+        line = compact_json(row)
+        line_tokens = estimate_tokens(line)
+        if lines and used_tokens + line_tokens > token_budget:
+            break
+        lines.append(line)
+        aliases[alias] = candidate.get(id_key)
+        used_tokens += line_tokens
+
+    if len(lines) < len(candidates):
+        logger.info(f"Prompt recortado a {len(lines)} de {len(candidates)} candidatos (~{used_tokens} tokens)")
+    return "\n".join(lines), aliases
+
+
+def resolve_aliases(items: List[Any], aliases: Dict[str, Any]) -> List[Any]:
+    """Traduce los alias devueltos por el LLM a los ids originales (sin duplicados)"""
+    resolved = []
+    for item in items:
+        key = str(item).strip().lower()
+        if key in aliases and aliases[key] not in resolved:
+            resolved.append(aliases[key])
+    return resolved
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from typing import Callable, Dict, Mapping, Optional
+
+logger = logging.getLogger('rate_limiter')
+
+# Límites del lado del cliente (se ajustan con las cabeceras de GROQ)
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "6000"))
+GROQ_MAX_QUEUE = int(os.getenv("GROQ_MAX_QUEUE", "20"))  # Llamadas esperando turno
+GROQ_MAX_WAIT = float(os.getenv("GROQ_MAX_WAIT", "10"))  # Segundos máximos de espera
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+
+class RateLimitExceeded(Exception):
+    """La llamada no puede esperar su turno: usar respaldo sin LLM"""
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token)"""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Convierte duraciones de GROQ como '2m59.56s', '7.66s' o '120ms' a segundos"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    factors = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * factors[unit] for amount, unit in parts)
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Cubeta de tokens que se rellena de forma continua"""
+
+    def __init__(self, capacity: float, refill_per_second: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self._clock = clock
+        self._updated_at = clock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta que haya `amount` tokens disponibles"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.refill_per_second
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def set_capacity(self, capacity: float, window_seconds: float = 60.0):
+        self._refill()
+        self.capacity = capacity
+        self.refill_per_second = capacity / window_seconds
+        self.tokens = min(self.tokens, capacity)
+
+    def set_remaining(self, remaining: float):
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+
+class GroqRateLimiter:
+    """
+    Limitador de peticiones/minuto y tokens/minuto con cola de espera acotada.
+    Las cabeceras x-ratelimit-* y Retry-After de GROQ ajustan el estado.
+    """
+
+    def __init__(self, rpm: int = GROQ_RPM, tpm: int = GROQ_TPM, max_queue: int = GROQ_MAX_QUEUE,
+                 max_wait: float = GROQ_MAX_WAIT, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.requests = TokenBucket(rpm, rpm / 60.0, clock)
+        self.tokens = TokenBucket(tpm, tpm / 60.0, clock)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._blocked_until = 0.0
+        self._waiting = 0
+        self._counters = {
+            "acquired": 0,
+            "throttled": 0,
+            "rejected": 0,
+            "rate_limited_responses": 0,
+        }
+
+    def _wait_time(self, estimated_tokens: int) -> float:
+        blocked = max(0.0, self._blocked_until - self._clock())
+        return max(blocked, self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+
+    async def acquire(self, estimated_tokens: int, max_wait: Optional[float] = None):
+        """Espera turno o lanza RateLimitExceeded si la espera sería excesiva"""
+        max_wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        wait = self._wait_time(estimated_tokens)
+        if wait > 0:
+            if self._waiting >= self.max_queue or wait > max_wait:
+                self._counters["rejected"] += 1
+                raise RateLimitExceeded(
+                    f"espera estimada {wait:.1f}s, en cola {self._waiting}"
+                )
+            self._counters["throttled"] += 1
+            self._waiting += 1
+            try:
+                give_up_at = self._clock() + max_wait
+                while wait > 0:
+                    if self._clock() + wait > give_up_at:
+                        self._counters["rejected"] += 1
+                        raise RateLimitExceeded(f"espera estimada {wait:.1f}s excede el máximo")
+                    await asyncio.sleep(wait + random.uniform(0, 0.05))
+                    wait = self._wait_time(estimated_tokens)
+            finally:
+                self._waiting -= 1
+
+        self.requests.take(1)
+        self.tokens.take(estimated_tokens)
+        self._counters["acquired"] += 1
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Corrige la cubeta de tokens con el uso real informado por GROQ"""
+        if actual_tokens is None:
+            return
+        self.tokens.take(actual_tokens - estimated_tokens)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Ajusta los límites con las cabeceras x-ratelimit-* de la respuesta"""
+        try:
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            if limit_tokens:
+                self.tokens.set_capacity(float(limit_tokens))
+
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens is not None:
+                self.tokens.set_remaining(float(remaining_tokens))
+                if float(remaining_tokens) <= 0:
+                    self._block_for(parse_duration(headers.get("x-ratelimit-reset-tokens")))
+
+            # En GROQ el límite de peticiones es diario: solo se respeta el agotamiento
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            if remaining_requests is not None and float(remaining_requests) <= 0:
+                self.requests.set_remaining(0)
+                self._block_for(parse_duration(headers.get("x-ratelimit-reset-requests")))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Cabeceras de límite de GROQ no válidas: {e}")
+
+    def penalize(self, headers: Mapping[str, str], attempt: int) -> float:
+        """Registra un 429 y bloquea según Retry-After (o backoff con jitter)"""
+        self._counters["rate_limited_responses"] += 1
+        self.update_from_headers(headers)
+        retry_after = parse_duration(headers.get("retry-after")) or 0.0
+        delay = max(retry_after, backoff_delay(attempt))
+        self._block_for(delay)
+        return delay
+
+    def _block_for(self, seconds: Optional[float]):
+        if seconds:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    def headroom(self) -> float:
+        """Fracción disponible (0 a 1) del límite más ajustado; 0 mientras haya bloqueo"""
+        if self._blocked_until > self._clock():
+            return 0.0
+        self.requests._refill()
+        self.tokens._refill()
+        return max(0.0, min(
+            self.requests.tokens / self.requests.capacity if self.requests.capacity else 0.0,
+            self.tokens.tokens / self.tokens.capacity if self.tokens.capacity else 0.0,
+        ))
+
+    def stats(self) -> Dict:
+        """Estado del limitador para el endpoint de métricas"""
+        return {
+            **self._counters,
+            "waiting": self._waiting,
+            "requests_available": round(self.requests.tokens, 2),
+            "tokens_available": round(self.tokens.tokens, 2),
+            "tokens_per_minute": self.tokens.capacity,
+            "blocked_for_seconds": round(max(0.0, self._blocked_until - self._clock()), 2),
+        }
+
+
+# Instancia compartida por el proceso
+groq_rate_limiter = GroqRateLimiter()
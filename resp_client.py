@@ -0,0 +1,166 @@
+import socket
+import threading
+from typing import List, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+# Cliente mínimo del protocolo de Redis (RESP2), sin dependencias externas.
+
+
+class RespError(Exception):
+    """Error devuelto por el servidor (respuesta `-ERR ...`)"""
+    pass
+
+
+def _encode(command: Sequence) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, str):
+            data = arg.encode("utf-8")
+        else:
+            data = str(arg).encode("ascii")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    """Una respuesta completa; los errores del servidor se devuelven (no se lanzan) como RespError"""
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("El servidor cerró la conexión")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        return RespError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("El servidor cerró la conexión")
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count < 0:
+            return None
+        return [_read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"Respuesta RESP desconocida: {line[:40]!r}")
+
+
+class _Connection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """
+    Cliente bloqueante para Redis o servidores compatibles, pensado para usarse desde
+    un pool de hilos. `pipeline` manda todos los comandos juntos y lee todas las
+    respuestas: una sola ida y vuelta. Las conexiones inactivas se reutilizan.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 5.0, max_idle: int = 4):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"URL de Redis no soportada: {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: List[_Connection] = []
+        self._lock = threading.Lock()
+
+    @property
+    def address(self) -> str:
+        """Servidor y base, sin credenciales (para logs y métricas)"""
+        return f"{self.host}:{self.port}/{self.db}"
+
+    def _connect(self) -> _Connection:
+        conn = _Connection(socket.create_connection((self.host, self.port), timeout=self.timeout))
+        handshake = []
+        if self.password is not None:
+            handshake.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            handshake.append(("SELECT", self.db))
+        try:
+            if handshake:
+                conn.sock.sendall(b"".join(_encode(c) for c in handshake))
+                for _ in handshake:
+                    reply = _read_reply(conn.reader)
+                    if isinstance(reply, RespError):
+                        raise reply
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _acquire(self) -> Tuple[_Connection, bool]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, conn: _Connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def pipeline(self, commands: Sequence[Sequence]) -> List:
+        """
+        Ejecuta los comandos en una ida y vuelta y devuelve sus respuestas. Si una conexión
+        reutilizada resulta cerrada se reintenta una vez con otra: los comandos deben ser
+        idempotentes. Lanza RespError si alguna respuesta es un error.
+        """
+        payload = b"".join(_encode(c) for c in commands)
+        for attempt in range(2):
+            conn, reused = self._acquire()
+            try:
+                conn.sock.sendall(payload)
+                replies = [_read_reply(conn.reader) for _ in commands]
+            except (OSError, ValueError) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise ConnectionError(f"Error de conexión con Redis {self.address}: {e}") from e
+            self._release(conn)
+            for reply in replies:
+                if isinstance(reply, RespError):
+                    raise reply
+            return replies
+
+    def execute(self, *command):
+        return self.pipeline([command])[0]
+
+    def transaction(self, commands: Sequence[Sequence]) -> List:
+        """Los comandos dentro de MULTI/EXEC (atómicos) en una ida y vuelta; devuelve sus respuestas"""
+        result = self.pipeline([("MULTI",), *commands, ("EXEC",)])[-1]
+        if result is None:
+            raise RespError("Transacción abortada")
+        for reply in result:
+            if isinstance(reply, RespError):
+                raise reply
+        return result
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,113 @@
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Cursores de resultados: la lista ordenada de una búsqueda queda en la sesión
+# y "tienes más ejemplos?" pagina sobre ella sin volver a buscar
+RESULT_CURSOR_TTL = int(os.getenv("RESULT_CURSOR_TTL", str(30 * 60)))  # Segundos
+RESULT_CURSOR_MAX_IDS = int(os.getenv("RESULT_CURSOR_MAX_IDS", "200"))  # Resultados guardados por búsqueda
+CURSOR_KEY = "result_cursor"
+
+
+class ResultCursors:
+    """Crea y pagina el cursor de resultados de cada sesión (se guarda con la sesión)"""
+
+    def __init__(self, ttl: float = RESULT_CURSOR_TTL, max_ids: int = RESULT_CURSOR_MAX_IDS):
+        self.ttl = ttl
+        self.max_ids = max_ids
+        self._index_version: Optional[str] = None
+        self._index: Dict[str, Dict] = {}
+        self._counters = {"created": 0, "pages": 0, "expired": 0, "stale_catalog": 0, "missing": 0,
+                          "capped": 0}
+
+    def store(self, session_data: Dict, query: str, catalog_version: str,
+              ranked_ids: Iterable[str], served: int) -> Dict:
+        """Guarda los resultados ordenados de una búsqueda; los primeros `served` ya se mostraron"""
+        ids = [str(pid) for pid in ranked_ids]
+        cursor = {
+            "query": query,
+            "catalog_version": catalog_version,
+            "created_at": time.time(),
+            "ids": ids[:self.max_ids],
+            "offset": served,
+            # Hay más resultados que los guardados: al agotarse se vuelve a buscar
+            "truncated": len(ids) > self.max_ids,
+        }
+        session_data[CURSOR_KEY] = cursor
+        self._counters["created"] += 1
+        return cursor
+
+    def clear(self, session_data: Dict):
+        """Una consulta nueva invalida el cursor de la anterior"""
+        session_data.pop(CURSOR_KEY, None)
+
+    def next_page(self, session_data: Dict, catalog_version: str, shown, quantity: int,
+                  now: Optional[float] = None) -> Optional[List[str]]:
+        """
+        Siguientes `quantity` IDs no mostrados, avanzando el cursor. None si no hay
+        cursor válido (inexistente, vencido o de otra versión del catálogo) o si se
+        agotaron los resultados guardados y la búsqueda tenía más.
+        """
+        cursor = session_data.get(CURSOR_KEY)
+        if cursor is None:
+            self._counters["missing"] += 1
+            return None
+        if (now or time.time()) - cursor["created_at"] > self.ttl:
+            self._counters["expired"] += 1
+            self.clear(session_data)
+            return None
+        if cursor["catalog_version"] != catalog_version:
+            self._counters["stale_catalog"] += 1
+            self.clear(session_data)
+            return None
+
+        page, offset = self._scan(cursor, shown, quantity)
+        if len(page) < quantity and cursor.get("truncated"):
+            # La búsqueda sigue más allá del límite: se repite y salta lo ya mostrado
+            self._counters["capped"] += 1
+            self.clear(session_data)
+            return None
+        cursor["offset"] = offset
+        self._counters["pages"] += 1
+        return page
+
+    def peek(self, session_data: Dict, catalog_version: str, shown, quantity: int) -> List[str]:
+        """Página que devolvería la próxima continuación, sin avanzar el cursor"""
+        cursor = session_data.get(CURSOR_KEY)
+        if (cursor is None or cursor["catalog_version"] != catalog_version
+                or time.time() - cursor["created_at"] > self.ttl):
+            return []
+        page = self._scan(cursor, shown, quantity)[0]
+        # Esa continuación repetirá la búsqueda: no hay página que precalcular
+        return [] if len(page) < quantity and cursor.get("truncated") else page
+
+    @staticmethod
+    def _scan(cursor: Dict, shown, quantity: int) -> Tuple[List[str], int]:
+        ids = cursor["ids"]
+        offset = cursor["offset"]
+        page = []
+        while offset < len(ids) and len(page) < quantity:
+            if ids[offset] not in shown:
+                page.append(ids[offset])
+            offset += 1
+        return page, offset
+
+    def products_for(self, product_ids: List[str], all_products: List[Dict], catalog_version: str) -> List[Dict]:
+        """Productos de esos IDs, con un índice por ID que se rehace solo si cambia el catálogo"""
+        if self._index_version != catalog_version:
+            self._index = {str(p.get("id")): p for p in all_products}
+            self._index_version = catalog_version
+        return [self._index[pid] for pid in product_ids if pid in self._index]
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        lookups = sum(self._counters[k] for k in ("pages", "expired", "stale_catalog", "missing", "capped"))
+        return {
+            **self._counters,
+            "hit_rate": round(self._counters["pages"] / lookups, 3) if lookups else 0.0,
+            "ttl": self.ttl,
+        }
+
+
+# Instancia compartida por el proceso
+result_cursors = ResultCursors()
@@ -0,0 +1,211 @@
+import json
+import logging
+import math
+import os
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from llm_cache import compute_catalog_version
+from text_utils import normalize_text, normalize_color, find_product_synonyms, similarity
+
+logger = logging.getLogger('retrieval')
+
+# Candidatos que llegan al LLM para reordenar/seleccionar
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "20"))
+INDEX_CACHE_SIZE = 4  # Índices de catálogo guardados (uno por versión)
+
+# Pesos BM25 y por campo
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"name": 3, "type": 1, "description": 1, "attributes": 1}
+FUZZY_THRESHOLD = 0.65  # Similitud mínima para corregir términos mal escritos ("sila" -> "silla")
+FUZZY_WEIGHT = 0.8
+
+COLOR_KEYWORDS = ["gris", "negro", "blanco", "madera", "beige", "azul",
+                  "rojo", "verde", "amarillo", "rosa", "dorado", "marron"]
+
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "un", "una", "unos", "unas", "y", "o", "en",
+    "para", "con", "por", "que", "me", "mi", "tu", "algo", "alguna", "alguno", "tienes",
+    "tiene", "hay", "quiero", "busco", "necesito", "dame", "muestrame", "ver", "mas",
+    "otros", "otras", "ejemplos", "opciones", "productos", "al", "lo", "se", "su"
+}
+
+
+def stem(word: str) -> str:
+    """Reducción básica de plurales en español (sillas -> silla, sillones -> sillon)"""
+    if len(word) > 4 and word.endswith("es") and word[-3] in "lnrdz":
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Normaliza, elimina palabras vacías y reduce plurales"""
+    return [stem(w) for w in normalize_text(str(text or "")).split() if len(w) > 1 and w not in STOPWORDS]
+
+
+def expand_query(query: str) -> List[str]:
+    """Términos de la consulta más sus sinónimos de producto"""
+    terms = tokenize(query)
+    expanded = list(terms)
+    for word in normalize_text(query).split():
+        synonyms = find_product_synonyms(word)
+        if synonyms != [word]:
+            for synonym in synonyms:
+                expanded.extend(tokenize(synonym))
+    return list(dict.fromkeys(expanded))
+
+
+def _product_attributes(product: Dict) -> Dict:
+    attributes = product.get('attributes_normalized', product.get('attributes', {}))
+    if isinstance(attributes, str):
+        try:
+            attributes = json.loads(attributes)
+        except:
+            attributes = {}
+    return attributes if isinstance(attributes, dict) else {}
+
+
+def query_colors(query: str) -> List[str]:
+    """Colores mencionados en la consulta (forma canónica)"""
+    colors = []
+    for word in normalize_text(query).split():
+        color = normalize_text(normalize_color(word))
+        if color in COLOR_KEYWORDS and color not in colors:
+            colors.append(color)
+    return colors
+
+
+class ProductIndex:
+    """Índice BM25 por campos sobre el catálogo de productos"""
+
+    def __init__(self, products: List[Dict]):
+        self.products = [p for p in products if isinstance(p, dict)]
+        self.doc_terms: List[Counter] = []
+        self.doc_lengths: List[int] = []
+        self.colors: List[str] = []
+        self.popularity: List[float] = []
+        document_frequency: Counter = Counter()
+
+        for product in self.products:
+            attributes = _product_attributes(product)
+            terms: Counter = Counter()
+            fields = {
+                "name": product.get('product_name', ''),
+                "type": product.get('type', ''),
+                "description": product.get('description', ''),
+                "attributes": " ".join(str(v) for v in attributes.values() if not isinstance(v, (dict, list))),
+            }
+            for field, text in fields.items():
+                for term in tokenize(text):
+                    terms[term] += FIELD_WEIGHTS[field]
+            self.doc_terms.append(terms)
+            self.doc_lengths.append(sum(terms.values()))
+            document_frequency.update(terms.keys())
+            self.colors.append(normalize_text(normalize_color(str(attributes.get("color", "")))))
+            self.popularity.append(math.log1p(float(product.get('sales_count') or 0)))
+
+        total = len(self.products)
+        self.avg_length = (sum(self.doc_lengths) / total) if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def _weighted_terms(self, query: str) -> Dict[str, float]:
+        """Términos de la consulta; los desconocidos se corrigen al término más parecido del catálogo"""
+        weighted: Dict[str, float] = {}
+        for term in expand_query(query):
+            if term in self.idf:
+                weighted[term] = max(weighted.get(term, 0.0), 1.0)
+                continue
+            best, best_sim = None, FUZZY_THRESHOLD
+            for candidate in self.idf:
+                sim = similarity(term, candidate)
+                if sim >= best_sim:
+                    best, best_sim = candidate, sim
+            if best:
+                weighted[best] = max(weighted.get(best, 0.0), FUZZY_WEIGHT)
+        return weighted
+
+    def score(self, query: str, boost_terms: Optional[List[str]] = None) -> List[float]:
+        """Puntuación léxica (BM25) más facetas de color, ambiente y popularidad"""
+        terms = self._weighted_terms(query)
+        boosts = list(dict.fromkeys(t for text in (boost_terms or []) for t in tokenize(text)))
+        colors = query_colors(query)
+        scores = []
+        for i, doc in enumerate(self.doc_terms):
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[i] / (self.avg_length or 1))
+            score = 0.0
+            for term, weight in terms.items():
+                tf = doc.get(term, 0)
+                if tf:
+                    score += weight * self.idf[term] * tf * (BM25_K1 + 1) / (tf + length_norm)
+            # Faceta de ambiente/estilo: términos típicos del ambiente suman menos que la consulta
+            for term in boosts:
+                if doc.get(term):
+                    score += 0.5 * self.idf.get(term, 0.0)
+            # Faceta de color
+            if colors and self.colors[i]:
+                score += 2.0 if self.colors[i] in colors else -1.0
+            if score > 0:
+                score += 0.05 * self.popularity[i]
+            scores.append(score)
+        return scores
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K, boost_terms: Optional[List[str]] = None,
+               include_zero: bool = False) -> List[Tuple[Dict, float]]:
+        """Top-K productos con su puntuación, de mayor a menor"""
+        scores = self.score(query, boost_terms)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        results = [(self.products[i], scores[i]) for i in ranked if include_zero or scores[i] > 0]
+        return results[:k]
+
+
+_index_cache: "OrderedDict[str, ProductIndex]" = OrderedDict()
+
+
+def get_product_index(products: List[Dict], catalog_version: Optional[str] = None) -> ProductIndex:
+    """Índice del catálogo, reutilizado mientras la versión no cambie"""
+    version = catalog_version or compute_catalog_version(products)
+    index = _index_cache.get(version)
+    if index is None:
+        index = ProductIndex(products)
+        _index_cache[version] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+        logger.info(f"Índice de productos construido: {len(index.products)} productos (versión {version})")
+    else:
+        _index_cache.move_to_end(version)
+    return index
+
+
+def retrieve_candidates(products: List[Dict], query: str, k: int = RETRIEVAL_TOP_K,
+                        boost_terms: Optional[List[str]] = None,
+                        catalog_version: Optional[str] = None) -> Tuple[List[Dict], List[float]]:
+    """
+    Selecciona localmente los K productos más prometedores para enviar al LLM.
+    Si nada puntúa, completa con los más populares para que el LLM tenga contexto.
+    `catalog_version` (la de `products`) evita recalcular el hash del catálogo en cada consulta.
+    """
+    index = get_product_index(products, catalog_version)
+    results = index.search(query, k=k, boost_terms=boost_terms)
+    if len(results) < k:
+        seen = {id(p) for p, _ in results}
+        popular = sorted(
+            (p for p in index.products if id(p) not in seen),
+            key=lambda p: float(p.get('sales_count') or 0),
+            reverse=True
+        )
+        results.extend((p, 0.0) for p in popular[:k - len(results)])
+    return [p for p, _ in results], [score for _, score in results]
+
+
+def search_products_locally(products: List[Dict], query: str, k: int = RETRIEVAL_TOP_K,
+                            boost_terms: Optional[List[str]] = None,
+                            catalog_version: Optional[str] = None) -> List[Dict]:
+    """Búsqueda sin LLM: solo productos con alguna coincidencia, de mayor a menor puntaje"""
+    index = get_product_index(products, catalog_version)
+    return [p for p, score in index.search(query, k=k, boost_terms=boost_terms) if score > 0]
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('search_strategies')
+
+# "sequential": una estrategia tras otra (menos llamadas al LLM)
+# "speculative": todas arrancan a la vez y se cancelan las que ya no hacen falta (menos latencia)
+SEARCH_STRATEGY_MODE = os.getenv("SEARCH_STRATEGY_MODE", "sequential").lower()
+SEARCH_MIN_RESULTS = int(os.getenv("SEARCH_MIN_RESULTS", "1"))  # Resultados para dar por buena una estrategia
+LATENCY_SAMPLES = 200
+
+Strategy = Tuple[str, Callable[[], Awaitable[List[dict]]]]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))]
+
+
+class StrategyRunner:
+    """
+    Ejecuta la cadena de estrategias de búsqueda en orden de prioridad.
+    Gana la primera estrategia (por prioridad) que devuelve suficientes resultados.
+    """
+
+    def __init__(self, mode: str = SEARCH_STRATEGY_MODE, min_results: int = SEARCH_MIN_RESULTS):
+        if mode not in ("sequential", "speculative"):
+            logger.warning(f"SEARCH_STRATEGY_MODE desconocido '{mode}', usando 'sequential'")
+            mode = "sequential"
+        self.mode = mode
+        self.min_results = max(1, min_results)
+        self._stats: Dict[str, Dict] = {}
+        self._latencies: Dict[str, deque] = {}
+
+    def _strategy_stats(self, name: str) -> Dict:
+        if name not in self._stats:
+            self._stats[name] = {"runs": 0, "wins": 0, "cancelled": 0, "errors": 0}
+            self._latencies[name] = deque(maxlen=LATENCY_SAMPLES)
+        return self._stats[name]
+
+    async def _timed(self, name: str, func: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        stats = self._strategy_stats(name)
+        stats["runs"] += 1
+        started = time.monotonic()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            stats["cancelled"] += 1
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        self._latencies[name].append(time.monotonic() - started)
+        return result or []
+
+    async def run(self, strategies: List[Strategy]) -> Tuple[Optional[str], List[dict]]:
+        """Retorna (estrategia ganadora, resultados); (None, []) si ninguna encontró nada"""
+        if self.mode == "speculative":
+            return await self._run_speculative(strategies)
+        return await self._run_sequential(strategies)
+
+    async def _run_sequential(self, strategies: List[Strategy]) -> Tuple[Optional[str], List[dict]]:
+        fallback: Tuple[Optional[str], List[dict]] = (None, [])
+        for name, func in strategies:
+            logger.info(f"Iniciando búsqueda: {name}")
+            result = await self._timed(name, func)
+            logger.info(f"Búsqueda '{name}' completada: {len(result)} productos encontrados")
+            if len(result) >= self.min_results:
+                return self._win(name, result)
+            if result and fallback[0] is None:
+                fallback = (name, result)
+        return self._win(*fallback) if fallback[0] else fallback
+
+    async def _run_speculative(self, strategies: List[Strategy]) -> Tuple[Optional[str], List[dict]]:
+        tasks = [
+            (name, asyncio.create_task(self._timed(name, func)))
+            for name, func in strategies
+        ]
+        fallback: Tuple[Optional[str], List[dict]] = (None, [])
+        try:
+            # Se espera en orden de prioridad: una estrategia rápida de menor prioridad
+            # no gana mientras una de mayor prioridad pueda todavía devolver resultados
+            for name, task in tasks:
+                result = await task
+                logger.info(f"Búsqueda '{name}' completada: {len(result)} productos encontrados")
+                if len(result) >= self.min_results:
+                    return self._win(name, result)
+                if result and fallback[0] is None:
+                    fallback = (name, result)
+            return self._win(*fallback) if fallback[0] else fallback
+        finally:
+            pending = [task for _, task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.info(f"Búsquedas especulativas canceladas: {len(pending)}")
+
+    def _win(self, name: str, result: List[dict]) -> Tuple[str, List[dict]]:
+        self._strategy_stats(name)["wins"] += 1
+        return name, result
+
+    def stats(self) -> Dict:
+        """Victorias y latencias por estrategia para el endpoint de métricas"""
+        strategies = {}
+        for name, counters in self._stats.items():
+            latencies = list(self._latencies[name])
+            strategies[name] = {
+                **counters,
+                "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+                "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+            }
+        return {"mode": self.mode, "min_results": self.min_results, "strategies": strategies}
+
+
+# Instancia compartida por el proceso
+search_runner = StrategyRunner()
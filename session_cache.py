@@ -0,0 +1,351 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from conversation_store import conversation_store, meta_fields, parse_timestamp, record_message
+from history_policy import history_offset
+
+logger = logging.getLogger('session_cache')
+
+# E/S de conversaciones fuera del event loop
+CONVERSATION_IO_THREADS = int(os.getenv("CONVERSATION_IO_THREADS", "2"))
+# Memoria máxima de sesiones en caché; 0 = sin caché (cada cambio se escribe enseguida)
+CONVERSATION_CACHE_MB = float(os.getenv("CONVERSATION_CACHE_MB", "32"))
+# Cada cuánto se escriben las sesiones modificadas (write-behind)
+CONVERSATION_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "2.0"))
+CONVERSATION_RETRY_DELAY = 1.0  # Reintento tras un fallo de escritura
+# Espera máxima de una respuesta a que su sesión quede escrita en un almacén compartido
+CONVERSATION_COMMIT_TIMEOUT = float(os.getenv("CONVERSATION_COMMIT_TIMEOUT", "5.0"))
+
+
+def estimate_size(value) -> int:
+    """Tamaño aproximado en bytes (el de su JSON)"""
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class ExpiryIndex:
+    """
+    Min-heap de (última actualización, sesión) para encontrar las sesiones vencidas
+    sin recorrer todas. Las entradas viejas de una sesión se descartan al salir del heap.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._latest: Dict[str, float] = {}
+
+    def touch(self, session_id: str, last_updated: float):
+        self._latest[session_id] = last_updated
+        heapq.heappush(self._heap, (last_updated, session_id))
+        if len(self._heap) > 2 * len(self._latest) + 64:
+            # Demasiadas entradas obsoletas: se reconstruye con las vigentes
+            self._heap = [(ts, sid) for sid, ts in self._latest.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, session_id: str):
+        self._latest.pop(session_id, None)
+
+    def pop_expired(self, cutoff: float, limit: int) -> List[str]:
+        """Hasta `limit` sesiones sin actualizar desde antes de `cutoff`, las más antiguas primero"""
+        expired = []
+        while self._heap and self._heap[0][0] < cutoff and len(expired) < limit:
+            last_updated, session_id = heapq.heappop(self._heap)
+            if self._latest.get(session_id) == last_updated:
+                del self._latest[session_id]
+                expired.append(session_id)
+        return expired
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._latest
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+
+class CachedSession:
+    """Sesión en memoria y lo que falta escribir de ella"""
+
+    def __init__(self, session_data: Dict, size: int, fields: Optional[Dict[str, str]] = None):
+        self.session_data = session_data
+        self.size = size
+        # Campos de `meta` tal como están en el almacén: solo se escriben los que cambien
+        self.fields = meta_fields(session_data) if fields is None else fields
+        # Números de orden (no posiciones en la lista: el historial se resume por el principio)
+        self.persisted = self.end  # Mensajes ya escritos
+        self.updated: Set[int] = set()  # Mensajes escritos que cambiaron después
+        self.removed: Set[int] = set()  # Mensajes resumidos que hay que borrar del almacén
+        self.flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def end(self) -> int:
+        return history_offset(self.session_data) + len(self.session_data["conversation"])
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.updated) or bool(self.removed) or self.end > self.persisted
+
+
+class SessionCache:
+    """
+    Caché LRU de sesiones con presupuesto de bytes sobre el almacén de conversaciones.
+    Las lecturas se sirven de memoria; los cambios se escriben en segundo plano
+    (cada `flush_interval` segundos o al expulsar la sesión) en un pool de hilos,
+    agrupando en una sola escritura todos los cambios de la sesión.
+    """
+
+    def __init__(self, store=conversation_store, max_bytes: int = int(CONVERSATION_CACHE_MB * 1024 * 1024),
+                 flush_interval: float = CONVERSATION_FLUSH_INTERVAL, io_threads: int = CONVERSATION_IO_THREADS,
+                 retry_delay: float = CONVERSATION_RETRY_DELAY):
+        self.store = store
+        self.max_bytes = max_bytes
+        # Con un almacén compartido la siguiente petición puede llegar a otro worker: sin demora
+        self.flush_interval = 0.0 if store.shared else flush_interval
+        self.retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(max_workers=max(1, io_threads), thread_name_prefix="conversations")
+        self._entries: "OrderedDict[str, CachedSession]" = OrderedDict()
+        self._evicted: Dict[str, CachedSession] = {}  # Expulsadas con cambios aún sin escribir
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self._flusher: Optional[asyncio.Task] = None
+        # Vencimiento de las sesiones que este worker leyó o escribió (ver session_janitor.py)
+        self.expiry = ExpiryIndex()
+        self._counters = {"hits": 0, "misses": 0, "revalidations": 0, "evictions": 0, "dirty_evictions": 0,
+                          "ops": 0, "flushes": 0, "flush_errors": 0, "commit_timeouts": 0}
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _load_sized(self, session_id: str) -> Tuple[Dict, int]:
+        session_data = self.store.load(session_id)
+        return session_data, estimate_size(session_data)
+
+    def _write_sized(self, snapshot: Dict, start: int, updated: Set[int], removed: Set[int],
+                     fields: Set[str]) -> Optional[int]:
+        if not self.store.write_changes(snapshot, start, updated, removed, fields=fields):
+            return None
+        return estimate_size(snapshot)
+
+    def _find(self, session_id: str) -> Optional[CachedSession]:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            self._entries.move_to_end(session_id)
+            return entry
+        return self._evicted.get(session_id)
+
+    async def load(self, session_id: str) -> Dict:
+        """Estado más reciente de la sesión; las cargas simultáneas comparten la lectura"""
+        entry = self._find(session_id)
+        if entry is not None and self.store.shared and self.forget(session_id):
+            # Otro worker pudo cambiarla: la copia sin cambios pendientes se vuelve a leer
+            self._counters["revalidations"] += 1
+            entry = None
+        if entry is not None:
+            self._counters["hits"] += 1
+            return entry.session_data
+        self._counters["misses"] += 1
+        future = self._loading.get(session_id)
+        if future is None:
+            future = asyncio.ensure_future(self._run(self._load_sized, session_id))
+            self._loading[session_id] = future
+            future.add_done_callback(lambda _: self._loading.pop(session_id, None))
+        session_data, size = await asyncio.shield(future)
+        # Si mientras se leía la sesión recibió cambios, esos son los vigentes
+        entry = self._find(session_id)
+        if entry is None:
+            entry = self._insert(session_data, size)
+            self._evict()
+        return entry.session_data
+
+    def _insert(self, session_data: Dict, size: int, fields: Optional[Dict[str, str]] = None) -> CachedSession:
+        entry = CachedSession(session_data, size, fields)
+        self._entries[session_data["session_id"]] = entry
+        self._bytes += size
+        self._touch(session_data)
+        return entry
+
+    def _touch(self, session_data: Dict):
+        self.expiry.touch(session_data["session_id"], parse_timestamp(session_data.get("last_updated"), time.time()))
+
+    def forget(self, session_id: str) -> bool:
+        """Saca de la caché una sesión vencida (salvo que tenga cambios sin escribir)"""
+        entry = self._entries.get(session_id)
+        if entry is None or entry.dirty or entry.flush_task is not None:
+            return False
+        del self._entries[session_id]
+        self._bytes -= entry.size
+        return True
+
+    def _entry_for(self, session_data: Dict) -> CachedSession:
+        entry = self._find(session_data["session_id"])
+        if entry is None:
+            # Expulsada entre la carga y el cambio: vuelve a la caché con la copia del llamador
+            # (sin saber qué campos tiene el almacén, se escriben todos)
+            entry = self._insert(session_data, estimate_size(session_data), fields={})
+        return entry
+
+    def _resize(self, entry: CachedSession, delta: int):
+        entry.size += delta
+        if self._entries.get(entry.session_data["session_id"]) is entry:
+            self._bytes += delta
+
+    def append_message(self, session_data: Dict, message: Dict):
+        """Agrega el mensaje en memoria; se escribirá en segundo plano"""
+        entry = self._entry_for(session_data)
+        # Otra copia de la sesión (cargada antes del cambio pendiente): el mensaje va a la vigente
+        folded = record_message(entry.session_data, message)
+        entry.session_data["last_updated"] = message.get("timestamp") or entry.session_data.get("last_updated")
+        if folded:
+            offset = history_offset(entry.session_data)
+            entry.removed.update(range(offset - len(folded), offset))
+        # El mensaje más su rastro en el conjunto de productos mostrados, menos lo resumido
+        self._resize(entry, estimate_size(message) + 8 * len(message.get("products_shown", []))
+                     - sum(estimate_size(m) for m in folded))
+        self._mark_dirty(entry)
+
+    async def set_response(self, session_id: str, summary_id: str, response: str) -> bool:
+        """Completa la respuesta del mensaje con ese summary_id"""
+        session_data = await self.load(session_id)
+        conversation = session_data.get("conversation", [])
+        for index in range(len(conversation) - 1, -1, -1):
+            if conversation[index].get("summary_id") == summary_id:
+                entry = self._entry_for(session_data)
+                old_size = estimate_size(conversation[index])
+                conversation[index]["response"] = response
+                seq = history_offset(session_data) + index
+                if seq < entry.persisted:
+                    entry.updated.add(seq)
+                self._resize(entry, estimate_size(conversation[index]) - old_size)
+                self._mark_dirty(entry)
+                return True
+        return False
+
+    def _mark_dirty(self, entry: CachedSession):
+        self._counters["ops"] += 1
+        self._evict()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _evict(self):
+        """Expulsa las sesiones menos usadas hasta entrar en el presupuesto"""
+        while self._bytes > self.max_bytes and self._entries:
+            session_id, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._counters["evictions"] += 1
+            if entry.dirty:
+                # Sigue visible hasta que sus cambios estén escritos
+                self._counters["dirty_evictions"] += 1
+                self._evicted[session_id] = entry
+                self._flush_entry(entry)
+
+    def _flush_entry(self, entry: CachedSession) -> asyncio.Task:
+        if entry.flush_task is None:
+            entry.flush_task = asyncio.create_task(self._write(entry))
+        return entry.flush_task
+
+    async def _write(self, entry: CachedSession):
+        """Escribe los cambios acumulados de una sesión en una sola operación del almacén"""
+        session_data = entry.session_data
+        session_id = session_data["session_id"]
+        try:
+            while entry.dirty:
+                # Copia de lo que se escribe: el event loop puede seguir modificando la sesión
+                conversation = list(session_data["conversation"])
+                offset = history_offset(session_data)
+                end = offset + len(conversation)
+                # Los mensajes resumidos antes de escribirse ya no se escriben (sus productos mostrados sí)
+                start = entry.persisted
+                updated = {seq for seq in entry.updated if seq >= offset}
+                removed = set(entry.removed)
+                for seq in updated | set(range(max(start, offset), end)):
+                    conversation[seq - offset] = dict(conversation[seq - offset])
+                snapshot = {
+                    k: (v.copy() if isinstance(v, (dict, list)) else v) for k, v in session_data.items()
+                    if k != "conversation"
+                }
+                snapshot["conversation"] = conversation
+                fields = meta_fields(snapshot)
+                changed = {name for name in fields.keys() | entry.fields.keys()
+                           if fields.get(name) != entry.fields.get(name)}
+                entry.updated.clear()
+                entry.removed.clear()
+                size = await self._run(self._write_sized, snapshot, start, updated, removed, changed)
+                if size is None:
+                    self._counters["flush_errors"] += 1
+                    entry.updated |= updated
+                    entry.removed |= removed
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+                self._counters["flushes"] += 1
+                entry.persisted = end
+                entry.fields = fields
+                self._touch(snapshot)
+                # Corrige la estimación con el tamaño real (incluye campos como el cursor de resultados)
+                self._resize(entry, size - entry.size)
+        finally:
+            entry.flush_task = None
+        if self._evicted.get(session_id) is entry:
+            del self._evicted[session_id]
+
+    def _dirty_entries(self) -> List[CachedSession]:
+        return [e for e in list(self._entries.values()) + list(self._evicted.values()) if e.dirty]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self._dirty_entries():
+                # Sin cambios: el escritor se detiene y vuelve a arrancar con el próximo
+                self._flusher = None
+                return
+            await asyncio.gather(*(self._flush_entry(e) for e in self._dirty_entries()), return_exceptions=True)
+
+    async def commit(self, session_id: str, timeout: float = CONVERSATION_COMMIT_TIMEOUT) -> bool:
+        """
+        Con un almacén compartido espera a que los cambios de la sesión estén escritos: la
+        respuesta no debe salir antes, porque la siguiente consulta puede llegar a otro worker.
+        Con un almacén local no hace nada (los cambios siguen escribiéndose en segundo plano).
+        """
+        if not self.store.shared:
+            return True
+        entry = self._find(session_id)
+        if entry is None or (not entry.dirty and entry.flush_task is None):
+            return True
+        # Si ya hay una escritura en curso, esa misma sigue mientras queden cambios
+        task = self._flush_entry(entry)
+        await asyncio.wait({task}, timeout=timeout)
+        if not task.done() or entry.dirty:
+            self._counters["commit_timeouts"] += 1
+            logger.warning(f"La sesión {session_id} no se pudo escribir antes de responder")
+            return False
+        return True
+
+    async def flush_all(self, timeout: float = 10.0):
+        """Escribe todas las sesiones modificadas (al apagar la aplicación)"""
+        tasks = [self._flush_entry(e) for e in self._dirty_entries()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        remaining = self._dirty_entries()
+        if remaining:
+            logger.warning(f"{len(remaining)} conversaciones quedaron sin guardar")
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        lookups = self._counters["hits"] + self._counters["misses"]
+        flushes = self._counters["flushes"]
+        return {
+            **self._counters,
+            "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "dirty": len(self._dirty_entries()),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ops_per_flush": round(self._counters["ops"] / flushes, 2) if flushes else 0.0,
+        }
+
+
+# Instancia compartida por el proceso
+session_cache = SessionCache()
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from conversation_store import conversation_store
+from session_cache import session_cache
+
+logger = logging.getLogger('session_janitor')
+
+# Configuración de la limpieza de conversaciones
+CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL", str(30 * 60)))  # Barrido completo del almacén
+CLEANUP_TICK = int(os.getenv("CLEANUP_TICK", "60"))  # Cada cuánto se vencen sesiones del índice
+CLEANUP_BATCH = int(os.getenv("CLEANUP_BATCH", "500"))  # Sesiones vencidas por ronda
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", str(2 * 60 * 60)))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+MAX_CONVERSATIONS_SIZE_MB = float(os.getenv("MAX_CONVERSATIONS_SIZE_MB", "50"))
+
+
+class FileLock:
+    """Candado de archivo no bloqueante (fcntl en Unix, msvcrt en Windows); el SO lo libera si el proceso muere"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SessionJanitor:
+    """
+    Limpieza de sesiones como tarea asyncio. Cada worker saca de su caché las sesiones
+    vencidas según el índice de vencimientos; solo el worker que tiene el candado del
+    almacén (el líder) las borra y hace el barrido completo periódico.
+    """
+
+    def __init__(self, store=conversation_store, cache=session_cache, tick: float = CLEANUP_TICK,
+                 sweep_interval: float = CLEANUP_INTERVAL, batch: int = CLEANUP_BATCH,
+                 max_age: float = SESSION_MAX_AGE, max_sessions: int = MAX_SESSIONS,
+                 max_size_mb: float = MAX_CONVERSATIONS_SIZE_MB):
+        self.store = store
+        self.cache = cache
+        self.tick = tick
+        self.sweep_interval = sweep_interval
+        self.batch = batch
+        self.max_age = max_age
+        self.max_sessions = max_sessions
+        self.max_size_mb = max_size_mb
+        self.lock = FileLock(store.cleanup_lock_path)
+        self._task: Optional[asyncio.Task] = None
+        self._last_sweep = 0.0
+        self._counters = {"rounds": 0, "expired": 0, "forgotten": 0, "deleted": 0, "sweeps": 0}
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _try_lead(self) -> bool:
+        """Toma el candado si está libre; al ser líder carga en el índice todas las sesiones guardadas"""
+        if self.lock.held:
+            return True
+        try:
+            acquired = self.lock.acquire()
+        except OSError as e:
+            logger.error(f"No se pudo abrir el candado de limpieza {self.lock.path}: {e}")
+            return False
+        if acquired:
+            logger.info(f"Este worker (pid {os.getpid()}) se encarga de la limpieza de conversaciones")
+            for session_id, last_updated in await self._run(self.store.expiry_entries):
+                if session_id not in self.cache.expiry:
+                    self.cache.expiry.touch(session_id, last_updated)
+        return acquired
+
+    async def run_once(self, now: Optional[float] = None) -> Dict:
+        """Una ronda: vence hasta `batch` sesiones del índice y, si toca, barre el almacén"""
+        now = now or time.time()
+        cutoff = now - self.max_age
+        self._counters["rounds"] += 1
+        leader = await self._try_lead()
+
+        expired = self.cache.expiry.pop_expired(cutoff, self.batch)
+        forgotten = sum(1 for session_id in expired if self.cache.forget(session_id))
+        deleted = 0
+        if leader and expired:
+            deleted += await self._run(self.store.delete_sessions, expired, cutoff)
+        if leader and now - self._last_sweep >= self.sweep_interval:
+            # Sesiones que el índice no conoce (escritas por otros workers) y límites de cantidad/tamaño
+            self._last_sweep = now
+            self._counters["sweeps"] += 1
+            deleted += await self._run(self.store.cleanup, self.max_age, self.max_sessions, self.max_size_mb)
+
+        self._counters["expired"] += len(expired)
+        self._counters["forgotten"] += forgotten
+        self._counters["deleted"] += deleted
+        if deleted > 0:
+            logger.info(f"Limpieza completada: {deleted} conversaciones eliminadas")
+        return {"leader": leader, "expired": len(expired), "forgotten": forgotten, "deleted": deleted}
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error en limpieza de conversaciones: {e}")
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        """Inicia la tarea de limpieza en el event loop actual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info("Programador de limpieza automática iniciado")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.lock.release()
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        return {
+            **self._counters,
+            "leader": self.lock.held,
+            "indexed_sessions": len(self.cache.expiry),
+        }
+
+
+# Instancia compartida por el proceso
+session_janitor = SessionJanitor()
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger('singleflight')
+
+
+class _Call:
+    """Llamada en curso compartida por todos los que piden la misma clave"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes idénticas: la primera ejecuta la función y
+    las demás esperan el mismo resultado. Si todos los que esperan se cancelan,
+    la llamada compartida también se cancela.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._counters = {
+            "calls": 0,
+            "executions": 0,
+            "collapsed": 0,
+            "abandoned": 0,
+        }
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        self._counters["calls"] += 1
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task, k=key, c=call: self._forget(k, c))
+            self._counters["executions"] += 1
+        else:
+            self._counters["collapsed"] += 1
+            logger.debug(f"Llamada agrupada con una en curso: {key[:12]}")
+
+        call.waiters += 1
+        try:
+            # shield: cancelar a un solo cliente no debe cancelar a los demás
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                call.task.cancel()
+                self._counters["abandoned"] += 1
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Evita avisos de "exception was never retrieved" cuando nadie espera
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict:
+        """Contadores de llamadas agrupadas para el endpoint de métricas"""
+        return {**self._counters, "in_flight": len(self._calls)}
@@ -0,0 +1,233 @@
+"""
+Etiquetas de ambiente y estilo de cada producto generadas fuera de línea.
+
+Uso: python style_tags.py [--local]  (etiqueta solo los productos que cambiaron)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+from typing import Dict, List, Optional
+
+from deadline import use_deadline
+from enrichment_store import (ENRICHMENT_CONCURRENCY, EnrichmentSnapshot, EnrichmentStore, enrichment_store,
+                              input_hash, run_enrichment)
+from text_utils import normalize_text
+
+logger = logging.getLogger('style_tags')
+
+STYLE_TAGS_KIND = "style_tags"
+STYLE_INDEX_REFRESH = float(os.getenv("STYLE_INDEX_REFRESH", "60"))  # Segundos entre recargas del índice
+STYLE_TAGGER = os.getenv("STYLE_TAGGER", "llm")  # "llm" o "local" para el reetiquetado incremental
+
+AMBIENTE_KEYWORDS = {
+    "dormitorio": {
+        "keywords": ["dormitorio", "cuarto", "habitación", "recámara", "noche", "descanso", "velador", "cama", "mesita"],
+        "description": "un espacio para descansar y relajarse",
+        "productos_tipicos": ["cama", "velador", "armario", "mesita de noche", "lámpara de noche"],
+        "productos_no_relevantes": ["sofá", "mesa de comedor", "taburete", "cortina de baño", "escritorio", "archivador"]
+    },
+    "oficina": {
+        "keywords": ["oficina", "escritorio", "trabajo", "estudio", "ergonómica", "archivador"],
+        "description": "un espacio para trabajar y concentrarse",
+        "productos_tipicos": ["escritorio", "silla ergonómica", "archivador", "lámpara de escritorio", "estantería"],
+        "productos_no_relevantes": ["sofá", "cama", "velador", "cortina de baño", "mesa de comedor", "biombo", "fundas"]
+    },
+    "sala": {
+        "keywords": ["sala", "estar", "living", "sofá", "centro", "decorativa", "recibidor"],
+        "description": "un espacio para socializar y recibir visitas",
+        "productos_tipicos": ["sofá", "mesa de centro", "sillón", "lámpara de pie", "estantería decorativa"],
+        "productos_no_relevantes": ["escritorio", "archivador", "velador", "cortina de baño", "silla ergonómica"]
+    },
+    "comedor": {
+        "keywords": ["comedor", "dining", "mesa", "silla", "banqueta"],
+        "description": "un espacio para compartir comidas",
+        "productos_tipicos": ["mesa de comedor", "sillas de comedor", "banqueta", "lámpara colgante"],
+        "productos_no_relevantes": ["escritorio", "archivador", "sofá", "cortina de baño", "silla ergonómica"]
+    },
+    "cocina": {
+        "keywords": ["cocina", "taburete", "isla", "banqueta", "desayunador"],
+        "description": "un espacio para preparar y disfrutar comidas",
+        "productos_tipicos": ["taburete", "banqueta", "mesa de desayunador", "estantería de cocina"],
+        "productos_no_relevantes": ["sofá", "escritorio", "cama", "cortina de baño", "silla ergonómica"]
+    }
+}
+
+ESTILO_KEYWORDS = {
+    "moderno": ["moderno", "contemporáneo", "minimalista", "sencillo"],
+    "clásico": ["clásico", "tradicional", "elegante", "formal"],
+    "industrial": ["industrial", "rústico", "vintage", "loft"],
+    "escandinavo": ["escandinavo", "nórdico", "simple", "natural"],
+    "bohemio": ["bohemio", "boho", "artístico", "colorido"]
+}
+
+
+def tag_inputs(product: Dict) -> Dict:
+    """Campos del producto que determinan sus etiquetas"""
+    return {
+        "name": product.get('product_name', ''),
+        "type": product.get('type', ''),
+        "description": product.get('description', ''),
+        "attributes": product.get('attributes', {}),
+    }
+
+
+def _mentions(text: str, terms: List[str]) -> bool:
+    padded = f" {text} "
+    return any(f" {normalize_text(term)}" in padded for term in terms)
+
+
+def local_tags(product: Dict) -> Dict[str, List[str]]:
+    """Etiquetas por palabras clave del nombre y la descripción (sin LLM)"""
+    name = normalize_text(product.get('product_name', ''))
+    text = f"{name} {normalize_text(product.get('description', '') or '')}"
+    ambientes = [
+        ambiente for ambiente, data in AMBIENTE_KEYWORDS.items()
+        if _mentions(text, [ambiente] + data["keywords"] + data["productos_tipicos"])
+        and not _mentions(name, data["productos_no_relevantes"])
+    ]
+    estilos = [
+        estilo for estilo, keywords in ESTILO_KEYWORDS.items()
+        if _mentions(text, [estilo] + keywords)
+    ]
+    return {"ambientes": ambientes, "estilos": estilos}
+
+
+class LocalTagger:
+    """Etiquetador por palabras clave: sustituto del LLM para pruebas y entornos sin GROQ"""
+
+    async def __call__(self, product: Dict) -> Optional[str]:
+        return json.dumps(local_tags(product), ensure_ascii=False)
+
+
+async def llm_tagger(product: Dict) -> Optional[str]:
+    """Etiqueta un producto con el LLM, limitado al vocabulario conocido"""
+    from llama_utils import ask_llama
+
+    prompt = f"""
+Eres un experto en decoración de interiores. Clasifica este producto:
+
+Nombre: {product.get('product_name', '')}
+Tipo: {product.get('type', '')}
+Descripción: {product.get('description', '')}
+
+Ambientes posibles: {', '.join(AMBIENTE_KEYWORDS)}
+Estilos posibles: {', '.join(ESTILO_KEYWORDS)}
+
+Devuelve SOLO un JSON con los ambientes donde el producto es CLARAMENTE útil y sus estilos:
+{{"ambientes": ["oficina"], "estilos": ["moderno"]}}
+"""
+    response = await ask_llama(prompt, use_cache=False, call_site="style_tags")
+    if not response.strip() or response.strip() == "[]":
+        return None
+    match = re.search(r'\{.*\}', response, re.DOTALL)
+    try:
+        result = json.loads(match.group(0)) if match else None
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        return None
+    tags = {
+        "ambientes": [a for a in result.get("ambientes", []) if a in AMBIENTE_KEYWORDS],
+        "estilos": [e for e in result.get("estilos", []) if e in ESTILO_KEYWORDS],
+    }
+    return json.dumps(tags, ensure_ascii=False)
+
+
+async def tag_catalog(products: List[Dict], store: EnrichmentStore = enrichment_store, tagger=llm_tagger,
+                      concurrency: int = ENRICHMENT_CONCURRENCY) -> Dict:
+    """Job por lotes: etiqueta los productos nuevos o modificados"""
+    # run_enrichment invalida los índices que leen de `store`
+    return await run_enrichment(STYLE_TAGS_KIND, products, tag_inputs, tagger,
+                                store=store, concurrency=concurrency)
+
+
+class StyleIndex(EnrichmentSnapshot):
+    """
+    Índice ambiente/estilo -> productos leído del almacén de enriquecimientos.
+    Los productos sin etiquetas vigentes se etiquetan al vuelo por palabras clave.
+    """
+
+    kind = STYLE_TAGS_KIND
+
+    def __init__(self, store: EnrichmentStore = enrichment_store, refresh_seconds: float = STYLE_INDEX_REFRESH):
+        super().__init__(store, refresh_seconds)
+        self._counters.update({"lookups": 0, "stored_tags": 0, "local_tags": 0})
+
+    def parse(self, value: str):
+        return json.loads(value)
+
+    @property
+    def available(self) -> bool:
+        """True si el job de etiquetado se ejecutó alguna vez"""
+        return bool(self._entries_now())
+
+    def tags_for(self, product: Dict) -> Dict[str, List[str]]:
+        entry = self._entries_now().get(str(product.get('id')))
+        if entry and entry[0] == input_hash(tag_inputs(product)):
+            self._counters["stored_tags"] += 1
+            return entry[1]
+        self._counters["local_tags"] += 1
+        return local_tags(product)
+
+    def lookup(self, products: List[Dict], ambiente: Optional[str] = None,
+               estilo: Optional[str] = None) -> List[Dict]:
+        """Productos con las etiquetas pedidas, los más vendidos primero"""
+        self._counters["lookups"] += 1
+        matches = []
+        for product in products:
+            if not isinstance(product, dict):
+                continue
+            tags = self.tags_for(product)
+            if ambiente and ambiente not in tags.get("ambientes", []):
+                continue
+            if estilo and estilo not in tags.get("estilos", []):
+                continue
+            matches.append(product)
+        matches.sort(key=lambda p: float(p.get('sales_count') or 0), reverse=True)
+        return matches
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        return {**self._counters, "tagged_products": len(self._entries)}
+
+
+# Instancia compartida por el proceso
+style_index = StyleIndex()
+_retag_task: Optional[asyncio.Task] = None
+
+
+def schedule_retagging(products: List[Dict]) -> bool:
+    """
+    Reetiqueta en segundo plano los productos que cambiaron (tras un cambio de
+    versión del catálogo). Solo si el catálogo ya se etiquetó alguna vez.
+    """
+    global _retag_task
+    if not style_index.available or (_retag_task is not None and not _retag_task.done()):
+        return False
+    tagger = LocalTagger() if STYLE_TAGGER == "local" else llm_tagger
+
+    async def retag():
+        # La tarea se crea dentro de una petición: no debe heredar su presupuesto de tiempo
+        use_deadline(None)
+        return await tag_catalog(products, tagger=tagger)
+
+    _retag_task = asyncio.create_task(retag())
+    return True
+
+
+async def main():
+    from db import get_all_products
+
+    tagger = LocalTagger() if "--local" in sys.argv else llm_tagger
+    products = await get_all_products()
+    summary = await tag_catalog(products, tagger=tagger)
+    print(f"Etiquetas de estilo: {summary}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger('summary_jobs')
+
+# Tiempo que se conserva un resumen generado en segundo plano
+SUMMARY_TTL = int(os.getenv("SUMMARY_TTL", str(10 * 60)))  # 10 minutos
+SUMMARY_MAX_WAIT = 30.0  # Espera máxima de un long-poll
+
+
+class SummaryJobs:
+    """Resúmenes generados en segundo plano, consultables por su ID"""
+
+    def __init__(self, ttl: float = SUMMARY_TTL):
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict] = {}
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "expired": 0}
+
+    def submit(self, summary_id: str, func: Callable[[], Awaitable[str]]):
+        """Lanza la generación del resumen sin bloquear la respuesta"""
+        self._purge_expired()
+        job = {
+            "status": "pending",
+            "response": None,
+            "created_at": time.time(),
+            "done": asyncio.Event(),
+        }
+        self._jobs[summary_id] = job
+        self._counters["submitted"] += 1
+        job["task"] = asyncio.create_task(self._run(summary_id, job, func))
+
+    async def _run(self, summary_id: str, job: Dict, func: Callable[[], Awaitable[str]]):
+        try:
+            job["response"] = await func()
+            job["status"] = "ready"
+            self._counters["completed"] += 1
+        except Exception as e:
+            logger.error(f"Error generando resumen {summary_id}: {e}")
+            job["status"] = "error"
+            self._counters["failed"] += 1
+        finally:
+            job["done"].set()
+
+    async def get(self, summary_id: str, wait: float = 0) -> Optional[Dict]:
+        """Estado del resumen; con `wait` espera hasta que esté listo (long-poll)"""
+        job = self._jobs.get(summary_id)
+        if job is None or self._is_expired(job):
+            return None
+        if wait > 0 and job["status"] == "pending":
+            try:
+                await asyncio.wait_for(job["done"].wait(), timeout=min(wait, SUMMARY_MAX_WAIT))
+            except asyncio.TimeoutError:
+                pass
+        return {"summary_id": summary_id, "status": job["status"], "response": job["response"]}
+
+    def _is_expired(self, job: Dict) -> bool:
+        return job["status"] != "pending" and time.time() - job["created_at"] > self.ttl
+
+    def _purge_expired(self):
+        expired = [sid for sid, job in self._jobs.items() if self._is_expired(job)]
+        for sid in expired:
+            del self._jobs[sid]
+        self._counters["expired"] += len(expired)
+
+    def stats(self) -> Dict:
+        """Contadores para el endpoint de métricas"""
+        pending = sum(1 for job in self._jobs.values() if job["status"] == "pending")
+        return {**self._counters, "pending": pending, "stored": len(self._jobs)}
+
+
+# Instancia compartida por el proceso
+summary_jobs = SummaryJobs()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el minado de consultas de los logs
+y el precalentado de cachés
+"""
+
+import asyncio
+import os
+import tempfile
+
+from cache_warmup import CacheWarmer, mine_top_queries, recent_log_files
+
+LOG_LINES = [
+    "2025-06-18 16:32:26 - INFO - Búsqueda iniciada - Tipo: generic | Original: 'tienes sillas??' | Normalizada: 'tienes sillas'",
+    "2025-06-18 16:33:08 - INFO - Búsqueda iniciada - Tipo: generic | Original: 'tienes otros ejemplos??' | Normalizada: 'tienes otros ejemplos'",
+    "2025-06-21 17:41:22 - INFO - Búsqueda iniciada - Tipo: product | Original: 'tienes silla' | Normalizada: 'tienes silla' | Continuación: False | Product Type: silla",
+    "2025-06-21 17:41:52 - INFO - Búsqueda iniciada - Tipo: generic | Original: 'tienes sillas' | Normalizada: 'tienes sillas' | Continuación: False | Product Type: silla",
+    "2025-06-21 17:42:10 - INFO - Búsqueda iniciada - Tipo: product | Original: 'mas' | Normalizada: 'silla' | Continuación: True | Product Type: silla",
+    "2025-06-21 17:42:30 - INFO - Total productos obtenidos: 40",
+]
+
+def write_logs(directory):
+    # Un log en cp1252 (como los escritos en Windows) y otro en UTF-8
+    with open(os.path.join(directory, "product_search_20250618.log"), "w", encoding="cp1252") as f:
+        f.write("\n".join(LOG_LINES[:2]) + "\n")
+    with open(os.path.join(directory, "product_search_20250621.log"), "w", encoding="utf-8") as f:
+        f.write("\n".join(LOG_LINES[2:]) + "\n")
+    return os.path.join(directory, "product_search_*.log")
+
+def test_mine_top_queries():
+    """Prueba el minado de consultas frecuentes en ambas codificaciones"""
+    pattern = write_logs(tempfile.mkdtemp())
+    files = recent_log_files(pattern, days=7)
+    assert os.path.basename(files[0]) == "product_search_20250621.log"
+    top = mine_top_queries(files, top_n=5, skip=lambda q: "otros" in q)
+    assert top == [("tienes sillas", 2), ("tienes silla", 1)]
+    assert mine_top_queries(recent_log_files(pattern, days=1), top_n=5) == [("tienes silla", 1), ("tienes sillas", 1)]
+
+def test_warmer_bounded_concurrency():
+    """Prueba que el precalentado respete la concurrencia y no se solape"""
+    warmed = []
+    state = {"active": 0, "max_active": 0}
+
+    async def warm(query):
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        if query == "falla":
+            raise RuntimeError("fallo simulado")
+        warmed.append(query)
+
+    async def scenario():
+        warmer = CacheWarmer(concurrency=2, min_headroom=0.5, headroom=lambda: 1.0)
+        queries = ["tienes sillas", "tienes camas", "sofa gris", "falla", "mesa de centro"]
+        assert warmer.schedule(queries, warm, "startup")
+        assert not warmer.schedule([], warm, "startup")
+        await warmer._task
+        return warmer.stats()
+
+    stats = asyncio.run(scenario())
+    assert state["max_active"] == 2
+    assert sorted(warmed) == ["mesa de centro", "sofa gris", "tienes camas", "tienes sillas"]
+    assert stats["warmed"] == 4 and stats["failed"] == 1
+    assert stats["last_run"]["reason"] == "startup"
+
+def test_round_requested_while_running_is_not_lost():
+    """Prueba que una ronda pedida durante otra se ejecute después, solo la más reciente"""
+    rounds = []
+
+    def source(name):
+        def mine():
+            rounds.append(name)
+            return [f"{name} sillas"]
+        return mine
+
+    async def warm(query):
+        await asyncio.sleep(0.01)
+
+    async def scenario():
+        warmer = CacheWarmer(headroom=lambda: 1.0)
+        assert warmer.schedule(source("startup"), warm, "startup")
+        assert warmer.schedule(source("v2"), warm, "catalog_version")
+        assert warmer.schedule(source("v3"), warm, "catalog_version")
+        assert warmer.stats()["pending"]
+        await warmer._task
+        return warmer.stats()
+
+    stats = asyncio.run(scenario())
+    assert rounds == ["startup", "v3"]
+    assert stats["runs"] == 2 and stats["superseded"] == 1 and not stats["pending"]
+    assert stats["last_run"]["reason"] == "catalog_version"
+
+if __name__ == "__main__":
+    test_mine_top_queries()
+    test_warmer_bounded_concurrency()
+    test_round_requested_while_running_is_not_lost()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar los endpoints de chat de main.py (SSE, resumen
+diferido, presupuesto de tiempo y token de productos mostrados) con la base de
+datos y el LLM reemplazados. Requiere fastapi y httpx (requirements.txt).
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Almacenes en un directorio temporal y sin tareas de fondo ajenas a las pruebas
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("CONVERSATION_DB", os.path.join(_tmp, "conversations.db"))
+os.environ.setdefault("ENRICHMENT_DB", os.path.join(_tmp, "enrichments.db"))
+os.environ.setdefault("WARMUP_ENABLED", "0")
+os.environ.setdefault("PREFETCH_ENABLED", "0")
+
+try:
+    from fastapi.testclient import TestClient
+    import llama_utils
+    import main
+except ImportError as e:  # Sin las dependencias del servidor no hay nada que probar
+    TestClient = None
+    MISSING_DEPENDENCY = str(e)
+
+# pytest no recoge este archivo si faltan las dependencias del servidor
+__test__ = TestClient is not None
+
+PRODUCTS = [
+    {"id": 1, "product_name": "Silla Nórdica", "type": "SIMPLE", "base_price": 120, "sales_count": 5},
+    {"id": 2, "product_name": "Silla de Comedor", "type": "SIMPLE", "base_price": 90, "sales_count": 3},
+    {"id": 3, "product_name": "Silla Gamer", "type": "SIMPLE", "base_price": 250, "sales_count": 1},
+    {"id": 4, "product_name": "Mesa de Centro", "type": "SIMPLE", "base_price": 80, "sales_count": 2},
+]
+
+class FakeLlama:
+    """Reemplaza las llamadas al proveedor LLM y registra los prompts recibidos"""
+
+    def __init__(self, response="Resumen de prueba.", chunks=("Hola ", "mundo.")):
+        self.response = response
+        self.chunks = chunks
+        self.prompts = []
+
+    async def request(self, prompt, max_retries, info=None):
+        self.prompts.append(prompt)
+        if info is not None:
+            info.update({"attempts": 1, "outcome": "ok"})
+        return self.response
+
+    async def stream(self, prompt, use_cache, info):
+        self.prompts.append(prompt)
+        info["outcome"] = "ok"
+        for chunk in self.chunks:
+            yield chunk
+
+@contextmanager
+def chat_client(llama: "FakeLlama"):
+    """TestClient de la app con la base de datos y el LLM reemplazados"""
+
+    async def get_all_products():
+        return [dict(p) for p in PRODUCTS]
+
+    async def no_rows():
+        return []
+
+    async def no_op():
+        return None
+
+    replacements = [
+        (main, "get_all_products", get_all_products),
+        (main, "get_all_templates", no_rows),
+        (main, "get_all_template_products", no_rows),
+        (main, "init_db", no_op),
+        (main, "close_db", no_op),
+        (llama_utils, "_request_llama", llama.request),
+        (llama_utils, "_stream_llama", llama.stream),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in replacements]
+    for module, name, value in replacements:
+        setattr(module, name, value)
+    try:
+        # El bloque `with` mantiene un solo event loop: las tareas de fondo sobreviven entre peticiones
+        with TestClient(main.app) as client:
+            yield client
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+
+def parse_sse(body: str):
+    """Lista de (evento, datos) de un cuerpo text/event-stream"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_stream_sends_products_then_tokens_then_done():
+    """Prueba que /chat/stream envíe productos, tokens y un evento final con la sesión"""
+    llama = FakeLlama()
+    with chat_client(llama) as client:
+        response = client.post("/chat/stream", json={"message": "2 sillas"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.text)
+        assert [name for name, _ in events] == ["products", "token", "token", "done"]
+        assert [p["id"] for p in events[0][1]["products"]] == ["1", "2"]
+        assert "".join(data["text"] for name, data in events if name == "token") == "Hola mundo."
+        done = events[-1][1]
+        assert done["last_products"] == ["1", "2"] and done["partial"] is False
+        assert len(llama.prompts) == 1
+
+        # La conversación quedó guardada: la continuación sigue con la silla restante
+        follow_up = client.post("/chat", json={"message": "tienes otros ejemplos", "session_id": done["session_id"]})
+        assert follow_up.status_code == 200
+        assert [p["id"] for p in follow_up.json()["products"]] == ["3"]
+
+def test_async_summary_is_polled():
+    """Prueba que summary_mode=async devuelva los productos ya y el resumen en /chat/summary"""
+    llama = FakeLlama(response="Dos sillas para tu comedor.")
+    with chat_client(llama) as client:
+        result = client.post("/chat", json={"message": "2 sillas", "summary_mode": "async"}).json()
+        assert result["response"] is None
+        assert result["summary_status"] == "pending"
+        assert [p["id"] for p in result["products"]] == ["1", "2"]
+
+        summary = client.get(f"/chat/summary/{result['summary_id']}", params={"wait": 5}).json()
+        assert summary["status"] == "ready"
+        assert summary["response"] == "Dos sillas para tu comedor."
+        assert client.get("/chat/summary/no-existe").status_code == 404
+
+def test_exhausted_deadline_returns_partial_result():
+    """Prueba que sin presupuesto de tiempo se respondan los productos con resumen local y partial=True"""
+    llama = FakeLlama()
+    main.llm_cache.clear()  # Un resumen en caché no necesita presupuesto
+    with chat_client(llama) as client:
+        result = client.post("/chat", json={"message": "2 sillas", "deadline_ms": 0}).json()
+        assert result["partial"] is True
+        assert [p["id"] for p in result["products"]] == ["1", "2"]
+        assert result["response"].startswith("Encontré 2 opciones relevantes")
+        assert llama.prompts == []  # El LLM no se llamó
+
+def test_last_products_token_round_trip():
+    """Prueba que el token de productos mostrados vaya y vuelva en lugar de la lista"""
+    with chat_client(FakeLlama()) as client:
+        first = client.post("/chat", json={"message": "2 sillas", "compact_last_products": True}).json()
+        assert "last_products" not in first
+        token = first["last_products_token"]
+
+        # Sesión nueva: lo ya mostrado solo viaja en el token
+        second = client.post("/chat", json={"message": "sillas", "last_products_token": token}).json()
+        assert [p["id"] for p in second["products"]] == ["3"]
+        assert "last_products" not in second and second["last_products_token"] != token
+
+def test_invalid_last_products_token_is_rejected():
+    """Prueba que un token de productos mostrados no válido responda 400"""
+    with chat_client(FakeLlama()) as client:
+        response = client.post("/chat", json={"message": "sillas", "last_products_token": "no-es-un-token"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "last_products_token no válido"
+
+if __name__ == "__main__":
+    if TestClient is None:
+        print(f"Pruebas de endpoints omitidas: {MISSING_DEPENDENCY}")
+    else:
+        test_stream_sends_products_then_tokens_then_done()
+        test_async_summary_is_polled()
+        test_exhausted_deadline_returns_partial_result()
+        test_last_products_token_round_trip()
+        test_invalid_last_products_token_is_rejected()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el circuit breaker del proveedor LLM
+"""
+
+import asyncio
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_breaker(clock):
+    return CircuitBreaker(window=10, min_calls=4, error_rate=0.5, slow_call_seconds=5.0,
+                          slow_rate=0.5, open_seconds=30.0, clock=clock)
+
+def test_opens_on_error_rate():
+    """Prueba que el breaker se abra al superar la tasa de errores"""
+    breaker = make_breaker(FakeClock())
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_success(0.2)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # Aún no hay suficientes llamadas
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.rejecting()
+    assert not breaker.allow_request()
+    print(f"✅ Abierto tras 2/4 errores: {breaker.stats()}")
+
+def test_opens_on_slow_calls():
+    """Prueba que las llamadas lentas también abran el breaker"""
+    breaker = make_breaker(FakeClock())
+    for latency in (6.0, 7.0, 0.1, 0.1):
+        breaker.allow_request()
+        breaker.record_success(latency)
+    assert breaker.state == OPEN
+
+def test_half_open_probe_closes_or_reopens():
+    """Prueba la llamada de prueba en semiabierto"""
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 31.0
+    assert not breaker.rejecting()
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()  # Solo una prueba a la vez
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 62.0
+    assert breaker.allow_request()
+    breaker.record_success(0.3)
+    assert breaker.state == CLOSED
+
+    transitions = breaker.stats()["transitions"]
+    assert transitions == {"closed->open": 1, "open->half_open": 2, "half_open->open": 1, "half_open->closed": 1}
+    print(f"✅ Transiciones: {transitions}")
+
+def open_breaker(clock):
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.allow_request()
+        breaker.record_failure()
+    clock.now += 31.0
+    return breaker
+
+def test_cancelled_probe_is_released():
+    """Prueba que una prueba cancelada por el presupuesto no deje el breaker semiabierto para siempre"""
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+
+    async def probe():
+        # Mismo patrón que _request_llama: la cancelación libera la prueba
+        assert breaker.allow_request()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+
+    async def scenario():
+        try:
+            await asyncio.wait_for(probe(), timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+    asyncio.run(scenario())
+    assert breaker.state == HALF_OPEN and not breaker.rejecting()
+    assert breaker.allow_request()
+    breaker.record_success(0.2)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["released_probes"] == 1
+
+def test_lost_probe_expires():
+    """Prueba que una prueba que nunca informa su resultado se libere tras el timeout de pruebas"""
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    assert breaker.allow_request()
+    clock.now += 10.0
+    assert breaker.rejecting() and not breaker.allow_request()
+    clock.now += breaker.probe_timeout
+    assert not breaker.rejecting()
+    assert breaker.allow_request()
+    assert breaker.stats()["probe_timeouts"] == 1
+
+if __name__ == "__main__":
+    test_opens_on_error_rate()
+    test_opens_on_slow_calls()
+    test_half_open_probe_closes_or_reopens()
+    test_cancelled_probe_is_released()
+    test_lost_probe_expires()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el almacenamiento de conversaciones en SQLite
+"""
+
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from conversation_store import (
+    ConversationStore, JsonConversationStore, SqliteConversationStore, migrate_json_conversations, shown_products
+)
+from history_policy import HISTORY_MAX_MESSAGES
+
+def make_store():
+    return SqliteConversationStore(os.path.join(tempfile.mkdtemp(), "conversations.db"))
+
+def message(text, summary_id=None, products_shown=("1", "2")):
+    msg = {"timestamp": datetime.now().isoformat(), "user_message": text, "query_type": "product",
+           "product_type": "silla", "products_shown": list(products_shown), "response": None}
+    if summary_id:
+        msg["summary_id"] = summary_id
+    return msg
+
+def test_append_and_load():
+    """Prueba que los mensajes se agreguen y se lean en orden, con los metadatos de la sesión"""
+    store = make_store()
+    session = store.load("s1")
+    assert session["conversation"] == []
+    session["preferencias"] = {"color": "gris"}
+    store.append_message(session, message("tienes sillas"))
+    store.append_message(session, message("tienes otros ejemplos??"))
+
+    loaded = store.load("s1")
+    assert [m["user_message"] for m in loaded["conversation"]] == ["tienes sillas", "tienes otros ejemplos??"]
+    assert loaded["preferencias"] == {"color": "gris"}
+    assert loaded["created_at"] == session["created_at"]
+    assert store.stats()["messages"] == 2
+
+def test_set_response_by_summary_id():
+    """Prueba que el resumen diferido complete solo su mensaje"""
+    store = make_store()
+    session = store.load("s1")
+    store.append_message(session, message("tienes sillas", summary_id="abc"))
+    store.append_message(session, message("tienes camas"))
+    assert store.set_response("s1", "abc", "Encontré 2 sillas")
+    assert not store.set_response("s1", "zzz", "nada")
+    conversation = store.load("s1")["conversation"]
+    assert conversation[0]["response"] == "Encontré 2 sillas"
+    assert conversation[1]["response"] is None
+
+def test_cleanup_by_age_and_count():
+    """Prueba la limpieza por edad y por cantidad, con borrado en cascada de mensajes"""
+    store = make_store()
+    old = store.load("vieja")
+    old["conversation"].append(message("hola"))
+    old["last_updated"] = (datetime.now() - timedelta(hours=3)).isoformat()
+    store.save(old, touch=False)
+    for i in range(3):
+        session = store.load(f"s{i}")
+        store.append_message(session, message("tienes sillas"))
+        time.sleep(0.01)
+
+    assert store.cleanup(max_age=2 * 60 * 60, max_sessions=2) == 2
+    stats = store.stats()
+    assert stats["sessions"] == 2
+    assert stats["messages"] == 2
+    assert store.load("vieja")["conversation"] == []
+    assert store.load("s0")["conversation"] == []
+    assert len(store.load("s2")["conversation"]) == 1
+
+def test_migrate_json_files():
+    """Prueba la migración de los archivos JSON existentes"""
+    directory = tempfile.mkdtemp()
+    json_store = JsonConversationStore(directory)
+    session = json_store.load("antigua")
+    json_store.append_message(session, message("tienes sillas", summary_id="abc"))
+    with open(os.path.join(directory, "rota.json"), "w", encoding="utf-8") as f:
+        f.write("{no es json")
+
+    store = make_store()
+    assert migrate_json_conversations(directory, store) == {"migrated": 1, "failed": 1}
+    loaded = store.load("antigua")
+    assert loaded["last_updated"] == session["last_updated"]
+    assert loaded["conversation"] == json.loads(json.dumps(session["conversation"]))
+    assert store.set_response("antigua", "abc", "listo")
+
+def test_shown_products_are_maintained_and_persisted():
+    """Prueba que el conjunto de productos mostrados se actualice por mensaje y se guarde con la sesión"""
+    store = make_store()
+    session = store.load("s1")
+    store.append_message(session, message("tienes sillas", products_shown=["27", "3"]))
+    store.append_message(session, message("tienes otros ejemplos??", products_shown=["3", "8"]))
+    assert shown_products(session) == {"27": 0, "3": 0, "8": 1}
+    assert list(shown_products(store.load("s1"))) == ["27", "3", "8"]
+
+def test_shown_products_backfill_for_old_sessions():
+    """Prueba que las sesiones guardadas sin el campo lo reconstruyan desde el historial"""
+    session = {"session_id": "vieja", "conversation": [
+        message("tienes sillas", products_shown=[27, 3]),
+        message("tienes otros ejemplos??", products_shown=[8]),
+    ]}
+    assert shown_products(session) == {"27": 0, "3": 0, "8": 1}
+    assert "shown_products" in session
+
+def test_append_cost_does_not_grow_with_the_session():
+    """Prueba que agregar un mensaje escriba las mismas filas con 5 o con 200 productos mostrados"""
+    store = make_store()
+    session = store.load("s1")
+    session["result_cursor"] = {"query": "sillas", "ids": [str(i) for i in range(200)], "offset": 4}
+    conn = store._connect()
+    changes = []
+    for i in range(50):
+        before = conn.total_changes
+        store.append_message(session, message(f"consulta {i}", products_shown=[f"{i}a", f"{i}b", f"{i}c", f"{i}d"]))
+        changes.append(conn.total_changes - before)
+    # Sesión + mensaje + 4 productos; el cursor y los productos anteriores no se reescriben.
+    # Al superar el límite del historial se suman el resumen y el mensaje resumido que se borra.
+    limit = HISTORY_MAX_MESSAGES
+    assert changes[1:limit] == [6] * (limit - 1) and changes[limit:] == [8] * (50 - limit)
+    assert conn.execute("SELECT meta FROM sessions").fetchone()[0] == "{}"
+    loaded = store.load("s1")
+    assert len(shown_products(loaded)) == 200 and list(shown_products(loaded))[:3] == ["0a", "0b", "0c"]
+    assert loaded["result_cursor"]["offset"] == 4
+
+def test_sessions_with_everything_in_meta_are_migrated():
+    """Prueba que una sesión guardada con todo en `meta` se lea igual y pase a las tablas por campo"""
+    store = make_store()
+    conn = store._connect()
+    meta = {"shown_products": {"27": 0, "3": 0, "8": 1}, "result_cursor": {"ids": ["5"], "offset": 0}}
+    with conn:
+        conn.execute("INSERT INTO sessions (session_id, created_at, last_updated, meta) VALUES (?, ?, ?, ?)",
+                     ("vieja", datetime.now().isoformat(), time.time(), json.dumps(meta)))
+    loaded = store.load("vieja")
+    assert list(shown_products(loaded)) == ["27", "3", "8"] and loaded["result_cursor"] == meta["result_cursor"]
+    assert conn.execute("SELECT meta FROM sessions").fetchone()[0] == "{}"
+    assert conn.execute("SELECT COUNT(*) FROM shown_products").fetchone()[0] == 3
+
+    del loaded["result_cursor"]
+    store.append_message(loaded, message("tienes camas", products_shown=["40"]))
+    again = store.load("vieja")
+    assert "result_cursor" not in again
+    assert shown_products(again) == {"27": 0, "3": 0, "8": 1, "40": 0}
+
+def test_incomplete_store_fails_on_creation():
+    """Prueba que un almacén sin todos los métodos de la interfaz no se pueda instanciar"""
+    class PartialStore(ConversationStore):
+        def load(self, session_id):
+            return {"session_id": session_id, "conversation": []}
+
+    for store_class in (ConversationStore, PartialStore):
+        try:
+            store_class()
+            raise AssertionError("Se esperaba TypeError")
+        except TypeError as e:
+            assert "abstract" in str(e)
+    assert isinstance(make_store(), ConversationStore)
+
+if __name__ == "__main__":
+    test_append_and_load()
+    test_set_response_by_summary_id()
+    test_cleanup_by_age_and_count()
+    test_migrate_json_files()
+    test_shown_products_are_maintained_and_persisted()
+    test_shown_products_backfill_for_old_sessions()
+    test_append_cost_does_not_grow_with_the_session()
+    test_sessions_with_everything_in_meta_are_migrated()
+    test_incomplete_store_fails_on_creation()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el presupuesto de tiempo por petición
+"""
+
+import asyncio
+
+from deadline import Deadline, start_deadline, current_deadline, use_deadline, request_budget, CHAT_DEADLINE_SECONDS
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_timeout_shrinks_to_remaining_budget():
+    """Prueba que el timeout de cada etapa se recorte al tiempo restante"""
+    clock = FakeClock()
+    deadline = Deadline(10, clock=clock)
+    assert deadline.timeout(30) == 10
+    clock.now = 8
+    assert deadline.timeout(30) == 2
+    clock.now = 12
+    assert deadline.expired
+    assert not deadline.exhausted
+    deadline.mark_exhausted("llm")
+    deadline.mark_exhausted("llm")
+    assert deadline.exhausted_stages == ["llm"]
+
+def test_deadline_propagates_to_tasks():
+    """Prueba que las etapas lanzadas como tareas vean el mismo presupuesto"""
+    async def stage():
+        return current_deadline()
+
+    async def run():
+        deadline = start_deadline(5)
+        assert await asyncio.create_task(stage()) is deadline
+        use_deadline(None)
+        assert await asyncio.create_task(stage()) is None
+
+    asyncio.run(run())
+
+def test_client_budget_is_capped():
+    """Prueba que el cliente solo pueda reducir el presupuesto"""
+    assert request_budget({}) == CHAT_DEADLINE_SECONDS
+    assert request_budget({"deadline_ms": 1500}) == 1.5
+    assert request_budget({"deadline_ms": 10 ** 9}) == CHAT_DEADLINE_SECONDS
+    assert request_budget({"deadline_ms": "abc"}) == CHAT_DEADLINE_SECONDS
+
+if __name__ == "__main__":
+    test_timeout_shrinks_to_remaining_budget()
+    test_deadline_propagates_to_tasks()
+    test_client_budget_is_capped()
+    print("✅ Pruebas de presupuesto completadas")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la política de historial (resumen y compresión)
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+from conversation_store import SqliteConversationStore, new_session, record_message, shown_products
+from history_policy import (
+    HISTORY_KEY, HISTORY_MAX_MESSAGES, decode_payload, encode_payload, fold_history, history_offset
+)
+from session_cache import SessionCache
+
+def make_store():
+    return SqliteConversationStore(os.path.join(tempfile.mkdtemp(), "conversations.db"))
+
+def message(i, summary_id=None):
+    msg = {"timestamp": f"2025-06-18T16:{i:02d}:00", "user_message": f"consulta {i}",
+           "query_type": "continuation" if i % 2 else "product", "product_type": "silla" if i < 3 else "cama",
+           "products_shown": [str(i)], "response": "Opciones disponibles: " * 20}
+    if summary_id:
+        msg["summary_id"] = summary_id
+    return msg
+
+def test_fold_keeps_recent_messages():
+    """Prueba que se conserven los últimos N mensajes y los anteriores queden resumidos"""
+    session = new_session("s1")
+    for i in range(6):
+        session["conversation"].append(message(i))
+    folded = fold_history(session, max_messages=4)
+    assert [m["user_message"] for m in folded] == ["consulta 0", "consulta 1"]
+    assert [m["user_message"] for m in session["conversation"]] == ["consulta 2", "consulta 3",
+                                                                    "consulta 4", "consulta 5"]
+    assert session[HISTORY_KEY]["product_types"] == {"silla": 2}
+    assert session[HISTORY_KEY]["last_product_type"] == "silla"
+    assert history_offset(session) == 2
+    assert fold_history(session, max_messages=4) == []
+    assert fold_history(session, max_messages=0) == []
+
+def test_record_message_keeps_shown_ids():
+    """Prueba que los IDs mostrados sobrevivan al resumen con su número de orden"""
+    session = new_session("s1")
+    for i in range(HISTORY_MAX_MESSAGES + 5):
+        record_message(session, message(i))
+    assert len(session["conversation"]) == HISTORY_MAX_MESSAGES
+    shown = shown_products(session)
+    assert list(shown) == [str(i) for i in range(HISTORY_MAX_MESSAGES + 5)]
+    assert shown["7"] == 7
+
+def test_payload_round_trip():
+    """Prueba que los mensajes se compriman y que el JSON sin comprimir se siga leyendo"""
+    msg = message(1)
+    data = encode_payload(msg)
+    assert isinstance(data, bytes) and len(data) < len(json.dumps(msg)) / 2
+    assert decode_payload(data) == msg
+    assert decode_payload(json.dumps(msg)) == msg
+    assert decode_payload(json.dumps(msg).encode()) == msg
+    assert encode_payload({"a": 1}) == '{"a": 1}'
+    assert encode_payload(msg, compression="none") == json.dumps(msg, ensure_ascii=False)
+
+def test_store_drops_folded_messages():
+    """Prueba que el almacén borre los mensajes resumidos y complete respuestas por número de orden"""
+    store = make_store()
+    session = store.load("s1")
+    total = HISTORY_MAX_MESSAGES + 5
+    for i in range(total):
+        store.append_message(session, message(i, summary_id=f"r{i}"))
+    assert store.stats()["messages"] == HISTORY_MAX_MESSAGES
+    assert store.set_response("s1", f"r{total - 1}", "Camas")
+    assert not store.set_response("s1", "r0", "ya resumido")
+
+    loaded = store.load("s1")
+    assert history_offset(loaded) == 5
+    assert loaded["conversation"][0]["user_message"] == "consulta 5"
+    assert loaded["conversation"][-1]["response"] == "Camas"
+    assert len(shown_products(loaded)) == total
+
+def test_cache_writes_capped_history():
+    """Prueba que la caché escriba solo lo vigente aunque se resuman mensajes aún no escritos"""
+    async def scenario():
+        store = make_store()
+        cache = SessionCache(store, flush_interval=10.0)
+        session = await cache.load("s1")
+        for i in range(HISTORY_MAX_MESSAGES + 3):
+            cache.append_message(session, message(i))
+        await cache.flush_all()
+        for i in range(HISTORY_MAX_MESSAGES + 3, HISTORY_MAX_MESSAGES + 6):
+            cache.append_message(session, message(i))
+        await cache.flush_all()
+        assert store.stats()["messages"] == HISTORY_MAX_MESSAGES
+        assert store.load("s1")["conversation"] == (await cache.load("s1"))["conversation"]
+        assert cache.stats()["dirty"] == 0
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_fold_keeps_recent_messages()
+    test_record_message_keeps_shown_ids()
+    test_payload_round_trip()
+    test_store_drops_folded_messages()
+    test_cache_writes_capped_history()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el token compacto de productos mostrados
+"""
+
+import json
+import random
+
+from id_token import decode_id_token, encode_id_token
+
+def test_round_trip():
+    """Prueba que el token conserve el conjunto de IDs"""
+    assert encode_id_token(["27", "3", "8"]) == "1.AwUT"
+    assert decode_id_token("1.AwUT") == ["3", "8", "27"]
+    assert decode_id_token(encode_id_token([])) == []
+    ids = [str(i) for i in random.Random(0).sample(range(1, 5_000_000), 500)]
+    assert set(decode_id_token(encode_id_token(ids + ids[:10]))) == set(ids)
+
+def test_token_is_smaller_than_list():
+    """Prueba que el token ocupe bastante menos que la lista en JSON"""
+    ids = [str(i) for i in range(1000, 1300)]
+    assert len(encode_id_token(ids)) * 3 < len(json.dumps(ids))
+
+def test_non_numeric_ids_keep_the_list():
+    """Prueba que los IDs no numéricos o no canónicos no se codifiquen"""
+    assert encode_id_token(["27", "a8c4"]) is None
+    assert encode_id_token(["007"]) is None
+    assert encode_id_token(["-3"]) is None
+
+def test_invalid_tokens():
+    """Prueba que los tokens mal formados se rechacen"""
+    for token in ["2.AwUT", "AwUT", "1.gA", "1." + "_" * 20, None]:
+        try:
+            decode_id_token(token)
+        except ValueError:
+            continue
+        raise AssertionError(f"Token aceptado: {token!r}")
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_token_is_smaller_than_list()
+    test_non_numeric_ids_keep_the_list()
+    test_invalid_tokens()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la contabilidad de llamadas al LLM
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from llm_accounting import Histogram, LLMAccounting, call_cost
+
+def test_histogram_quantiles():
+    """Prueba los cubos y cuantiles aproximados del histograma"""
+    histogram = Histogram([10, 100, 1000])
+    for value in [5, 50, 50, 500, 5000]:
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"le_10": 1, "le_100": 2, "le_1000": 1, "le_inf": 1}
+    assert snapshot["p50"] == 100
+    assert snapshot["p95"] is None  # Cae en el cubo +Inf
+
+def test_records_per_call_site():
+    """Prueba los contadores por punto de llamada"""
+    accounting = LLMAccounting(log_path=None)
+    accounting.record("summary", 0.8, "ok", prompt_tokens=400, completion_tokens=100, retries=1)
+    accounting.record("summary", 0.001, "cache_hit", cache_hit=True)
+    accounting.record("products", 2.5, "http_429", retries=2)
+    stats = accounting.stats()
+    summary = stats["call_sites"]["summary"]
+    assert summary["calls"] == 2
+    assert summary["cache_hits"] == 1
+    assert summary["retries"] == 1
+    assert summary["outcomes"] == {"ok": 1, "cache_hit": 1}
+    assert summary["latency_ms"]["count"] == 2
+    assert summary["total_tokens"]["count"] == 1  # Los aciertos de caché no cuentan tokens
+    assert summary["cost_usd"] == round(call_cost(400, 100), 6)
+    assert stats["call_sites"]["products"]["outcomes"] == {"http_429": 1}
+
+def test_call_log_round_trip():
+    """Prueba el registro JSONL y su análisis fuera de línea"""
+    path = os.path.join(tempfile.mkdtemp(), "llm_calls.jsonl")
+    accounting = LLMAccounting(log_path=path)
+    accounting.record("style", 1.2, "ok", prompt_tokens=900, completion_tokens=150)
+    accounting.record("style", 0.002, "cache_hit", cache_hit=True)
+    assert accounting.flush() == 2
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["o"] for line in lines] == ["ok", "cache_hit"]
+    replayed = LLMAccounting.from_log(path).stats()
+    assert replayed["call_sites"] == accounting.stats()["call_sites"]
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return f.readlines()
+
+def test_call_log_is_written_in_background():
+    """Prueba que `record` no escriba en disco y que el hilo y `close` escriban lo pendiente"""
+    path = os.path.join(tempfile.mkdtemp(), "llm_calls.jsonl")
+    accounting = LLMAccounting(log_path=path, flush_interval=60.0)
+    accounting.record("summary", 0.5, "ok", prompt_tokens=100)
+    assert read_lines(path) == [] and accounting.stats()["log_pending"] == 1
+    accounting.close()
+    assert len(read_lines(path)) == 1 and accounting.stats()["log_pending"] == 0
+
+    path = os.path.join(tempfile.mkdtemp(), "llm_calls.jsonl")
+    accounting = LLMAccounting(log_path=path, flush_interval=0.01)
+    accounting.record("summary", 0.5, "ok")
+    accounting.record("products", 0.7, "ok")
+    deadline = time.monotonic() + 2.0
+    while len(read_lines(path)) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(read_lines(path)) == 2
+    accounting.close()
+
+if __name__ == "__main__":
+    test_histogram_quantiles()
+    test_records_per_call_site()
+    test_call_log_round_trip()
+    test_call_log_is_written_in_background()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar los proveedores LLM y el servidor falso
+"""
+
+
+from fake_llm import FakeLLM, LatencyDistribution
+from llm_backend import STREAM_DONE, GroqBackend, OpenAICompatibleBackend, create_backend
+
+def test_create_backend():
+    """Prueba la selección del proveedor por configuración"""
+    groq = create_backend("groq", "", "llama3-70b-8192")
+    assert isinstance(groq, GroqBackend)
+    assert groq.chat_url == "https://api.groq.com/openai/v1/chat/completions"
+    fake = create_backend("openai", "http://localhost:9000/v1/", "fake-model")
+    assert fake.chat_url == "http://localhost:9000/v1/chat/completions"
+    assert fake.payload("hola", 0.7, stream=True)["stream"] is True
+    try:
+        create_backend("openai", "", "fake-model")
+        assert False, "Debería exigir LLM_BASE_URL"
+    except ValueError:
+        pass
+
+def test_fake_llm_round_trip():
+    """Prueba que las respuestas del servidor falso se lean con el proveedor"""
+    fake = FakeLLM(latency="fixed:0", script=[{"match": "sillas", "response": "[\"p1\", \"p2\"]"}], seed=1)
+    backend = OpenAICompatibleBackend("http://localhost:9000/v1", "fake-model")
+    content, usage = backend.parse_completion(fake.completion(fake.respond("busca sillas"), "fake-model", "busca sillas"))
+    assert content == "[\"p1\", \"p2\"]"
+    assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"] > 0
+    assert fake.respond("otra cosa") == "[]"
+
+    text = "Encontré  3 opciones para tu sala."
+    deltas = []
+    for chunk in fake.chunks(text):
+        line = fake.stream_chunk(chunk, "fake-model").strip()
+        deltas.append(backend.parse_stream_line(line))
+    assert "".join(deltas) == text
+    assert backend.parse_stream_line("data: [DONE]") is STREAM_DONE
+
+def test_fault_injection_rates():
+    """Prueba que las tasas de errores y 429 inyectadas se respeten"""
+    fake = FakeLLM(latency="uniform:0.1,0.2", error_rate=0.2, rate_limit_rate=0.1, seed=7)
+    outcomes = [fake.decide() for _ in range(2000)]
+    errors = sum(1 for o in outcomes if o["status"] == 500) / len(outcomes)
+    limited = sum(1 for o in outcomes if o["status"] == 429) / len(outcomes)
+    assert abs(errors - 0.2) < 0.03
+    assert abs(limited - 0.1) < 0.03
+    assert all(0.1 <= o["delay"] <= 0.2 for o in outcomes if o["status"] == 200)
+    print(f"✅ Inyección de fallos: {fake.stats()}")
+
+def test_latency_distributions():
+    """Prueba las especificaciones de latencia"""
+    import random
+    rng = random.Random(3)
+    samples = sorted(LatencyDistribution("lognormal:0.4,0.5", rng).sample() for _ in range(1001))
+    assert 0.35 < samples[500] < 0.45  # Mediana
+    assert LatencyDistribution("fixed:0.2", rng).sample() == 0.2
+    try:
+        LatencyDistribution("normal:1", rng)
+        assert False, "Debería rechazar distribuciones desconocidas"
+    except ValueError:
+        pass
+
+if __name__ == "__main__":
+    test_create_backend()
+    test_fake_llm_round_trip()
+    test_fault_injection_rates()
+    test_latency_distributions()
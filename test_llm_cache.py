@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la caché de respuestas del LLM
+"""
+
+import os
+import tempfile
+import time
+
+from llm_cache import LLMCache, make_cache_key, compute_catalog_version
+
+def test_lru_and_ttl():
+    """Prueba la expulsión LRU y la expiración por TTL"""
+    cache = LLMCache(max_entries=2, ttl=60)
+    cache.set("a", "respuesta a")
+    cache.set("b", "respuesta b")
+    assert cache.get("a") == "respuesta a"  # 'a' pasa a ser el más reciente
+    cache.set("c", "respuesta c")           # expulsa 'b'
+    assert cache.get("b") is None
+    assert cache.get("c") == "respuesta c"
+
+    cache.set("d", "respuesta d", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["evictions"] >= 1
+    print(f"✅ LRU/TTL: {stats}")
+
+def test_disk_tier_shared():
+    """Prueba que dos instancias compartan respuestas mediante SQLite"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "llm_cache.db")
+        writer = LLMCache(max_entries=10, ttl=60, db_path=db_path)
+        writer.set("clave", "desde disco")
+
+        reader = LLMCache(max_entries=10, ttl=60, db_path=db_path)
+        assert reader.get("clave") == "desde disco"
+        assert reader.stats()["disk_hits"] == 1
+        assert reader.get("clave") == "desde disco"
+        assert reader.stats()["memory_hits"] == 1
+    print("✅ Nivel en disco compartido")
+
+def test_key_includes_catalog_version():
+    """Prueba que un cambio de catálogo invalide las claves"""
+    products_v1 = [{"id": 1, "product_name": "Silla", "base_price": 100}]
+    products_v2 = [{"id": 1, "product_name": "Silla", "base_price": 120}]
+    v1 = compute_catalog_version(products_v1)
+    v2 = compute_catalog_version(products_v2)
+    assert v1 != v2
+    assert compute_catalog_version(list(reversed(products_v1))) == v1
+    # Las ventas y las alertas de stock no cambian la versión
+    assert compute_catalog_version([dict(products_v1[0], sales_count=9, stock_alert=True)]) == v1
+
+    key_v1 = make_cache_key("modelo", 0.7, "prompt", v1)
+    key_v2 = make_cache_key("modelo", 0.7, "prompt", v2)
+    assert key_v1 != key_v2
+    assert key_v1 == make_cache_key("modelo", 0.7, "prompt", v1)
+    assert key_v1 != make_cache_key("modelo", 0.2, "prompt", v1)
+    print("✅ Clave incluye versión de catálogo")
+
+if __name__ == "__main__":
+    test_lru_and_ttl()
+    test_disk_tier_shared()
+    test_key_includes_catalog_version()
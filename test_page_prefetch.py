@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el precálculo de la siguiente página de resultados
+"""
+
+import asyncio
+
+from page_prefetch import PagePrefetcher
+
+def make_prefetcher(**kwargs):
+    return PagePrefetcher(headroom=lambda: 1.0, **kwargs)
+
+def summary(text, delay=0.0):
+    async def compute():
+        await asyncio.sleep(delay)
+        return text
+    return compute
+
+def test_prefetched_page_is_used():
+    """Prueba que la continuación use el resumen precalculado, también si aún está en curso"""
+    async def scenario():
+        prefetcher = make_prefetcher()
+        assert prefetcher.schedule("s1", ["4", "5"], "v1", summary("Sillas 4 y 5"))
+        await asyncio.sleep(0.01)
+        assert await prefetcher.take("s1", ["4", "5"], "v1") == "Sillas 4 y 5"
+
+        prefetcher.schedule("s1", ["6", "7"], "v1", summary("Sillas 6 y 7", delay=0.05))
+        assert await prefetcher.take("s1", ["6", "7"], "v1") == "Sillas 6 y 7"
+        stats = prefetcher.stats()
+        assert stats["hits"] == 2 and stats["inflight_hits"] == 1 and stats["wasted"] == 0
+    asyncio.run(scenario())
+
+def test_mismatch_counts_as_waste():
+    """Prueba que una página distinta, de otro catálogo o reemplazada cuente como desperdicio"""
+    async def scenario():
+        prefetcher = make_prefetcher()
+        prefetcher.schedule("s1", ["4", "5"], "v1", summary("Sillas 4 y 5"))
+        await asyncio.sleep(0.01)
+        assert await prefetcher.take("s1", ["4", "5", "6"], "v1") is None
+
+        prefetcher.schedule("s1", ["4", "5"], "v1", summary("Sillas 4 y 5"))
+        await asyncio.sleep(0.01)
+        assert await prefetcher.take("s1", ["4", "5"], "v2") is None
+
+        prefetcher.schedule("s1", ["4", "5"], "v1", summary("lento", delay=1.0))
+        prefetcher.schedule("s1", ["6"], "v1", summary("Silla 6"))
+        assert await prefetcher.take("s2", ["1"], "v1") is None
+        stats = prefetcher.stats()
+        assert stats["wasted"] == 3
+        assert stats["misses"] == 3 and stats["hit_rate"] == 0.0
+    asyncio.run(scenario())
+
+def test_budget_limits_work():
+    """Prueba el límite de precálculos simultáneos, el margen del limitador y las páginas guardadas"""
+    async def scenario():
+        prefetcher = make_prefetcher(concurrency=1, max_entries=2)
+        assert prefetcher.schedule("s1", ["1"], "v1", summary("a", delay=0.02))
+        assert not prefetcher.schedule("s2", ["2"], "v1", summary("b"))
+        await asyncio.sleep(0.05)
+        assert prefetcher.schedule("s2", ["2"], "v1", summary("b"))
+        await asyncio.sleep(0.01)
+        assert prefetcher.schedule("s3", ["3"], "v1", summary("c"))
+        await asyncio.sleep(0.01)
+        stats = prefetcher.stats()
+        assert stats["skipped_budget"] == 1 and stats["stored"] == 2 and stats["wasted"] == 1
+        assert stats["active"] == 0
+
+        starved = PagePrefetcher(headroom=lambda: 0.1, min_headroom=0.5)
+        assert not starved.schedule("s1", ["1"], "v1", summary("a"))
+        assert starved.stats()["skipped_headroom"] == 1
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_prefetched_page_is_used()
+    test_mismatch_counts_as_waste()
+    test_budget_limits_work()
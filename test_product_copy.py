@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la generación por lotes de textos de producto
+"""
+
+import asyncio
+import os
+import tempfile
+
+from enrichment_store import EnrichmentStore, input_hash
+from product_copy import PRODUCT_COPY_KIND, ProductCopyIndex, copy_inputs, generate_catalog_copy, get_product_blurb
+
+CATALOG = [
+    {"id": 1, "product_name": "Silla de Oficina", "type": "SIMPLE", "base_price": 120, "sales_count": 3},
+    {"id": 2, "product_name": "Mesa de Centro Elegante", "type": "SIMPLE", "base_price": 80, "sales_count": 1},
+    {"id": 3, "product_name": "Cama Matrimonial", "type": "SIMPLE", "base_price": 300, "sales_count": 7},
+]
+
+def make_store():
+    return EnrichmentStore(os.path.join(tempfile.mkdtemp(), "enrichments.db"))
+
+class FakeGenerator:
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, product):
+        self.calls.append(product["id"])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if product["id"] in self.fail_ids:
+            raise RuntimeError("fallo simulado")
+        return f"{product['product_name']} a ${product['base_price']}."
+
+def test_generates_and_reads_blurbs():
+    """Prueba que el job genere los textos y que se lean sin LLM"""
+    store = make_store()
+    generator = FakeGenerator()
+    summary = asyncio.run(generate_catalog_copy(CATALOG, store=store, generate=generator, concurrency=2))
+    assert summary["generated"] == 3
+    assert generator.max_active <= 2
+    assert get_product_blurb(CATALOG[0], index=ProductCopyIndex(store)) == "Silla de Oficina a $120."
+
+def test_only_changed_rows_regenerate():
+    """Prueba que solo se regeneren los productos cuyos datos cambiaron"""
+    store = make_store()
+    asyncio.run(generate_catalog_copy(CATALOG, store=store, generate=FakeGenerator()))
+    index = ProductCopyIndex(store)
+    changed = [dict(CATALOG[0], base_price=99)] + CATALOG[1:]
+    assert get_product_blurb(changed[0], index=index) is None  # Texto obsoleto
+    generator = FakeGenerator()
+    summary = asyncio.run(generate_catalog_copy(changed, store=store, generate=generator))
+    assert generator.calls == [1]
+    assert summary["up_to_date"] == 2
+    # El job invalida los índices que leen del almacén que recibió
+    assert get_product_blurb(changed[0], index=index) == "Silla de Oficina a $99."
+
+def test_resumes_after_failures():
+    """Prueba que un nuevo lanzamiento continúe con los productos que fallaron"""
+    store = make_store()
+    summary = asyncio.run(generate_catalog_copy(CATALOG, store=store, generate=FakeGenerator(fail_ids={2})))
+    assert summary["failed"] == 1
+    generator = FakeGenerator()
+    summary = asyncio.run(generate_catalog_copy(CATALOG, store=store, generate=generator))
+    assert generator.calls == [2]
+    assert summary["generated"] == 1
+
+def test_blurbs_are_read_from_memory():
+    """Prueba que los textos se lean de memoria y se recarguen pasado el intervalo"""
+    store = make_store()
+    asyncio.run(generate_catalog_copy(CATALOG[:2], store=store, generate=FakeGenerator()))
+    index = ProductCopyIndex(store, refresh_seconds=60)
+    assert get_product_blurb(CATALOG[0], index=index) == "Silla de Oficina a $120."
+    assert get_product_blurb(CATALOG[2], index=index) is None
+    # Textos escritos por el job de otro proceso: se ven en la siguiente recarga
+    store.put(PRODUCT_COPY_KIND, 3, input_hash(copy_inputs(CATALOG[2])), "Cama Matrimonial a $300.")
+    assert get_product_blurb(CATALOG[2], index=index) is None  # Aún no se recarga
+    assert index.stats()["loads"] == 1 and store.stats()["hits"] == 0
+    index.refresh_seconds = 0
+    assert get_product_blurb(CATALOG[2], index=index) == "Cama Matrimonial a $300."
+    assert index.stats() == {"hits": 2, "misses": 2, "stale": 0, "loads": 2, "products": 3}
+
+def test_reload_does_not_block_the_event_loop():
+    """Prueba que con el event loop en marcha la recarga vaya a un hilo y la consulta no la espere"""
+    store = make_store()
+    asyncio.run(generate_catalog_copy(CATALOG[:2], store=store, generate=FakeGenerator()))
+    index = ProductCopyIndex(store, refresh_seconds=60)
+
+    async def scenario():
+        await index.refresh()
+        assert get_product_blurb(CATALOG[0], index=index) == "Silla de Oficina a $120."
+        store.put(PRODUCT_COPY_KIND, 3, input_hash(copy_inputs(CATALOG[2])), "Cama Matrimonial a $300.")
+        index.invalidate()
+        # La consulta responde con la copia actual y deja la recarga en segundo plano
+        assert get_product_blurb(CATALOG[2], index=index) is None
+        assert index.stats()["loads"] == 1
+        await index._refresh_task
+        assert get_product_blurb(CATALOG[2], index=index) == "Cama Matrimonial a $300."
+
+    asyncio.run(scenario())
+    assert index.stats()["loads"] == 2
+
+def test_job_invalidates_the_index_of_its_store():
+    """Prueba que el job invalide el índice de su almacén y no el de otros"""
+    store, other = make_store(), make_store()
+    index, other_index = ProductCopyIndex(store), ProductCopyIndex(other)
+    assert get_product_blurb(CATALOG[0], index=index) is None
+    assert get_product_blurb(CATALOG[0], index=other_index) is None
+    asyncio.run(generate_catalog_copy(CATALOG, store=store, generate=FakeGenerator()))
+    assert get_product_blurb(CATALOG[0], index=index) == "Silla de Oficina a $120."
+    assert index.stats()["loads"] == 2 and other_index.stats()["loads"] == 1
+
+if __name__ == "__main__":
+    test_generates_and_reads_blurbs()
+    test_only_changed_rows_regenerate()
+    test_resumes_after_failures()
+    test_blurbs_are_read_from_memory()
+    test_reload_does_not_block_the_event_loop()
+    test_job_invalidates_the_index_of_its_store()
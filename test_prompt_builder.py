@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la codificación compacta de prompts
+"""
+
+import json
+
+from prompt_builder import compact_json, encode_candidates, lexical_score, resolve_aliases
+from rate_limiter import estimate_tokens
+
+catalog = [
+    {"id": 10 + i, "n": f"Producto genérico {i}", "t": "SIMPLE"} for i in range(200)
+] + [
+    {"id": 3, "n": "Silla de Oficina", "t": "SIMPLE"},
+    {"id": 8, "n": "Silla de Comedor Acapulco", "t": "SIMPLE"},
+]
+
+def test_compact_json_has_no_whitespace():
+    """Prueba que el JSON compacto sea más corto que el indentado"""
+    data = [{"id": 1, "name": "Sofá", "attributes": {"color": "gris"}}]
+    compact = compact_json(data)
+    assert " " not in compact.replace("Sofá", "")
+    assert "Sofá" in compact  # sin escapes \u
+    assert len(compact) < len(json.dumps(data, indent=2))
+
+def test_budget_keeps_most_relevant():
+    """Prueba que el presupuesto conserve primero los candidatos relevantes"""
+    scores = [lexical_score("tienes sillas", c["n"]) for c in catalog]
+    block, aliases = encode_candidates(catalog, token_budget=100, scores=scores)
+    assert estimate_tokens(block) <= 110
+    assert len(aliases) < len(catalog)
+    assert set(list(aliases.values())[:2]) == {3, 8}
+    print(f"✅ {len(aliases)} de {len(catalog)} candidatos en ~{estimate_tokens(block)} tokens")
+
+def test_aliases_map_back_to_ids():
+    """Prueba la traducción de alias devueltos por el LLM"""
+    block, aliases = encode_candidates(catalog[:3], token_budget=1000)
+    assert block.splitlines()[0].startswith('{"k":"p1"')
+    assert resolve_aliases(["p2", "P1", "p2", "p99"], aliases) == [11, 10]
+
+if __name__ == "__main__":
+    test_compact_json_has_no_whitespace()
+    test_budget_keeps_most_relevant()
+    test_aliases_map_back_to_ids()
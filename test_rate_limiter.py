@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el limitador de peticiones a GROQ
+"""
+
+import asyncio
+
+from rate_limiter import GroqRateLimiter, RateLimitExceeded, TokenBucket, parse_duration, backoff_delay
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_parse_duration():
+    """Prueba el formato de duraciones de las cabeceras de GROQ"""
+    assert parse_duration("7.66s") == 7.66
+    assert abs(parse_duration("2m59.56s") - 179.56) < 1e-9
+    assert parse_duration("120ms") == 0.12
+    assert parse_duration("3") == 3.0
+    assert parse_duration(None) is None
+    assert parse_duration("nada") is None
+
+def test_backoff_is_bounded():
+    """Prueba que el backoff con jitter respete el tope"""
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=0.5, cap=8) <= 8
+
+def test_token_bucket_refill():
+    """Prueba el rellenado continuo de la cubeta"""
+    clock = FakeClock()
+    bucket = TokenBucket(60, 1.0, clock)
+    bucket.take(60)
+    assert bucket.wait_time(10) == 10
+    clock.now += 5
+    assert bucket.wait_time(10) == 5
+
+def test_rejects_when_wait_too_long():
+    """Prueba que las llamadas fallen rápido en vez de acumularse"""
+    async def run():
+        clock = FakeClock()
+        limiter = GroqRateLimiter(rpm=2, tpm=10000, max_queue=5, max_wait=1.0, clock=clock)
+        await limiter.acquire(100)
+        await limiter.acquire(100)
+        try:
+            await limiter.acquire(100)  # la siguiente petición tardaría 30s
+            assert False, "debió rechazarse"
+        except RateLimitExceeded:
+            pass
+        assert limiter.stats()["rejected"] == 1
+
+    asyncio.run(run())
+
+def test_headers_seed_limits():
+    """Prueba que las cabeceras de GROQ ajusten el estado del limitador"""
+    clock = FakeClock()
+    limiter = GroqRateLimiter(rpm=30, tpm=6000, clock=clock)
+    limiter.update_from_headers({
+        "x-ratelimit-limit-tokens": "12000",
+        "x-ratelimit-remaining-tokens": "500",
+        "x-ratelimit-remaining-requests": "14000",
+    })
+    stats = limiter.stats()
+    assert stats["tokens_per_minute"] == 12000
+    assert stats["tokens_available"] == 500
+
+    delay = limiter.penalize({"retry-after": "20"}, attempt=0)
+    assert delay >= 20
+    assert limiter.stats()["blocked_for_seconds"] >= 20
+    assert limiter.stats()["rate_limited_responses"] == 1
+
+def test_headroom():
+    """Prueba la fracción libre del límite más ajustado (usada por el precalentado)"""
+    clock = FakeClock()
+    limiter = GroqRateLimiter(rpm=10, tpm=1000, clock=clock)
+    assert limiter.headroom() == 1.0
+    asyncio.run(limiter.acquire(700))
+    assert abs(limiter.headroom() - 0.3) < 1e-9
+    limiter.penalize({"retry-after": "5"}, attempt=0)
+    assert limiter.headroom() == 0.0
+
+if __name__ == "__main__":
+    test_parse_duration()
+    test_backoff_is_bounded()
+    test_token_bucket_refill()
+    test_rejects_when_wait_too_long()
+    test_headers_seed_limits()
+    test_headroom()
+    print("✅ Pruebas del limitador completadas")
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el almacén de conversaciones en Redis
+(contra un servidor local compatible con el protocolo de Redis)
+"""
+
+import asyncio
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+
+from conversation_store import RedisConversationStore, SqliteConversationStore, shown_products
+from history_policy import HISTORY_MAX_MESSAGES, history_offset
+from resp_client import RespClient, RespError
+from session_cache import SessionCache
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """Servidor RESP en memoria con los comandos que usa el almacén (hashes, TTL, MULTI/EXEC)"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.hashes = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        self.clock = time.time
+        threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+    def _hash(self, key, create=False):
+        if key in self.expires and self.expires[key] <= self.clock():
+            self.hashes.pop(key, None)
+            self.expires.pop(key, None)
+        if create:
+            return self.hashes.setdefault(key, {})
+        return self.hashes.get(key, {})
+
+    def run(self, name, args):
+        if name == "PING":
+            return "PONG"
+        if name == "HSET":
+            target = self._hash(args[0], create=True)
+            added = sum(1 for field in args[1::2] if field not in target)
+            target.update(zip(args[1::2], args[2::2]))
+            return added
+        if name == "HSETNX":
+            target = self._hash(args[0], create=True)
+            if args[1] in target:
+                return 0
+            target[args[1]] = args[2]
+            return 1
+        if name == "HGET":
+            return self._hash(args[0]).get(args[1])
+        if name == "HGETALL":
+            return [item for pair in self._hash(args[0]).items() for item in pair]
+        if name == "HDEL":
+            target = self._hash(args[0])
+            return sum(1 for field in args[1:] if target.pop(field, None) is not None)
+        if name == "DEL":
+            removed = sum(1 for key in args if self._hash(key) and self.hashes.pop(key, None) is not None)
+            for key in args:
+                self.expires.pop(key, None)
+            return removed
+        if name == "EXPIRE":
+            if not self._hash(args[0]):
+                return 0
+            self.expires[args[0]] = self.clock() + int(args[1])
+            return 1
+        if name == "TTL":
+            if not self._hash(args[0]):
+                return -2
+            return round(self.expires[args[0]] - self.clock()) if args[0] in self.expires else -1
+        return RespError(f"ERR unknown command '{name}'")
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return [args[0].decode().upper()] + args[1:]
+
+    def write(self, reply):
+        if isinstance(reply, RespError):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self.write(r) for r in reply)
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    def handle(self):
+        queued = None
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            name, args = command[0], command[1:]
+            if name == "MULTI":
+                queued, reply = [], "OK"
+            elif name == "EXEC":
+                with self.server.lock:
+                    reply = [self.server.run(n, a) for n, a in queued]
+                queued = None
+            elif queued is not None:
+                queued.append((name, args))
+                reply = "QUEUED"
+            else:
+                with self.server.lock:
+                    reply = self.server.run(name, args)
+            self.wfile.write(self.write(reply))
+
+class CountingClient(RespClient):
+    """Cliente que cuenta las idas y vueltas al servidor y guarda los comandos enviados"""
+
+    def __init__(self, url):
+        super().__init__(url)
+        self.round_trips = 0
+        self.commands = []
+
+    def pipeline(self, commands):
+        self.round_trips += 1
+        self.commands.extend(commands)
+        return super().pipeline(commands)
+
+def message(text, products=(), summary_id=None):
+    msg = {"timestamp": "2025-06-18T16:30:00", "user_message": text, "query_type": "product",
+           "products_shown": list(products), "response": None}
+    if summary_id:
+        msg["summary_id"] = summary_id
+    return msg
+
+def test_round_trip_and_one_request_per_operation():
+    """Prueba que leer y escribir una sesión conserve los datos con una ida y vuelta por operación"""
+    server = FakeRedis()
+    client = CountingClient(server.url)
+    store = RedisConversationStore(client=client, ttl=600)
+    session = store.load("s1")
+    assert session["conversation"] == [] and client.round_trips == 1
+
+    store.append_message(session, message("tienes sillas", ["3", "8"], summary_id="r1"))
+    store.append_message(session, message("tienes otros ejemplos??", ["27"]))
+    session["result_cursor"] = {"offset": 3}
+    session["conversation"][0]["response"] = "Tenemos sillas"
+    client.round_trips = 0
+    assert store.write_changes(session, 2, {0})
+    loaded = store.load("s1")
+    assert client.round_trips == 2
+    assert [m["user_message"] for m in loaded["conversation"]] == ["tienes sillas", "tienes otros ejemplos??"]
+    assert loaded["conversation"][0]["response"] == "Tenemos sillas"
+    assert loaded["result_cursor"] == {"offset": 3}
+    assert list(shown_products(loaded)) == ["3", "8", "27"]
+
+    assert store.set_response("s1", "r1", "Sillas 3 y 8")
+    assert not store.set_response("s1", "otro", "nada")
+    assert store.load("s1")["conversation"][0]["response"] == "Sillas 3 y 8"
+    server.shutdown()
+    server.server_close()
+
+def test_sessions_expire_by_ttl():
+    """Prueba que cada escritura renueve el TTL y que las sesiones vencidas desaparezcan"""
+    server = FakeRedis()
+    store = RedisConversationStore(server.url, ttl=600)
+    session = store.load("s1")
+    store.append_message(session, message("tienes sillas"))
+    assert store.client.execute("TTL", "chat:session:{s1}") == 600
+    assert store.client.execute("TTL", "chat:session:{s1}:messages") == 600
+
+    server.clock = lambda: time.time() + 601
+    assert store.load("s1")["conversation"] == []
+    assert store.cleanup(600, 10) == 0 and store.expiry_entries() == []
+    server.shutdown()
+    server.server_close()
+
+def test_errors_and_reconnection():
+    """Prueba que los errores del servidor se lancen y que una conexión cerrada se reemplace"""
+    server = FakeRedis()
+    client = RespClient(server.url)
+    assert client.execute("PING") == "PONG"
+    try:
+        client.execute("NOPE")
+        raise AssertionError("Se esperaba RespError")
+    except RespError:
+        pass
+    for conn in client._idle:
+        conn.sock.close()
+    assert client.execute("PING") == "PONG"
+
+    store = RedisConversationStore(client=RespClient("redis://127.0.0.1:1/0"))
+    assert store.load("s1")["conversation"] == []
+    assert not store.save(store.load("s1"))
+    assert store.stats()["errors"] == 3
+    server.shutdown()
+    server.server_close()
+
+def test_folded_messages_are_removed():
+    """Prueba que los mensajes resumidos por la política de historial se borren del hash"""
+    server = FakeRedis()
+    store = RedisConversationStore(server.url)
+    session = store.load("s1")
+    for i in range(HISTORY_MAX_MESSAGES + 4):
+        store.append_message(session, message(f"consulta {i}", [str(i)], summary_id=f"r{i}"))
+    assert len(server.hashes[b"chat:session:{s1}:messages"]) == HISTORY_MAX_MESSAGES
+    assert store.set_response("s1", f"r{HISTORY_MAX_MESSAGES + 3}", "Sillas")
+    loaded = store.load("s1")
+    assert history_offset(loaded) == 4 and loaded["conversation"][0]["user_message"] == "consulta 4"
+    assert loaded["conversation"][-1]["response"] == "Sillas"
+    assert len(shown_products(loaded)) == HISTORY_MAX_MESSAGES + 4
+    server.shutdown()
+    server.server_close()
+
+def test_any_worker_serves_any_session():
+    """Prueba que dos workers con su propia caché vean los mensajes del otro"""
+    async def scenario():
+        server = FakeRedis()
+        first = SessionCache(RedisConversationStore(server.url), flush_interval=5.0)
+        second = SessionCache(RedisConversationStore(server.url))
+        assert first.flush_interval == 0.0
+
+        # Como en una petición: el mensaje se agrega y la respuesta espera a `commit`, sin flush_all
+        session = await first.load("s1")
+        first.append_message(session, message("tienes sillas", ["3"]))
+        assert await first.commit("s1")
+        session = await second.load("s1")
+        assert len(session["conversation"]) == 1
+        assert list(shown_products(session)) == ["3"]
+        second.append_message(session, message("tienes otros ejemplos??", ["8"]))
+        assert await second.commit("s1")
+
+        session = await first.load("s1")
+        assert [m["user_message"] for m in session["conversation"]] == ["tienes sillas", "tienes otros ejemplos??"]
+        assert list(shown_products(session)) == ["3", "8"]
+        assert first.stats()["revalidations"] == 1
+        server.shutdown()
+        server.server_close()
+    asyncio.run(scenario())
+
+def test_commit_waits_for_the_write():
+    """Prueba que `commit` espere la escritura en Redis y que sin almacén compartido no haga nada"""
+    async def scenario():
+        server = FakeRedis()
+        store = RedisConversationStore(server.url)
+        original = store.write_changes
+
+        def slow_write(*args, **kwargs):
+            time.sleep(0.05)
+            return original(*args, **kwargs)
+
+        store.write_changes = slow_write
+        cache = SessionCache(store)
+        session = await cache.load("s1")
+        cache.append_message(session, message("tienes sillas", ["3"]))
+        assert await cache.commit("s1")
+        assert cache.stats()["dirty"] == 0
+        assert len(RedisConversationStore(server.url).load("s1")["conversation"]) == 1
+        server.shutdown()
+        server.server_close()
+
+        local = SessionCache(SqliteConversationStore(os.path.join(tempfile.mkdtemp(), "c.db")), flush_interval=60.0)
+        session = await local.load("s1")
+        local.append_message(session, message("tienes sillas"))
+        assert await local.commit("s1")
+        assert local.stats()["dirty"] == 1  # Sigue en write-behind
+        await local.flush_all()
+    asyncio.run(scenario())
+
+def test_append_writes_only_what_changed():
+    """Prueba que agregar un mensaje no reescriba el cursor ni los productos ya mostrados"""
+    async def scenario():
+        server = FakeRedis()
+        client = CountingClient(server.url)
+        cache = SessionCache(RedisConversationStore(client=client))
+        session = await cache.load("s1")
+        session["result_cursor"] = {"query": "sillas", "ids": [str(i) for i in range(200)], "offset": 3}
+        cache.append_message(session, message("tienes sillas", ["0", "1", "2"]))
+        await cache.commit("s1")
+        sent = [c for c in client.commands if c[0] in ("HSET", "HSETNX", "HDEL")]
+        assert any(arg == "f:result_cursor" for c in sent for arg in c)
+
+        session = await cache.load("s1")
+        client.commands = []
+        cache.append_message(session, message("tienes otros ejemplos??", ["3"]))
+        await cache.commit("s1")
+        sent = [c for c in client.commands if c[0] in ("HSET", "HSETNX", "HDEL")]
+        assert not any(arg == "f:result_cursor" for c in sent for arg in c)
+        assert [c[2] for c in sent if c[0] == "HSETNX"] == ["3"]
+
+        loaded = RedisConversationStore(server.url).load("s1")
+        assert list(shown_products(loaded)) == ["0", "1", "2", "3"]
+        assert loaded["result_cursor"]["offset"] == 3
+        server.shutdown()
+        server.server_close()
+    asyncio.run(scenario())
+
+def test_sessions_with_everything_in_meta_are_migrated():
+    """Prueba que una sesión guardada con todo en `meta` se lea igual y pase a campos separados"""
+    server = FakeRedis()
+    store = RedisConversationStore(server.url)
+    meta = {"shown_products": {"27": 0, "3": 0}, "result_cursor": {"ids": ["5"], "offset": 0}}
+    store.client.execute("HSET", "chat:session:{vieja}", "created_at", "2025-06-18T16:30:00",
+                         "last_updated", time.time(), "meta", json.dumps(meta))
+    loaded = store.load("vieja")
+    assert list(shown_products(loaded)) == ["27", "3"] and loaded["result_cursor"] == meta["result_cursor"]
+    session_hash = server.hashes[b"chat:session:{vieja}"]
+    assert b"meta" not in session_hash and b"f:result_cursor" in session_hash
+    assert store.load("vieja") == loaded
+    server.shutdown()
+    server.server_close()
+
+if __name__ == "__main__":
+    test_round_trip_and_one_request_per_operation()
+    test_sessions_expire_by_ttl()
+    test_errors_and_reconnection()
+    test_folded_messages_are_removed()
+    test_any_worker_serves_any_session()
+    test_commit_waits_for_the_write()
+    test_append_writes_only_what_changed()
+    test_sessions_with_everything_in_meta_are_migrated()
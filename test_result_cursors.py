@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar los cursores de resultados de las continuaciones
+"""
+
+import time
+
+from result_cursors import CURSOR_KEY, ResultCursors
+
+CATALOG = [{"id": i, "product_name": f"Silla {i}"} for i in range(1, 11)]
+
+def test_pages_through_results_without_repeating():
+    """Prueba que las continuaciones paginen en orden y salten lo ya mostrado"""
+    cursors = ResultCursors()
+    session = {}
+    cursors.store(session, "sillas", "v1", ["5", "3", "9", "1", "7", "2"], served=2)
+    shown = {"5": 0, "3": 0, "1": 0}  # El "1" se mostró en otra consulta
+    page = cursors.next_page(session, "v1", shown, 2)
+    assert page == ["9", "7"]
+    assert cursors.next_page(session, "v1", shown, 2) == ["2"]
+    assert cursors.next_page(session, "v1", shown, 2) == []
+    products = cursors.products_for(page, CATALOG, "v1")
+    assert [p["product_name"] for p in products] == ["Silla 9", "Silla 7"]
+    assert cursors.stats()["pages"] == 3
+
+def test_invalid_cursor_falls_back_to_search():
+    """Prueba que un cursor vencido, de otro catálogo o inexistente obligue a buscar de nuevo"""
+    cursors = ResultCursors(ttl=60)
+    session = {}
+    assert cursors.next_page(session, "v1", {}, 2) is None
+
+    cursors.store(session, "sillas", "v1", ["1", "2", "3"], served=1)
+    assert cursors.next_page(session, "v2", {}, 2) is None
+    assert CURSOR_KEY not in session
+
+    cursors.store(session, "sillas", "v1", ["1", "2", "3"], served=1)
+    assert cursors.next_page(session, "v1", {}, 2, now=time.time() + 120) is None
+    stats = cursors.stats()
+    assert stats["missing"] == 1 and stats["stale_catalog"] == 1 and stats["expired"] == 1
+
+def test_cursor_is_bounded_and_cleared():
+    """Prueba el límite de resultados guardados y el borrado con una consulta nueva"""
+    cursors = ResultCursors(max_ids=3)
+    session = {}
+    cursors.store(session, "sillas", "v1", range(10), served=0)
+    assert session[CURSOR_KEY]["ids"] == ["0", "1", "2"]
+    cursors.clear(session)
+    assert CURSOR_KEY not in session
+
+def test_capped_cursor_falls_back_to_search():
+    """Prueba que al agotar un cursor recortado se vuelva a buscar en lugar de responder vacío"""
+    cursors = ResultCursors(max_ids=4)
+    session = {}
+    cursors.store(session, "sillas", "v1", range(10), served=2)
+    shown = {"0": 0, "1": 0}
+    assert cursors.peek(session, "v1", shown, 2) == ["2", "3"]
+    assert cursors.next_page(session, "v1", shown, 2) == ["2", "3"]
+    shown.update({"2": 0, "3": 0})
+    assert cursors.peek(session, "v1", shown, 2) == []
+    assert cursors.next_page(session, "v1", shown, 2) is None
+    assert CURSOR_KEY not in session
+    assert cursors.stats()["capped"] == 1
+
+    # Sin recorte, el final de los resultados es una página vacía
+    cursors.store(session, "sillas", "v1", range(4), served=4)
+    assert cursors.next_page(session, "v1", {}, 2) == []
+
+if __name__ == "__main__":
+    test_pages_through_results_without_repeating()
+    test_invalid_cursor_falls_back_to_search()
+    test_cursor_is_bounded_and_cleared()
+    test_capped_cursor_falls_back_to_search()
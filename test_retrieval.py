@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la recuperación local de candidatos
+con consultas reales de los logs (replay)
+"""
+
+import retrieval
+from retrieval import retrieve_candidates, search_products_locally, tokenize
+
+SILLAS = [
+    (1, "Silla Ergonómica Ejecutiva"), (3, "Silla de Oficina"), (8, "Silla de Comedor Acapulco"),
+    (27, "Sillas Plegables para Eventos"), (32, "Silla de Comedor Moderna"), (34, "Silla de Oficina Giratoria"),
+    (36, "Silla Plegable para Terraza"), (38, "Silla de Escritorio Juvenil"), (40, "Silla de Barra Alta"),
+]
+OTROS = [
+    (2, "Mesa de Centro Elegante"), (4, "Sofá de 3 Plazas"), (5, "Lámpara de Pie Moderna"),
+    (6, "Estantería de Madera"), (7, "Cama Matrimonial"), (9, "Armario de Dormitorio"),
+    (10, "Cama Nido Juvenil"), (11, "Mesa de Comedor Moderna"), (12, "Cortina Blackout"),
+    (13, "Alfombra Persa"), (14, "Velador Nórdico"), (15, "Biombo de Bambú"),
+]
+
+# Orden de tabla: los productos que no son sillas aparecen primero
+CATALOG = [
+    {"id": pid, "product_name": name, "type": "SIMPLE", "description": "", "sales_count": pid}
+    for pid, name in OTROS + SILLAS
+]
+
+# (consulta, ids relevantes)
+REPLAY = [
+    ("tienes sillas", {pid for pid, _ in SILLAS}),
+    ("tienes sila", {pid for pid, _ in SILLAS}),
+    ("tienes alguna solla??", {pid for pid, _ in SILLAS}),
+    ("tienes camas??", {7, 10}),
+    ("dame unas sillas de comedor", {8, 32}),
+]
+
+def precision_at_k(ranked_ids, relevant, k):
+    top = ranked_ids[:k]
+    return sum(1 for pid in top if pid in relevant) / max(1, min(k, len(relevant)))
+
+def test_tokenize_handles_plurals():
+    """Prueba la reducción de plurales y palabras vacías"""
+    assert tokenize("tienes sillas de comedor") == ["silla", "comedor"]
+    assert tokenize("sillones") == ["sillon"]
+
+def test_replay_precision_beats_table_order():
+    """Prueba que la recuperación local supere al orden de tabla en el replay"""
+    k = 5
+    table_order = [p["id"] for p in CATALOG]
+    for query, relevant in REPLAY:
+        retrieved, scores = retrieve_candidates(CATALOG, query, k=k)
+        ranked_ids = [p["id"] for p in retrieved]
+        assert len(retrieved) == k
+        retrieval_precision = precision_at_k(ranked_ids, relevant, k)
+        baseline_precision = precision_at_k(table_order, relevant, k)
+        print(f"🔍 '{query}': recuperación {retrieval_precision:.2f} vs orden de tabla {baseline_precision:.2f}")
+        assert retrieval_precision == 1.0
+        assert retrieval_precision >= baseline_precision
+
+def test_color_facet():
+    """Prueba que el color de los atributos influya en el orden"""
+    catalog = [
+        {"id": 1, "product_name": "Sofá Moderno", "attributes": {"color": "negro"}},
+        {"id": 2, "product_name": "Sofá Moderno", "attributes": {"color": "gris"}},
+    ]
+    retrieved, _ = retrieve_candidates(catalog, "sofa gris", k=2)
+    assert retrieved[0]["id"] == 2
+
+def test_known_catalog_version_skips_hashing():
+    """Prueba que con la versión del catálogo no se vuelva a calcular su hash en cada consulta"""
+    catalog = [{"id": 1, "product_name": "Sofá Moderno"}, {"id": 2, "product_name": "Silla de Oficina"}]
+    original = retrieval.compute_catalog_version
+    calls = []
+
+    def counting_version(products):
+        calls.append(len(products))
+        return original(products)
+
+    retrieval.compute_catalog_version = counting_version
+    try:
+        for _ in range(3):
+            retrieve_candidates(catalog, "silla", k=1, catalog_version="test-v1")
+            assert search_products_locally(catalog, "sofa", catalog_version="test-v1")[0]["id"] == 1
+        assert calls == []
+        retrieve_candidates(catalog, "silla", k=1)
+        assert calls == [2]
+    finally:
+        retrieval.compute_catalog_version = original
+
+if __name__ == "__main__":
+    test_tokenize_handles_plurals()
+    test_replay_precision_beats_table_order()
+    test_color_facet()
+    test_known_catalog_version_skips_hashing()
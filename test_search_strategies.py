@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la ejecución secuencial y especulativa
+de las estrategias de búsqueda
+"""
+
+import asyncio
+import time
+
+from search_strategies import StrategyRunner
+
+def make_strategy(result, delay, log, name):
+    async def strategy():
+        log.append(f"{name}:inicio")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(f"{name}:cancelada")
+            raise
+        log.append(f"{name}:fin")
+        return result
+    return strategy
+
+def test_sequential_stops_at_first_hit():
+    """Prueba que el modo secuencial no arranque estrategias innecesarias"""
+    log = []
+    runner = StrategyRunner(mode="sequential")
+    name, result = asyncio.run(runner.run([
+        ("texto", make_strategy([{"id": 1}], 0, log, "texto")),
+        ("semantica", make_strategy([{"id": 2}], 0, log, "semantica")),
+    ]))
+    assert (name, result) == ("texto", [{"id": 1}])
+    assert log == ["texto:inicio", "texto:fin"]
+
+def test_speculative_cancels_slower_strategies():
+    """Prueba que el modo especulativo cancele las estrategias lentas al ganar una prioritaria"""
+    log = []
+    runner = StrategyRunner(mode="speculative")
+    started = time.monotonic()
+    name, result = asyncio.run(runner.run([
+        ("texto", make_strategy([], 0.01, log, "texto")),
+        ("semantica", make_strategy([{"id": 2}], 0.05, log, "semantica")),
+        ("estilo", make_strategy([{"id": 3}], 5.0, log, "estilo")),
+    ]))
+    elapsed = time.monotonic() - started
+    assert (name, result) == ("semantica", [{"id": 2}])
+    assert "estilo:cancelada" in log
+    assert elapsed < 1.0
+    stats = runner.stats()["strategies"]
+    assert stats["semantica"]["wins"] == 1
+    assert stats["estilo"]["cancelled"] == 1
+    print(f"✅ Especulativo en {elapsed * 1000:.0f}ms: {stats}")
+
+def test_priority_beats_faster_lower_strategy():
+    """Prueba que una estrategia rápida de menor prioridad no gane a una prioritaria"""
+    log = []
+    runner = StrategyRunner(mode="speculative")
+    name, _ = asyncio.run(runner.run([
+        ("texto", make_strategy([{"id": 1}], 0.03, log, "texto")),
+        ("semantica", make_strategy([{"id": 2}], 0, log, "semantica")),
+    ]))
+    assert name == "texto"
+
+def test_min_results_falls_back_to_best_partial():
+    """Prueba que sin suficientes resultados se use el primero no vacío por prioridad"""
+    log = []
+    runner = StrategyRunner(mode="sequential", min_results=3)
+    name, result = asyncio.run(runner.run([
+        ("texto", make_strategy([{"id": 1}], 0, log, "texto")),
+        ("semantica", make_strategy([], 0, log, "semantica")),
+    ]))
+    assert (name, result) == ("texto", [{"id": 1}])
+    assert "semantica:fin" in log
+
+if __name__ == "__main__":
+    test_sequential_stops_at_first_hit()
+    test_speculative_cancels_slower_strategies()
+    test_priority_beats_faster_lower_strategy()
+    test_min_results_falls_back_to_best_partial()
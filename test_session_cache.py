@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar la caché de sesiones con escritura diferida
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from conversation_store import SqliteConversationStore
+from session_cache import SessionCache
+
+class SlowStore(SqliteConversationStore):
+    """Almacén SQLite con disco lento y registro de escrituras"""
+
+    def __init__(self, delay=0.0):
+        super().__init__(os.path.join(tempfile.mkdtemp(), "conversations.db"))
+        self.delay = delay
+        self.batches = []
+        self.fail_next = 0
+
+    def write_changes(self, session_data, start, updated=(), removed=(), fields=None):
+        time.sleep(self.delay)
+        if self.fail_next:
+            self.fail_next -= 1
+            return False
+        self.batches.append((start, len(session_data["conversation"]), sorted(updated)))
+        return super().write_changes(session_data, start, updated, removed, fields)
+
+def message(text, summary_id=None):
+    msg = {"timestamp": "2025-06-18T16:30:00", "user_message": text, "query_type": "product",
+           "products_shown": [], "response": None}
+    if summary_id:
+        msg["summary_id"] = summary_id
+    return msg
+
+def test_appends_are_coalesced_and_readable():
+    """Prueba que los mensajes seguidos se escriban juntos y que la lectura vea lo pendiente"""
+    async def scenario():
+        store = SlowStore()
+        cache = SessionCache(store, flush_interval=0.05)
+        session = await cache.load("s1")
+        cache.append_message(session, message("tienes sillas"))
+        cache.append_message(session, message("tienes otros ejemplos??"))
+        assert store.batches == []
+        assert len((await cache.load("s1"))["conversation"]) == 2
+        await cache.flush_all()
+        assert store.batches == [(0, 2, [])]
+        assert cache.stats()["dirty"] == 0
+        assert len(store.load("s1")["conversation"]) == 2
+    asyncio.run(scenario())
+
+def test_slow_disk_does_not_block_the_loop():
+    """Prueba que un disco lento no frene el event loop"""
+    async def scenario():
+        store = SlowStore(delay=0.2)
+        cache = SessionCache(store, flush_interval=0.0)
+        session = await cache.load("s1")
+        started = time.monotonic()
+        cache.append_message(session, message("tienes sillas"))
+        assert time.monotonic() - started < 0.05
+        # Mientras la escritura está en curso, el loop atiende otras tareas
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert ticks == 5 and time.monotonic() - started < 0.15
+        cache.append_message(session, message("tienes camas"))
+        await cache.flush_all()
+        assert [m["user_message"] for m in store.load("s1")["conversation"]] == ["tienes sillas", "tienes camas"]
+    asyncio.run(scenario())
+
+def test_set_response_after_flush_and_retry():
+    """Prueba el resumen diferido sobre un mensaje ya escrito y el reintento tras un fallo"""
+    async def scenario():
+        store = SlowStore()
+        cache = SessionCache(store, flush_interval=0.0, retry_delay=0.01)
+        session = await cache.load("s1")
+        cache.append_message(session, message("tienes sillas", summary_id="abc"))
+        await cache.flush_all()
+        store.fail_next = 1
+        assert await cache.set_response("s1", "abc", "Encontré 2 sillas")
+        assert not await cache.set_response("s1", "zzz", "nada")
+        await cache.flush_all()
+        assert store.batches[-1] == (1, 1, [0])
+        assert cache.stats()["flush_errors"] == 1
+        assert store.load("s1")["conversation"][0]["response"] == "Encontré 2 sillas"
+    asyncio.run(scenario())
+
+def test_reads_are_served_from_memory():
+    """Prueba que las lecturas repetidas no vuelvan al almacén"""
+    async def scenario():
+        store = SlowStore()
+        cache = SessionCache(store, flush_interval=10.0)
+        loads = []
+        original = store.load
+        store.load = lambda session_id: loads.append(session_id) or original(session_id)
+        session = await cache.load("s1")
+        cache.append_message(session, message("tienes sillas"))
+        for _ in range(3):
+            assert (await cache.load("s1")) is session
+        assert loads == ["s1"]
+        stats = cache.stats()
+        assert stats["hits"] == 3 and stats["misses"] == 1 and stats["hit_rate"] == 0.75
+        assert stats["dirty"] == 1 and store.batches == []
+        await cache.flush_all()
+        assert cache.stats()["dirty"] == 0 and store.batches == [(0, 1, [])]
+    asyncio.run(scenario())
+
+def test_eviction_respects_budget_and_flushes_dirty_sessions():
+    """Prueba que el presupuesto de bytes expulse las sesiones menos usadas y escriba sus cambios"""
+    async def scenario():
+        store = SlowStore(delay=0.05)
+        cache = SessionCache(store, max_bytes=600, flush_interval=10.0)
+        for i in range(4):
+            session = await cache.load(f"s{i}")
+            cache.append_message(session, message("x" * 100))
+        stats = cache.stats()
+        assert stats["bytes"] <= 600
+        assert stats["evictions"] >= 1 and stats["dirty_evictions"] == stats["evictions"]
+        # La sesión expulsada sigue legible mientras se escribe
+        assert len((await cache.load("s0"))["conversation"]) == 1
+        await cache.flush_all()
+        for i in range(4):
+            assert len(store.load(f"s{i}")["conversation"]) == 1
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_appends_are_coalesced_and_readable()
+    test_slow_disk_does_not_block_the_loop()
+    test_set_response_after_flush_and_retry()
+    test_reads_are_served_from_memory()
+    test_eviction_respects_budget_and_flushes_dirty_sessions()
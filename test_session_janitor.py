@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el índice de vencimientos y la limpieza de sesiones
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from conversation_store import SqliteConversationStore, new_session
+from session_cache import ExpiryIndex, SessionCache
+from session_janitor import FileLock, SessionJanitor
+
+def make_store():
+    return SqliteConversationStore(os.path.join(tempfile.mkdtemp(), "conversations.db"))
+
+def save_session(store, session_id, age):
+    session = new_session(session_id)
+    session["last_updated"] = datetime.fromtimestamp(time.time() - age).isoformat()
+    store.save(session, touch=False)
+
+def test_expiry_index_pops_oldest_first():
+    """Prueba que el índice entregue primero las sesiones más antiguas y salte las reactivadas"""
+    index = ExpiryIndex()
+    index.touch("a", 10)
+    index.touch("b", 5)
+    index.touch("c", 30)
+    index.touch("a", 40)
+    assert index.pop_expired(cutoff=35, limit=10) == ["b", "c"]
+    assert len(index) == 1 and "a" in index
+    index.touch("d", 1)
+    index.touch("e", 2)
+    assert index.pop_expired(cutoff=100, limit=2) == ["d", "e"]
+    index.discard("a")
+    assert index.pop_expired(cutoff=100, limit=10) == []
+
+def test_file_lock_is_exclusive():
+    """Prueba que solo una instancia tenga el candado a la vez"""
+    path = os.path.join(tempfile.mkdtemp(), "conversations.db.cleanup.lock")
+    first, second = FileLock(path), FileLock(path)
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire() and second.held
+    second.release()
+
+def test_only_the_leader_deletes_expired_sessions():
+    """Prueba que el líder borre las sesiones vencidas por lotes y el otro worker solo libere su caché"""
+    async def scenario():
+        store = make_store()
+        for i in range(5):
+            save_session(store, f"old{i}", age=3 * 3600)
+        save_session(store, "fresh", age=60)
+
+        leader = SessionJanitor(store, SessionCache(store), batch=3, max_age=7200, sweep_interval=3600)
+        follower_cache = SessionCache(store)
+        follower = SessionJanitor(store, follower_cache, batch=3, max_age=7200, sweep_interval=3600)
+        leader._last_sweep = follower._last_sweep = time.time()
+
+        await follower_cache.load("old0")
+        result = await leader.run_once()
+        assert result["leader"] and result["expired"] == 3 and result["deleted"] == 3
+        result = await follower.run_once()
+        assert not result["leader"] and result["forgotten"] == 1 and result["deleted"] == 0
+        assert follower_cache.stats()["entries"] == 0
+
+        result = await leader.run_once()
+        assert result["deleted"] == 2
+        assert [sid for sid, _ in store.expiry_entries()] == ["fresh"]
+
+        await leader.stop()
+        assert (await follower.run_once())["leader"]
+        await follower.stop()
+    asyncio.run(scenario())
+
+def test_recent_write_is_not_deleted():
+    """Prueba que no se borre una sesión que otro worker actualizó después del vencimiento"""
+    async def scenario():
+        store = make_store()
+        save_session(store, "s1", age=3 * 3600)
+        janitor = SessionJanitor(store, SessionCache(store), max_age=7200, sweep_interval=3600)
+        janitor._last_sweep = time.time()
+        await janitor._try_lead()
+        save_session(store, "s1", age=0)
+        result = await janitor.run_once()
+        assert result["expired"] == 1 and result["deleted"] == 0
+        assert store.load("s1") is not None
+        await janitor.stop()
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_expiry_index_pops_oldest_first()
+    test_file_lock_is_exclusive()
+    test_only_the_leader_deletes_expired_sessions()
+    test_recent_write_is_not_deleted()
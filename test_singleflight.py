@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el agrupamiento de llamadas idénticas al LLM
+"""
+
+import asyncio
+
+from deadline import current_deadline, start_deadline, use_deadline
+from singleflight import SingleFlight
+
+def test_concurrent_calls_share_result():
+    """Prueba que llamadas concurrentes con la misma clave ejecuten una sola vez"""
+    async def run():
+        flight = SingleFlight()
+        executions = 0
+
+        async def fake_llm():
+            nonlocal executions
+            executions += 1
+            await asyncio.sleep(0.05)
+            return "Encontré 3 sillas"
+
+        results = await asyncio.gather(*[flight.do("tienes sillas", fake_llm) for _ in range(10)])
+        assert results == ["Encontré 3 sillas"] * 10
+        assert executions == 1
+        stats = flight.stats()
+        assert stats["collapsed"] == 9
+        assert stats["in_flight"] == 0
+
+        # Una vez terminada, la siguiente llamada vuelve a ejecutar
+        await flight.do("tienes sillas", fake_llm)
+        assert executions == 2
+        print(f"✅ Llamadas agrupadas: {stats}")
+
+    asyncio.run(run())
+
+def test_cancelled_waiter_does_not_cancel_others():
+    """Prueba que cancelar a un cliente no afecte a los demás"""
+    async def run():
+        flight = SingleFlight()
+
+        async def fake_llm():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        first = asyncio.create_task(flight.do("k", fake_llm))
+        second = asyncio.create_task(flight.do("k", fake_llm))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "ok"
+        assert first.cancelled()
+        assert flight.stats()["abandoned"] == 0
+
+    asyncio.run(run())
+
+def test_all_waiters_cancelled_cancels_call():
+    """Prueba que la llamada compartida se cancele si nadie la espera"""
+    async def run():
+        flight = SingleFlight()
+        finished = False
+
+        async def fake_llm():
+            nonlocal finished
+            await asyncio.sleep(1)
+            finished = True
+
+        waiter = asyncio.create_task(flight.do("k", fake_llm))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+        assert not finished
+        assert flight.in_flight() == 0
+        assert flight.stats()["abandoned"] == 1
+
+    asyncio.run(run())
+
+def test_errors_propagate_to_all_waiters():
+    """Prueba que un error llegue a todos los clientes agrupados"""
+    async def run():
+        flight = SingleFlight()
+
+        async def failing_llm():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("fallo de GROQ")
+
+        results = await asyncio.gather(
+            *[flight.do("k", failing_llm) for _ in range(3)],
+            return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(run())
+
+def test_shared_call_ignores_first_callers_deadline():
+    """Prueba que la llamada compartida no herede el presupuesto de quien la inició"""
+    async def run():
+        flight = SingleFlight()
+        seen = []
+
+        async def fake_llm():
+            # Igual que ask_llama: la llamada compartida corre sin presupuesto propio
+            use_deadline(None)
+            seen.append(current_deadline())
+            await asyncio.sleep(0.05)
+            return "Encontré 3 sillas"
+
+        async def caller(budget):
+            deadline = start_deadline(budget)
+            return await asyncio.wait_for(flight.do("k", fake_llm), timeout=deadline.remaining())
+
+        hurried = asyncio.create_task(caller(0.01))
+        await asyncio.sleep(0)
+        patient = asyncio.create_task(caller(1.0))
+        try:
+            await hurried
+            raise AssertionError("Se esperaba que se agotara el presupuesto corto")
+        except asyncio.TimeoutError:
+            pass
+        assert await patient == "Encontré 3 sillas"
+        assert seen == [None]
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_result()
+    test_cancelled_waiter_does_not_cancel_others()
+    test_all_waiters_cancelled_cancels_call()
+    test_errors_propagate_to_all_waiters()
+    test_shared_call_ignores_first_callers_deadline()
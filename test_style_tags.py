@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar el etiquetado de ambientes y estilos
+y las consultas por índice
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+from enrichment_store import EnrichmentStore
+from style_tags import LocalTagger, StyleIndex, local_tags, tag_catalog
+
+CATALOG = [
+    {"id": 1, "product_name": "Silla Ergonómica Ejecutiva", "description": "Ideal para la oficina", "sales_count": 5},
+    {"id": 3, "product_name": "Escritorio Moderno", "description": "Escritorio minimalista de trabajo", "sales_count": 9},
+    {"id": 7, "product_name": "Cama Matrimonial", "description": "Para tu dormitorio", "sales_count": 2},
+    {"id": 14, "product_name": "Velador Nórdico", "description": "Mesita de noche", "sales_count": 4},
+    {"id": 4, "product_name": "Sofá de 3 Plazas", "description": "Perfecto para la sala", "sales_count": 8},
+]
+
+def make_store():
+    return EnrichmentStore(os.path.join(tempfile.mkdtemp(), "enrichments.db"))
+
+def test_local_tags():
+    """Prueba el etiquetador local por palabras clave"""
+    assert local_tags(CATALOG[1]) == {"ambientes": ["oficina"], "estilos": ["moderno"]}
+    assert "dormitorio" in local_tags(CATALOG[3])["ambientes"]
+    assert "escandinavo" in local_tags(CATALOG[3])["estilos"]
+    # Los productos no relevantes de un ambiente no se etiquetan con él
+    assert "oficina" not in local_tags(CATALOG[4])["ambientes"]
+
+def test_style_queries_are_index_lookups():
+    """Prueba que las consultas por ambiente lean el índice, más vendidos primero"""
+    store = make_store()
+    summary = asyncio.run(tag_catalog(CATALOG, store=store, tagger=LocalTagger()))
+    assert summary["generated"] == len(CATALOG)
+    index = StyleIndex(store=store)
+    assert index.available
+    assert [p["id"] for p in index.lookup(CATALOG, ambiente="dormitorio")] == [14, 7]
+    assert [p["id"] for p in index.lookup(CATALOG, ambiente="oficina", estilo="moderno")] == [3]
+
+def test_stored_tags_win_and_stale_tags_fall_back():
+    """Prueba que las etiquetas guardadas se usen solo mientras el producto no cambie"""
+    store = make_store()
+
+    async def tagger(product):
+        return json.dumps({"ambientes": ["sala"], "estilos": []})
+
+    asyncio.run(tag_catalog(CATALOG, store=store, tagger=tagger))
+    index = StyleIndex(store=store)
+    assert index.tags_for(CATALOG[2])["ambientes"] == ["sala"]
+    changed = dict(CATALOG[2], description="Cama para tu dormitorio")
+    assert index.tags_for(changed)["ambientes"] == ["dormitorio"]
+    assert index.stats()["local_tags"] == 1
+
+def test_incremental_retagging():
+    """Prueba que solo se reetiqueten los productos modificados"""
+    store = make_store()
+    asyncio.run(tag_catalog(CATALOG, store=store, tagger=LocalTagger()))
+    calls = []
+
+    async def tagger(product):
+        calls.append(product["id"])
+        return json.dumps(local_tags(product))
+
+    index = StyleIndex(store=store)
+    changed = CATALOG[:4] + [dict(CATALOG[4], description="Sofá para el living")]
+    assert index.tags_for(changed[4]) == local_tags(changed[4])
+    asyncio.run(tag_catalog(changed, store=store, tagger=tagger))
+    assert calls == [4]
+    # El job invalidó el índice de su almacén: las nuevas etiquetas se leen ya guardadas
+    stored = index.stats()["stored_tags"]
+    index.tags_for(changed[4])
+    assert index.stats()["stored_tags"] == stored + 1
+
+if __name__ == "__main__":
+    test_local_tags()
+    test_style_queries_are_index_lookups()
+    test_stored_tags_win_and_stale_tags_fall_back()
+    test_incremental_retagging()
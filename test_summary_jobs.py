@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para verificar los resúmenes generados en segundo plano
+"""
+
+import asyncio
+
+from summary_jobs import SummaryJobs
+
+def test_summary_is_pending_then_ready():
+    """Prueba que el resumen se pueda consultar antes y después de generarse"""
+    async def run():
+        jobs = SummaryJobs(ttl=60)
+
+        async def slow_summary():
+            await asyncio.sleep(0.05)
+            return "Encontré 4 sillas para tu comedor."
+
+        jobs.submit("abc", slow_summary)
+        pending = await jobs.get("abc")
+        assert pending["status"] == "pending"
+        assert pending["response"] is None
+
+        ready = await jobs.get("abc", wait=1)
+        assert ready["status"] == "ready"
+        assert ready["response"] == "Encontré 4 sillas para tu comedor."
+        assert await jobs.get("no-existe") is None
+        print(f"✅ Resumen diferido: {jobs.stats()}")
+
+    asyncio.run(run())
+
+def test_failed_summary_reports_error():
+    """Prueba que un fallo quede registrado como error"""
+    async def run():
+        jobs = SummaryJobs(ttl=60)
+
+        async def failing_summary():
+            raise RuntimeError("GROQ caído")
+
+        jobs.submit("x", failing_summary)
+        result = await jobs.get("x", wait=1)
+        assert result["status"] == "error"
+        assert jobs.stats()["failed"] == 1
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_summary_is_pending_then_ready()
+    test_failed_summary_reports_error()